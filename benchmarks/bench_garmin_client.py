@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+"""
+Throughput benchmarks of the Garmin Connect clients against a local
+`FakeGarminServer`. Downloads the same activities sequentially, with the
+threaded `ClientGarmin.download_activities` and with `AsyncClientGarmin`,
+and reports activities per second for each mode.
+
+Examples:
+
+    python benchmarks/bench_garmin_client.py --activities 500 --latency 0.05 --workers 16
+    python benchmarks/bench_garmin_client.py --error-rate 0.02 --max-rate 100 --formats summary gpx
+"""
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from pyhealth.Garmin import ClientGarmin, AsyncClientGarmin
+from fake_server_garmin import FakeGarminServer
+
+CREDENTIALS = ('benchmark', 'benchmark', 'benchmark')
+
+getters = {'summary': 'get_activity_summary',
+           'details': 'get_activity_details',
+           'gpx': 'get_activity_gpx',
+           'tcx': 'get_activity_tcx'}
+
+
+def _client(server):
+    # the default scheduler doesn't throttle, so this measures the transport,
+    # the server injects the throttling and failures
+    client = server.configure_client(ClientGarmin(credentials=CREDENTIALS))
+    client.connect()
+    return client
+
+
+def bench_sequential(server, activity_ids, formats, workers):
+    client = _client(server)
+    errors = 0
+    start = time.perf_counter()
+    for activity_id in activity_ids:
+        for act_type in formats:
+            try:
+                getattr(client, getters[act_type])(activity_id)
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+    return elapsed, errors
+
+
+def bench_threaded(server, activity_ids, formats, workers):
+    client = _client(server)
+    with tempfile.TemporaryDirectory() as dest:
+        start = time.perf_counter()
+        report = client.download_activities(activity_ids, formats=formats, workers=workers, dest=dest)
+        elapsed = time.perf_counter() - start
+    client.disconnect()
+    return elapsed, len(report.errors) + len(report.missing)
+
+
+def bench_async(server, activity_ids, formats, workers):
+    async def download():
+        client = server.configure_client(AsyncClientGarmin(max_connections=workers, credentials=CREDENTIALS))
+        async with client:
+            start = time.perf_counter()
+            results = await asyncio.gather(*[getattr(client, getters[act_type])(activity_id)
+                                             for activity_id in activity_ids for act_type in formats],
+                                           return_exceptions=True)
+            elapsed = time.perf_counter() - start
+        return elapsed, sum(isinstance(result, Exception) for result in results)
+    return asyncio.run(download())
+
+
+modes = {'sequential': bench_sequential,
+         'threaded': bench_threaded,
+         'async': bench_async}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--activities', type=int, default=200, help='number of activities downloaded')
+    parser.add_argument('--formats', nargs='+', default=['summary'], choices=sorted(getters),
+                        help='activity formats downloaded per activity')
+    parser.add_argument('--workers', type=int, default=8, help='threads / connections of the concurrent modes')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds the server adds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests failing with a 503')
+    parser.add_argument('--max-rate', type=float, default=None, help='requests/s above which the server throttles')
+    parser.add_argument('--modes', nargs='+', default=list(modes), choices=list(modes))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    with FakeGarminServer(n_activities=args.activities, latency=args.latency, error_rate=args.error_rate,
+                          max_rate=args.max_rate, seed=args.seed) as server:
+        activity_ids = server.activity_ids()
+        n_requests = len(activity_ids) * len(args.formats)
+        print(f"{len(activity_ids)} activities x {len(args.formats)} formats, {args.latency * 1000:.0f} ms "
+              f"latency, {args.error_rate:.1%} errors, {args.workers} workers")
+        print(f"{'mode':<12}{'seconds':>10}{'activities/s':>15}{'requests/s':>13}{'failed':>9}")
+        for mode in args.modes:
+            elapsed, failed = modes[mode](server, activity_ids, args.formats, args.workers)
+            print(f"{mode:<12}{elapsed:>10.2f}{len(activity_ids) / elapsed:>15.1f}"
+                  f"{n_requests / elapsed:>13.1f}{failed:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+"""
+A local stand-in for the parts of Garmin Connect that :class:`ClientGarmin`
+talks to: the SSO login, the activity list, the activity summary / details /
+gpx / tcx / original file exports, the wellness summary and the upload
+service. Activities are synthetic and their files come from the repository's
+`sample_data/`. The server can add latency, fail a fraction of the requests
+and throttle above a request rate, so the client can be benchmarked and
+checked against flaky conditions without touching the real service.
+
+It's a benchmark fixture and isn't part of the installed package, scripts
+next to it import it with `from fake_server_garmin import FakeGarminServer`.
+"""
+import datetime
+import email.parser
+import email.policy
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+LOG = logging.getLogger(__name__)
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sample_data')
+
+FIRST_ACTIVITY_ID = 2000000000
+SPORTS = ('running', 'cycling', 'walking', 'lap_swimming')
+
+
+class FakeGarminServer():
+    """Threaded HTTP server answering the Garmin Connect endpoints used by
+    the clients, on localhost. Point a client at it with
+    `configure_client`, any credentials log in.
+
+    Parameters:
+        n_activities (int): number of activities in the account
+        sample_dir (str or path): directory with the `.gpx`, `.tcx` and
+            `.fit` sample files served as activity exports
+        latency (float or tuple): seconds added to every response, or a
+            (min, max) range to draw it from
+        error_rate (float): fraction of the requests answered with a 503,
+            the login round trips aside
+        max_rate (float): requests per second above which requests are
+            answered with a 429 (the login round trips aside), None for no
+            throttling
+        seed (int): seed of the latency / error draws
+        host (str): interface to listen on
+        port (int): port to listen on, 0 picks a free one
+
+    Examples:
+
+    >>> with FakeGarminServer(n_activities=500, latency=0.05, error_rate=0.01) as server:
+    >>>     client = ClientGarmin(credentials=('login', 'password', 'user'))
+    >>>     server.configure_client(client)
+    >>>     client.connect()
+    >>>     activities = client.list_activities()
+    >>>     server.stats
+    """
+
+    def __init__(self, n_activities=100, sample_dir=SAMPLE_DATA_DIR, latency=0.0, error_rate=0.0,
+                 max_rate=None, seed=None, host='127.0.0.1', port=0):
+        """Initialize FakeGarminServer class"""
+
+        self.n_activities = n_activities
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.host = host
+        self.port = port
+        self.stats = Counter()
+        self.uploads = {}
+        self.metadata = {}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = deque()
+        self._sessions = set()
+        self._upload_digests = {}
+        self._archives = {}
+        self._server = None
+        self._thread = None
+
+        samples = {}
+        for file_name in sorted(os.listdir(sample_dir)):
+            ext = os.path.splitext(file_name)[1].lower()[1:]
+            if ext in ('gpx', 'tcx', 'fit'):
+                with open(os.path.join(sample_dir, file_name), 'rb') as file:
+                    samples.setdefault(ext, []).append(file.read())
+        if not samples.get('gpx') or not samples.get('tcx'):
+            raise ValueError(f"{sample_dir} needs .gpx and .tcx sample files")
+        self._samples = samples
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def start(self):
+        """
+        start serving in a background thread
+        """
+        self._server = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        LOG.info(f'fake Garmin Connect serving on {self.url}')
+
+    def stop(self):
+        """
+        stop the server
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def configure_client(self, client):
+        """
+        point a client (`ClientGarmin` or `AsyncClientGarmin`) at this server
+        by overriding its URL attributes on the instance
+        """
+        def local(url):
+            return url.replace('https://connect.garmin.com', self.url).replace('https://sso.garmin.com', self.url)
+
+        for name in dir(type(client)):
+            if name.startswith('URL_'):
+                setattr(client, name, local(getattr(type(client), name)))
+        client.activity_urls = {act_type: local(url) for act_type, url in type(client).activity_urls.items()}
+        return client
+
+    def activity_ids(self):
+        """
+        the activity ids of the account, newest first
+        """
+        return [FIRST_ACTIVITY_ID + index for index in range(self.n_activities - 1, -1, -1)]
+
+    def _start_time(self, activity_id):
+        index = activity_id - FIRST_ACTIVITY_ID
+        return datetime.datetime(2018, 1, 1, 7) + datetime.timedelta(hours=19 * index)
+
+    def _sport(self, activity_id):
+        return SPORTS[activity_id % len(SPORTS)]
+
+    def _sample(self, ext, activity_id):
+        samples = self._samples[ext]
+        return samples[activity_id % len(samples)]
+
+    def _has_activity(self, activity_id):
+        return 0 <= activity_id - FIRST_ACTIVITY_ID < self.n_activities or activity_id in self.uploads
+
+    def _original_archive(self, activity_id):
+        # every third activity was uploaded as a gpx, the others as a fit.
+        # The last 256 archives are cached, oldest first out
+        with self._lock:
+            archive = self._archives.get(activity_id)
+        if archive is not None:
+            return archive
+        ext = 'fit' if self._samples.get('fit') and activity_id % 3 else 'gpx'
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr(f'{activity_id}.{ext}', self._sample(ext, activity_id))
+        archive = buffer.getvalue()
+        with self._lock:
+            self._archives[activity_id] = archive
+            if len(self._archives) > 256:
+                del self._archives[next(iter(self._archives))]
+        return archive
+
+    def _inject(self, failures=True):
+        """
+        decide the fate of a request: returns (status, headers) of an
+        injected failure or None, after sleeping the added latency. With
+        `failures` False only the latency is added
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._recent.append(now)
+            while self._recent[0] < now - 1:
+                self._recent.popleft()
+            throttled = self.max_rate is not None and len(self._recent) > self.max_rate
+            failed = self._random.random() < self.error_rate
+            latency = self._random.uniform(*self.latency) if isinstance(self.latency, tuple) else self.latency
+        if latency:
+            time.sleep(latency)
+        if throttled and failures:
+            return 429, {'Retry-After': '1'}
+        if failed and failures:
+            return 503, {}
+        return None
+
+    def handle(self, method, path, query, headers, body):
+        """
+        answer one request, returns (status, headers, body bytes)
+        """
+        # the client doesn't retry the login post, failures are injected
+        # into the API requests only
+        injected = self._inject(failures=path not in ('/sso/login', '/modern', '/legacy/session'))
+        if injected is not None:
+            self._count('injected_' + str(injected[0]))
+            return injected[0], injected[1], b''
+
+        if method == 'POST' and path == '/sso/login':
+            self._count('login')
+            ticket = 'ST-' + uuid.uuid4().hex
+            page = f'<script>var response_url = "{self.url}/modern?ticket={ticket}";</script>'
+            return 200, {'Content-Type': 'text/html'}, page.encode('utf-8')
+        if method == 'GET' and path == '/modern' and 'ticket' in query:
+            self._count('ticket')
+            session_id = uuid.uuid4().hex
+            with self._lock:
+                self._sessions.add(session_id)
+            return 200, {'Set-Cookie': f'SESSIONID={session_id}; Path=/'}, b'<html></html>'
+        if method == 'GET' and path == '/legacy/session':
+            self._count('legacy_session')
+            return 200, {}, b''
+
+        cookies = dict(re.findall(r'(\w+)=([^;\s]+)', headers.get('Cookie', '')))
+        if cookies.get('SESSIONID') not in self._sessions:
+            self._count('unauthorized')
+            return 401, {}, b'not signed in'
+
+        for route_method, route, handler in self._routes():
+            match = re.fullmatch(route, path)
+            if match and route_method == method:
+                self._count(handler.__name__.lstrip('_'))
+                return handler(query, body, headers, *match.groups())
+        self._count('not_found')
+        return 404, {}, b''
+
+    def expire_sessions(self):
+        """
+        forget all the logged in sessions, the clients have to log in again
+        """
+        with self._lock:
+            self._sessions.clear()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _routes(self):
+        proxy = '/modern/proxy/'
+        return (('GET', proxy + r'activitylist-service/activities/search/activities', self._activity_list),
+                ('GET', proxy + r'activity-service/activity/(\d+)', self._summary),
+                ('GET', proxy + r'activity-service-1\.3/json/activityDetails/(\d+)', self._details),
+                ('GET', proxy + r'download-service/export/(gpx|tcx)/activity/(\d+)', self._export),
+                ('GET', proxy + r'download-service/files/activity/(\d+)', self._original),
+                ('GET', proxy + r'userstats-service/wellness/daily/([^/]+)', self._wellness),
+                ('POST', proxy + r'upload-service/upload/\.(gpx|tcx|fit)', self._upload),
+                ('PUT', r'/proxy/activity-service/activity/(\d+)', self._metadata))
+
+    def _activity_list(self, query, body, headers):
+        start = int(query.get('start', ['0'])[0])
+        limit = int(query.get('limit', ['20'])[0])
+        activities = [{'activityId': activity_id,
+                       'activityName': f'Activity {activity_id}',
+                       'activityType': {'typeKey': self._sport(activity_id)},
+                       'startTimeGMT': self._start_time(activity_id).strftime('%Y-%m-%d %H:%M:%S'),
+                       'distance': 1000.0 + activity_id % 20000,
+                       'duration': 600.0 + activity_id % 7200}
+                      for activity_id in self.activity_ids()[start:start + limit]]
+        return 200, {'Content-Type': 'application/json'}, json.dumps(activities).encode('utf-8')
+
+    def _summary(self, query, body, headers, activity_id):
+        activity_id = int(activity_id)
+        if not self._has_activity(activity_id):
+            return 404, {}, b''
+        summary = {'activityId': activity_id,
+                   'activityName': f'Activity {activity_id}',
+                   'activityTypeDTO': {'typeKey': self._sport(activity_id)},
+                   'summaryDTO': {'startTimeGMT': self._start_time(activity_id).isoformat(),
+                                  'distance': 1000.0 + activity_id % 20000,
+                                  'duration': 600.0 + activity_id % 7200,
+                                  'averageHR': 120 + activity_id % 40}}
+        return 200, {'Content-Type': 'application/json'}, json.dumps(summary).encode('utf-8')
+
+    def _details(self, query, body, headers, activity_id):
+        activity_id = int(activity_id)
+        if not self._has_activity(activity_id):
+            return 404, {}, b''
+        rng = random.Random(activity_id)
+        metrics = [{'metrics': [float(seconds), float(rng.randint(90, 180))]} for seconds in range(0, 3600, 5)]
+        details = {'activityId': activity_id,
+                   'measurementCount': 2,
+                   'metricsCount': len(metrics),
+                   'metricDescriptors': [{'metricsIndex': 0, 'key': 'sumDuration'},
+                                         {'metricsIndex': 1, 'key': 'directHeartRate'}],
+                   'activityDetailMetrics': metrics}
+        return 200, {'Content-Type': 'application/json'}, json.dumps(details).encode('utf-8')
+
+    def _export(self, query, body, headers, ext, activity_id):
+        activity_id = int(activity_id)
+        if not self._has_activity(activity_id):
+            return 404, {}, b''
+        return 200, {'Content-Type': 'application/xml'}, self._sample(ext, activity_id)
+
+    def _original(self, query, body, headers, activity_id):
+        activity_id = int(activity_id)
+        if not self._has_activity(activity_id):
+            return 404, {}, b''
+        return 200, {'Content-Type': 'application/x-zip-compressed'}, self._original_archive(activity_id)
+
+    def _wellness(self, query, body, headers, username):
+        day = datetime.date.fromisoformat(query['fromDate'][0])
+        until = datetime.date.fromisoformat(query['untilDate'][0])
+        resting_hr = []
+        steps = []
+        while day <= until:
+            rng = random.Random(day.toordinal())
+            resting_hr.append({'calendarDate': day.isoformat(), 'value': float(rng.randint(45, 60))})
+            steps.append({'calendarDate': day.isoformat(), 'value': float(rng.randint(2000, 20000))})
+            day += datetime.timedelta(days=1)
+        wellness = {'allMetrics': {'metricsMap': {'WELLNESS_RESTING_HEART_RATE': resting_hr,
+                                                  'WELLNESS_TOTAL_STEPS': steps}},
+                    'groupedMetrics': None}
+        return 200, {'Content-Type': 'application/json'}, json.dumps(wellness).encode('utf-8')
+
+    def _upload(self, query, body, headers, ext):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b'Content-Type: ' + headers.get('Content-Type', '').encode('latin-1') + b'\r\n\r\n' + body)
+        content = None
+        for part in message.iter_parts():
+            if part.get_param('name', header='content-disposition') == 'data':
+                content = part.get_payload(decode=True)
+        if content is None:
+            return 400, {}, b'no data'
+
+        digest = hashlib.sha1(content).hexdigest()
+        with self._lock:
+            existing_id = self._upload_digests.get(digest)
+            if existing_id is None:
+                activity_id = FIRST_ACTIVITY_ID + self.n_activities + len(self.uploads)
+                self._upload_digests[digest] = activity_id
+                self.uploads[activity_id] = content
+        if existing_id is not None:
+            result = {'successes': [],
+                      'failures': [{'internalId': existing_id,
+                                    'messages': [{'code': 202, 'content': 'Duplicate Activity.'}]}]}
+            return 409, {'Content-Type': 'application/json'}, \
+                json.dumps({'detailedImportResult': result}).encode('utf-8')
+        result = {'successes': [{'internalId': activity_id}], 'failures': []}
+        return 201, {'Content-Type': 'application/json'}, json.dumps({'detailedImportResult': result}).encode('utf-8')
+
+    def _metadata(self, query, body, headers, activity_id):
+        activity_id = int(activity_id)
+        if not self._has_activity(activity_id):
+            return 404, {}, b''
+        with self._lock:
+            self.metadata.setdefault(activity_id, {}).update(json.loads(body))
+        return 204, {}, b''
+
+
+def _make_handler(fake_server):
+    """
+    request handler class bound to a `FakeGarminServer`
+    """
+
+    class _Handler(BaseHTTPRequestHandler):
+        # keep-alive connections, like the real service. Buffer the headers
+        # and body into one write so responses don't wait on delayed acks
+        protocol_version = 'HTTP/1.1'
+        wbufsize = 2**16
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            LOG.debug(format % args)
+
+        def _respond(self):
+            url = urlsplit(self.path)
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+            status, headers, content = fake_server.handle(self.command, url.path, parse_qs(url.query),
+                                                          self.headers, body)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        do_GET = do_POST = do_PUT = _respond
+
+    return _Handler
@@ -4,3 +4,9 @@ and pulling to GarminConnect
 """
 
 from .client_garmin import ClientGarmin
+from .async_client_garmin import AsyncClientGarmin
+from .cache_garmin import ActivityCache
+from .ledger_garmin import UploadLedger
+from .scheduler_garmin import RequestScheduler
+from .metrics_garmin import ClientMetrics, RequestRecord
+from .index_garmin import ActivityIndex
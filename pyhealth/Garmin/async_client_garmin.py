@@ -0,0 +1,371 @@
+#! /usr/bin/env python
+"""An asyncio version of :class:`ClientGarmin` built on aiohttp. It uses the
+same URL templates and response handling as the blocking client, but many
+requests can be in flight at once on a single event loop, sharing one pool of
+keep-alive connections.
+
+aiohttp is an optional dependency, it's only needed to use AsyncClientGarmin.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import sys
+from .client_garmin import ClientGarmin
+from .scheduler_garmin import retry_delay
+from ..gui_interfaces import get_login_credentials
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+LOG = logging.getLogger(__name__)
+
+
+def require_session(client_function):
+    """Decorator for the coroutines of the client, makes sure the session has
+    been opened before the coroutine runs. The wrapper is a coroutine
+    function too, so the check happens when it's awaited
+    """
+    @functools.wraps(client_function)
+    async def check_session(*args, **kwargs):
+        client_object = args[0]
+        if not client_object.session:
+            raise Exception("Attempting to use AsyncClientGarmin without being connected. "
+                            "Await self.connect() before first use.")
+        return await client_function(*args, **kwargs)
+    return check_session
+
+
+class _Response():
+    """The parts of an aiohttp response that are needed after the
+    connection is released, with the attribute names of a requests
+    response so the :class:`ClientGarmin` response handling can be reused.
+    """
+
+    def __init__(self, status_code, content, url, headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.headers = headers if headers is not None else {}
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+
+class AsyncClientGarmin():
+    """An asyncio client class used to authenticate with Garmin Connect and
+    extract data from the user account. The methods mirror
+    :class:`ClientGarmin` but are coroutines.
+
+    This object implements the async context manager protocol, so it can
+    be used with an `async with` statement to connect before the block and
+    disconnect after it.
+
+    Parameters:
+        max_connections (int): maximum number of simultaneous connections
+            (and in flight requests) to Garmin Connect
+        keepalive_timeout (float): seconds an idle connection is kept open
+        credentials (tuple of str): (loginname, password, username) to log
+            in with instead of asking for them in the login window
+        max_retries (int): retries of a throttled (429), failed (5xx) or
+            disconnected request, with the rules and full jitter backoff of
+            `RequestScheduler` (see `scheduler_garmin.retry_delay`):
+            non-idempotent requests (POST) are only retried after a 429 or a
+            failure to connect
+        backoff_base (float): seconds, the backoff before retry `n` is drawn
+            uniformly from [0, backoff_base * 2**n] and is at least the
+            server's Retry-After
+        backoff_max (float): seconds, cap of the backoff
+
+    Examples:
+
+    Fetching the summaries of all activities concurrently
+
+    >>> async with AsyncClientGarmin() as client:
+    >>>     activities = await client.list_activities()
+    >>>     summaries = await asyncio.gather(*[client.get_activity_summary(activity_id)
+    >>>                                        for activity_id, _ in activities])
+    """
+    URL_SSO_LOGIN = ClientGarmin.URL_SSO_LOGIN
+    URL_LEGACY_SESSION = ClientGarmin.URL_LEGACY_SESSION
+    URL_REDIRECT = ClientGarmin.URL_REDIRECT
+    URL_ACTIVITY_LIST = ClientGarmin.URL_ACTIVITY_LIST
+    URL_WELLNESS = ClientGarmin.URL_WELLNESS
+    URL_UPLOAD = ClientGarmin.URL_UPLOAD
+    URL_ACTVITY_PUT = ClientGarmin.URL_ACTVITY_PUT
+
+    activity_urls = ClientGarmin.activity_urls
+
+    # response handling shared with the blocking client
+    _check_response_code = ClientGarmin._check_response_code
+    _extract_auth_ticket_url = ClientGarmin._extract_auth_ticket_url
+    _parse_activity_entries = staticmethod(ClientGarmin._parse_activity_entries)
+    _parse_upload_response = staticmethod(ClientGarmin._parse_upload_response)
+    _activity_metadata = staticmethod(ClientGarmin._activity_metadata)
+
+    def __init__(self, max_connections=100, keepalive_timeout=30, credentials=None,
+                 max_retries=5, backoff_base=0.5, backoff_max=60.0):
+        """Initialize AsyncClientGarmin class"""
+
+        if aiohttp is None:
+            raise ImportError("AsyncClientGarmin requires the aiohttp package")
+        if credentials is not None:
+            self.loginname, self.password, self.username = credentials
+        else:
+            self.loginname, self.password, self.username = get_login_credentials(site='GarminConnect',
+                                                                                 extended_info=True)
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = None
+        self.activity_list = None
+        self.wellness_summary_from = None
+        self.wellness_summary_until = None
+        self.wellness_summary = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.disconnect()
+
+    async def connect(self):
+        """
+        open the aiohttp session and authenticate it
+        """
+
+        connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                         keepalive_timeout=self.keepalive_timeout)
+        # unsafe: also keep cookies of IP address hosts (e.g. a local FakeGarminServer)
+        self.session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.CookieJar(unsafe=True))
+        try:
+            await self._authenticate()
+        except BaseException:
+            await self.disconnect()
+            raise
+
+    async def disconnect(self):
+        """
+        close the session and its connections
+        """
+
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def _request(self, method, url, files=None, **kwargs):
+        """
+        make a request and read the whole body before the connection is
+        released back to the pool, retrying it while it's throttled or fails
+        with a 5xx / connection error. `files` maps form field names to
+        (filename, content) tuples, sent as a multipart form rebuilt for
+        every attempt
+        """
+
+        for attempt in range(self.max_retries + 1):
+            if files is not None:
+                kwargs['data'] = aiohttp.FormData()
+                for field, (filename, content) in files.items():
+                    kwargs['data'].add_field(field, content, filename=filename)
+            try:
+                async with self.session.request(method, url, **kwargs) as response:
+                    content = await response.read()
+                    result = _Response(response.status, content, str(response.url), response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                delay = retry_delay(attempt, method, error=error, max_retries=self.max_retries,
+                                    backoff_base=self.backoff_base, backoff_max=self.backoff_max)
+                if delay is None:
+                    raise
+                LOG.warning(f"request failed ({error!r}), retry {attempt + 1} of {self.max_retries}")
+                await asyncio.sleep(delay)
+                continue
+            delay = retry_delay(attempt, method, response=result, max_retries=self.max_retries,
+                                backoff_base=self.backoff_base, backoff_max=self.backoff_max)
+            if delay is None:
+                result.retries = attempt
+                return result
+            LOG.warning(f"{result.status_code} response for {result.url}, "
+                        f"retry {attempt + 1} of {self.max_retries}")
+            await asyncio.sleep(delay)
+
+    async def _authenticate(self):
+        """
+        authenticate the session with the SSO login, claim the auth ticket
+        and touch the legacy session (see `ClientGarmin._authenticate`)
+        """
+
+        LOG.info(f'authentication user: {self.username}')
+        data = {'username': self.loginname,
+                'password': self.password,
+                'embed': 'false'}
+        request_params = {'service': self.URL_REDIRECT}
+        auth_response = await self._request('POST', self.URL_SSO_LOGIN, params=request_params, data=data)
+        if auth_response.status_code != 200:
+            raise ValueError('authentication failed. Check for valid credentials')
+        auth_ticket_url = self._extract_auth_ticket_url(auth_response.text)
+        LOG.debug("authorization ticket url: {0}".format(auth_ticket_url))
+
+        LOG.info('Claiming authorization ticket')
+        response = await self._request('GET', auth_ticket_url)
+        if response.status_code != 200:
+            raise RuntimeError("authorization failed to claim auth ticket:"
+                               " {url} \n {code} \n {text}".format(url=auth_ticket_url,
+                                                                   code=response.status_code,
+                                                                   text=response.text))
+        await self._request('GET', self.URL_LEGACY_SESSION)
+
+    @require_session
+    async def _fetch_activity_ids_and_ts(self, start_index=0, max_limit=100):
+        """Return a list of (activity id, start timestamp) tuples starting at
+        a given index, see `ClientGarmin._fetch_activity_ids_and_ts`
+        """
+
+        end_index = start_index + max_limit - 1
+        LOG.debug(f"fetching activities {start_index} through {end_index} ...")
+        response = await self._request('GET', self.URL_ACTIVITY_LIST,
+                                       params={"start": start_index, "limit": max_limit})
+        if response.status_code != 200:
+            raise Exception(f"failed to fetch activities {start_index} to" +
+                            f" {end_index} types: {response.status_code}\n{response.text}")
+        return self._parse_activity_entries(json.loads(response.text))
+
+    @require_session
+    async def _get_activity(self, activity_id, act_type='summary'):
+        """
+        given an activity id, return the file type (see `ClientGarmin._get_activity`)
+        """
+
+        session_url = self.activity_urls[act_type]
+        response = await self._request('GET', session_url.format(activity_id=activity_id))
+        if self._check_response_code(response, act_type=act_type, activity_id=activity_id):
+            if act_type.lower() in ('summary', 'details'):
+                return json.loads(response.text)
+            if act_type.lower() in ('original_file', 'fit'):
+                return response.content
+            return response.text
+        return []
+
+    @require_session
+    async def list_activities(self, batch_size=100, force_reload=False):
+        """Return all activity ids stored by the logged in user, along
+        with their starting timestamps.
+
+        Returns:
+        ids (tuple of (int, datetime)): The full list of activity identifiers
+            (along with their starting timestamps).
+        """
+
+        if not self.activity_list or force_reload:
+            ids = []
+            for start_index in range(0, sys.maxsize, batch_size):
+                next_batch = await self._fetch_activity_ids_and_ts(start_index, batch_size)
+                if not next_batch:
+                    break
+                ids.extend(next_batch)
+            self.activity_list = ids
+
+        return self.activity_list
+
+    @require_session
+    async def get_wellness_summary_datespan(self, from_date='2018-07-01', until_date='2018-09-01',
+                                            force_reload=False):
+        """Return summary of wellness data stored by the logged in user
+
+        Parameters:
+            from_date (str): yyyy-mm-dd
+            until_date (str): yyyy-mm-dd
+
+        Returns:
+        json dictionary load of response
+        """
+
+        if force_reload or from_date != self.wellness_summary_from or \
+                until_date != self.wellness_summary_until:
+            response = await self._request('GET', self.URL_WELLNESS.format(username=self.username),
+                                           params={"fromDate": from_date, "untilDate": until_date})
+            if self._check_response_code(response, act_type="wellness summary",
+                                         activity_id=f"{from_date} to {until_date}"):
+                self.wellness_summary_from = from_date
+                self.wellness_summary_until = until_date
+                self.wellness_summary = json.loads(response.text)['allMetrics']['metricsMap']
+        return self.wellness_summary
+
+    async def get_activity_summary(self, activity_id):
+        """Return a summary about a given activity as a JSON dict
+        (see `ClientGarmin.get_activity_summary`)
+        """
+        return await self._get_activity(activity_id, act_type='summary')
+
+    async def get_activity_details(self, activity_id):
+        """Return the activity details as a JSON dict
+        (see `ClientGarmin.get_activity_details`)
+        """
+        return await self._get_activity(activity_id, act_type='details')
+
+    async def get_activity_gpx(self, activity_id):
+        """Return the GPX representation of the activity as an XML string
+        (see `ClientGarmin.get_activity_gpx`)
+        """
+        return await self._get_activity(activity_id, act_type='gpx')
+
+    async def get_activity_tcx(self, activity_id):
+        """Return the TCX representation of the activity as an XML string
+        (see `ClientGarmin.get_activity_tcx`)
+        """
+        return await self._get_activity(activity_id, act_type='tcx')
+
+    @require_session
+    async def upload_activity(self, file, format=None, name=None, description=None,
+                              activity_type=None, private=None):
+        """Upload a GPX, TCX, or FIT file for an activity.
+
+        Parameters:
+            file (str, path, or open file): Path or open file for activity to upload
+            format (str): file format uploading ('gpx', 'tcx', 'fit'). Will attempt to guess
+                if None is provided
+            name (str): Optional name for the activity
+            description (str): Optional description of the activity
+            activity_type (str): Optional activity type ket (lowercase: e.g. running, cycling)
+            private (bool): if True, then activity will be set as private
+
+        Returns:
+            (int): activity_id of the newly-uploaded activity
+        """
+
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as open_file:
+                content = open_file.read()
+            filename = os.path.basename(file)
+        else:
+            content = file.read()
+            filename = os.path.basename(file.name)
+
+        _, ext = os.path.splitext(filename)
+        if format is None:
+            if ext.lower() in ('.gpx', '.tcx', '.fit'):
+                format = ext.lower()[1:]
+            else:
+                raise Exception(u"could not guess file type for {}".format(filename))
+
+        response = await self._request('POST', self.URL_UPLOAD.format(flformat=format),
+                                       files={'data': (filename, content)}, headers={"nk": "NT"})
+        activity_id = self._parse_upload_response(response.status_code, response.text, format)
+
+        data = self._activity_metadata(name, description, activity_type, private)
+        if data:
+            data['activityId'] = activity_id
+            encoding_headers = {"Content-Type": "application/json; charset=UTF-8"}
+            response = await self._request('PUT', self.URL_ACTVITY_PUT.format(activity_id=activity_id),
+                                           data=json.dumps(data), headers=encoding_headers)
+            if response.status_code != 204:
+                raise Exception(u"failed to set metadata for activity {}: {}\n{}".format(
+                    activity_id, response.status_code, response.text))
+
+        return activity_id
@@ -0,0 +1,139 @@
+"""
+On disk cache for Garmin Connect activity payloads. Exports of a recorded
+activity (details, gpx, tcx, original file) don't change, so once downloaded
+they're served from disk. Every payload is stored zlib compressed in its own
+file and the least recently used files are evicted once the cache grows past
+its size cap.
+"""
+import os
+import tempfile
+import threading
+import zlib
+
+CACHE_SUFFIX = '.zz'
+
+
+class ActivityCache():
+    """A size bounded, least recently used, on disk cache of the raw bytes
+    of activity payloads keyed by (activity_id, act_type). The file
+    modification time records the last access, so the cache can be shared
+    between runs (and clients) without an index file.
+
+    Parameters:
+        cache_dir (str or path): directory to store the cache in
+        max_bytes (int): size cap of the (compressed) cache, the least
+            recently used payloads are evicted once it's exceeded
+        compression_level (int): zlib compression level, 0 - 9
+
+    Examples:
+
+    >>> cache = ActivityCache('~/.cache/pyhealth/garmin')
+    >>> content = cache.get(2854251456, 'gpx')
+    >>> if content is None:
+    >>>     content = download(2854251456)
+    >>>     cache.put(2854251456, 'gpx', content)
+    """
+
+    def __init__(self, cache_dir, max_bytes=2**30, compression_level=6):
+        """Initialize ActivityCache class"""
+
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self._nbytes = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(*key))
+
+    def get(self, activity_id, act_type):
+        """
+        return the cached payload or None if it isn't cached
+
+        Parameters:
+            activity_id (int): garmin activity id
+            act_type (str): `details`, `original_file`, `tcx`, `gpx`, ...
+
+        Returns:
+            content (bytes): the payload as downloaded, or None
+        """
+        path = self._path(activity_id, act_type)
+        try:
+            with open(path, 'rb') as file:
+                compressed = file.read()
+            # mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return zlib.decompress(compressed)
+
+    def put(self, activity_id, act_type, content):
+        """
+        store a payload and evict the least recently used payloads if the
+        cache grew past `max_bytes`
+
+        Parameters:
+            activity_id (int): garmin activity id
+            act_type (str): `details`, `original_file`, `tcx`, `gpx`, ...
+            content (bytes): the payload as downloaded
+        """
+        path = self._path(activity_id, act_type)
+        compressed = zlib.compress(content, self.compression_level)
+        # renamed into place once complete, an interrupted put leaves at most
+        # a `.tmp-` file that `get` never reads
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(compressed)
+            with self._lock:
+                replaced = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                self._nbytes = self._size() if self._nbytes is None else \
+                    self._nbytes + len(compressed) - replaced
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self._nbytes > self.max_bytes:
+            self._evict(keep=path)
+
+    def clear(self):
+        """
+        remove all the payloads from the cache
+        """
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(CACHE_SUFFIX):
+                    os.remove(entry.path)
+            self._nbytes = 0
+
+    def _path(self, activity_id, act_type):
+        return os.path.join(self.cache_dir, f'{activity_id}_{act_type}{CACHE_SUFFIX}')
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(CACHE_SUFFIX)]
+
+    def _size(self):
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self, keep=None):
+        """
+        delete the least recently used payloads until the cache fits in
+        `max_bytes`, the payload `keep` is never evicted
+        """
+        with self._lock:
+            entries = [(entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                       for entry in self._entries()]
+            total = sum(nbytes for _, nbytes, _ in entries)
+            for _, nbytes, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= nbytes
+            self._nbytes = total
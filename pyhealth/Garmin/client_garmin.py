@@ -5,26 +5,41 @@ https://github.com/petergardfjall/garminexport
 https://github.com/cpfair/tapiriik/blob/master/tapiriik/services/GarminConnect/garminconnect.py
 https://github.com/magsol/garmin
 """
-from io import StringIO
+from io import BytesIO
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
-# from datetime import datetime
+import datetime
 import functools
+import itertools
 import re
 import sys
+import shutil
+import tempfile
 import os
 import json
 import logging
+import threading
+import time
 import zipfile
 import requests
 import dateutil
 import warnings
-from gui_interfaces import get_login_credentials
+from ..gui_interfaces import get_login_credentials
+from .cache_garmin import ActivityCache
+from ..utils_files import file_digest
+from .ledger_garmin import UploadLedger
+from .scheduler_garmin import RequestScheduler
+from .metrics_garmin import RequestRecord
 
 LOG = logging.getLogger(__name__)
 
 # reduce logging noise from requests library
 logging.getLogger("requests").setLevel(logging.ERROR)
 
+DownloadReport = namedtuple('DownloadReport', ['downloaded', 'missing', 'errors'])
+UploadReport = namedtuple('UploadReport', ['uploaded', 'skipped', 'errors'])
+
 
 def require_session(client_function):
     """Decorator that is used to make sure the session has been authenticated before
@@ -40,6 +55,154 @@ def require_session(client_function):
     return check_session
 
 
+def require_session_or_offline(client_function):
+    """Decorator for functions that can be served from the activity cache,
+    they need an authenticated session unless the client is offline.
+    """
+    @functools.wraps(client_function)
+    def check_session(*args, **kwargs):
+        client_object = args[0]
+        if not client_object.session and not client_object.offline:
+            raise Exception("Attempting to use GarminClient without being connected. "
+                            "Call self.connect() before first use.")
+        return client_function(*args, **kwargs)
+    return check_session
+
+
+def _date_range(start, end, step_days):
+    """
+    dates from `start` through `end` every `step_days` days
+    """
+    step = datetime.timedelta(days=step_days)
+    while start <= end:
+        yield start
+        start += step
+
+
+def _merge_intervals(intervals):
+    """
+    merge overlapping and adjacent (start, end) date ranges, returns them
+    sorted by start date
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + datetime.timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _missing_intervals(intervals, start, end):
+    """
+    the parts of the (start, end) date range that the sorted, merged
+    `intervals` don't cover
+    """
+    one_day = datetime.timedelta(days=1)
+    missing = []
+    for covered_start, covered_end in intervals:
+        if covered_end < start:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > start:
+            missing.append((start, covered_start - one_day))
+        start = covered_end + one_day
+    if start <= end:
+        missing.append((start, end))
+    return missing
+
+
+def _read_into_buffer(file, size, chunk_size=2**16):
+    """
+    read `size` bytes of a file into one preallocated buffer and return a
+    memoryview of it, without the intermediate copies of `file.read()`
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    position = 0
+    while position < size:
+        chunk = file.read(min(chunk_size, size - position))
+        if not chunk:
+            break
+        view[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    return view[:position]
+
+
+class _GarminSession(requests.Session):
+    """A requests session that sends every request through the client's
+    `RequestScheduler` (rate / concurrency limits and retries), and that
+    re-authenticates its client once and retries the request when Garmin
+    Connect answers with an authentication failure (e.g. a saved session
+    expired on the server side).
+    """
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.pool_maxsize = 0
+        self.size_connection_pool(10)
+
+    def size_connection_pool(self, maxsize):
+        """
+        let the session keep `maxsize` connections open per host. The pool
+        only grows: a bigger adapter is mounted (for both schemes, a local
+        FakeGarminServer is http) when `maxsize` is over the current size,
+        otherwise the adapter and its open connections are kept
+        """
+        if maxsize <= self.pool_maxsize:
+            return
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=maxsize)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.pool_maxsize = maxsize
+
+    def request(self, method, url, *args, **kwargs):
+        # seconds spent sending the request (summed over its retries), waiting
+        # for the scheduler and sleeping between retries
+        timings = {'latency': 0.0, 'queue_wait': 0.0, 'backoff': 0.0}
+        if self.client.metrics is None:
+            return self._scheduled_request(method, url, timings, *args, **kwargs)
+        response = None
+        error = None
+        try:
+            response = self._scheduled_request(method, url, timings, *args, **kwargs)
+            return response
+        except Exception as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            self.client._record_request(method, url, response, error, timings,
+                                        kwargs.get('stream', False))
+
+    def _scheduled_request(self, method, url, timings, *args, **kwargs):
+        def send():
+            start = time.monotonic()
+            try:
+                return super(_GarminSession, self).request(method, url, *args, **kwargs)
+            finally:
+                timings['latency'] += time.monotonic() - start
+
+        def rewind():
+            # uploaded files were read by the failed request
+            for value in (kwargs.get('files') or {}).values():
+                file = value[1] if isinstance(value, tuple) else value
+                if hasattr(file, 'seek'):
+                    file.seek(0)
+
+        generation = self.client._auth_generation
+        response = self.client.scheduler.run(send, rewind, timings, method)
+        authenticating = getattr(self.client._auth_local, 'authenticating', False)
+        if authenticating or not self.client._is_auth_failure(response):
+            return response
+        LOG.info(f"authentication failure for {url}, re-authenticating")
+        response.close()
+        self.client._reauthenticate(generation)
+        rewind()
+        return self.client.scheduler.run(send, rewind, timings, method)
+
+
 class ClientGarmin():
     """A client class used to authenticate with Garmin Connect and
     extract data from the user account.
@@ -53,6 +216,37 @@ class ClientGarmin():
     Parameters:
         username (str): username for your Garmin connect account
         password (str): password for your Garmin connect account
+        cache_dir (str or path): directory of an on disk cache for the
+            activity payloads that don't change once recorded (details, gpx,
+            tcx and the original file). They are downloaded once and then
+            served from the cache
+        max_cache_bytes (int): size cap of the activity cache, the least
+            recently used payloads are evicted once it's exceeded
+        offline (bool): serve the activities only from the cache, without
+            logging in or connecting. Uncached activities are treated like
+            missing ones
+        session_file (str or path): file the authenticated session (cookies)
+            is saved to, readable only by the user. While a saved session is
+            younger than `session_max_age` the client skips the login window
+            and `connect` reuses it instead of logging in again. If Garmin
+            Connect rejects it, the client logs in again (asking for the
+            credentials then, only on the main thread: a worker thread of
+            e.g. `download_activities` raises and the saved session is
+            dropped) and saves the new session. A session saved for another
+            loginname than the `credentials` is not reused
+        session_max_age (float): seconds a saved session is reused
+        scheduler (RequestScheduler): retries throttled (429) or failed
+            (5xx) requests with jittered backoff and can pace them with a
+            token bucket and an adaptive concurrency limit. If None, a
+            `RequestScheduler` without rate or concurrency limits is used,
+            the `workers` of each call set the requests in flight
+        credentials (tuple of str): (loginname, password, username) to log
+            in with instead of asking for them in the login window, e.g. for
+            scripts
+        metrics: hook receiving a `RequestRecord` (endpoint template, phase,
+            status, latency, queue wait, backoff, bytes, retries, cache hit /
+            miss) for every
+            request through its `record` method, e.g. a `ClientMetrics`
 
     Examples:
 
@@ -70,6 +264,17 @@ class ClientGarmin():
     your login name.  address should be:
     'https://connect.garmin.com/modern/proxy/userstats-service/wellness/daily/{username}'
 
+    Reprocessing an archive that was downloaded before, without connecting
+
+    >>> client = ClientGarmin(cache_dir='~/.cache/pyhealth/garmin', offline=True)
+    >>> gpx = client.get_activity_gpx(activity_id)
+
+    Reusing the login of an earlier run for a short batch job
+
+    >>> client = ClientGarmin(session_file='~/.pyhealth/garmin_session.json')
+    >>> with client.manage_connection():
+    >>>     activities = client.list_activities(sync='incremental', known=activities)
+
     """
     URL_SSO_LOGIN = "https://sso.garmin.com/sso/login"
     URL_AUTH = "https://connect.garmin.com/modern/auth/hostname"
@@ -95,16 +300,71 @@ class ClientGarmin():
                      'tcx': URL_ACTIVITY_TCX,
                      'gpx': URL_ACTIVITY_GPX}
 
-    def __init__(self):
+    # file extension used when saving each activity type to disk
+    activity_extensions = {'summary': 'json',
+                           'details': 'json',
+                           'original_file': 'zip',
+                           'fit': 'zip',
+                           'tcx': 'tcx',
+                           'gpx': 'gpx'}
+
+    # phase of each endpoint in the request metrics
+    endpoint_phases = {'URL_SSO_LOGIN': 'auth',
+                       'URL_AUTH': 'auth',
+                       'URL_LEGACY_SESSION': 'auth',
+                       'URL_REDIRECT': 'auth',
+                       'URL_ACTIVITY_LIST': 'listing',
+                       'URL_ACTIVITY': 'download',
+                       'URL_ACTIVITY_DETAILS': 'download',
+                       'URL_ACTIVITY_GPX': 'download',
+                       'URL_ACTIVITY_TCX': 'download',
+                       'URL_ACTIVITY_ORIG': 'download',
+                       'URL_WELLNESS': 'wellness',
+                       'URL_DAILYSUMMARY': 'wellness',
+                       'URL_UPLOAD': 'upload',
+                       'URL_ACTVITY_PUT': 'upload'}
+
+    # activity types that don't change once recorded and can be cached. The
+    # summary is left out as it changes when the activity is edited
+    cached_activity_types = ('details', 'original_file', 'fit', 'tcx', 'gpx')
+
+    def __init__(self, cache_dir=None, max_cache_bytes=2**30, offline=False,
+                 session_file=None, session_max_age=24 * 3600, scheduler=None, credentials=None,
+                 metrics=None):
         """Initialize GarminClient class"""
 
-        self.loginname, self.password, self.username = get_login_credentials(site='GarminConnect',
-                                                                             extended_info=True)
+        if offline and cache_dir is None:
+            raise ValueError("offline mode needs a `cache_dir` to serve the activities from")
+        self.session_file = os.path.expanduser(session_file) if session_file is not None else None
+        self.session_max_age = session_max_age
+        self.loginname = self.password = self.username = None
+        saved_session = self._load_session()
+        if credentials is not None:
+            self.loginname, self.password, self.username = credentials
+        elif saved_session is not None:
+            # the password is only asked for if the saved session is rejected
+            self.loginname = saved_session['loginname']
+            self.username = saved_session['username']
+        elif not offline:
+            self._ask_credentials()
+        self._auth_lock = threading.Lock()
+        self._auth_local = threading.local()
+        self._auth_generation = 0
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.metrics = metrics
+        self._metrics_local = threading.local()
+        self._endpoint_patterns = None
+        self.cache = ActivityCache(cache_dir, max_bytes=max_cache_bytes) if cache_dir is not None else None
+        self.offline = offline
         self.session = None
         self.activity_list = None
         self.wellness_summary_from = None
         self.wellness_summary_until = None
         self.wellness_summary = None
+        # per day wellness cache: metric -> {calendarDate: entry} and the
+        # sorted, merged (start, end) date ranges it covers
+        self._wellness_days = {}
+        self._wellness_intervals = []
 
     @contextmanager
     def manage_connection(self):
@@ -118,11 +378,20 @@ class ClientGarmin():
 
     def connect(self):
         """
-        connect using the requests.Session() authentication
+        connect using the requests.Session() authentication, or reuse the
+        saved session if there is a valid one in `session_file`
         """
 
-        self.session = requests.Session()
+        self.session = _GarminSession(self)
+        saved_session = self._load_session()
+        if saved_session is not None:
+            LOG.info(f'reusing saved session of user: {saved_session["username"]}')
+            for cookie in saved_session['cookies']:
+                self.session.cookies.set(**cookie)
+            return
+        self._ask_credentials()
         self._authenticate()
+        self._save_session()
 
     def disconnect(self):
         """
@@ -133,19 +402,32 @@ class ClientGarmin():
             self.session.close()
             self.session = None
 
-    def _authenticate(self):
+    def _authenticate(self, session=None):
         """
         try to authenticate the session using session.post()
         if response.status_code does not equal 200 through a
-        RuntimeError with the failed claim auth ticket
+        RuntimeError with the failed claim auth ticket. `session` is the
+        session logged in, the client's if None
         """
 
         LOG.info(f'authentication user: {self.username}')
+        self._auth_local.authenticating = True
+        try:
+            self._login(session if session is not None else self.session)
+        finally:
+            self._auth_local.authenticating = False
+
+    def _login(self, session):
+        """
+        the three round trips of a login: the SSO post, claiming the auth
+        ticket and touching the legacy session
+        """
+
         data = {'username': self.loginname,
                 'password': self.password,
                 'embed': 'false'}
         request_params = {'service': self.URL_REDIRECT}
-        auth_response = self.session.post(self.URL_SSO_LOGIN, params=request_params, data=data)
+        auth_response = session.post(self.URL_SSO_LOGIN, params=request_params, data=data)
         LOG.debug('authorization respones: {0}'.format(auth_response.text))
         if auth_response.status_code != 200:
             raise ValueError('authentication failed. Check for valid credentials')
@@ -153,7 +435,7 @@ class ClientGarmin():
         LOG.debug("authorization ticket url: {0}".format(auth_ticket_url))
 
         LOG.info('Claiming authorization ticket')
-        response = self.session.get(auth_ticket_url)
+        response = session.get(auth_ticket_url)
         if response.status_code != 200:
             raise RuntimeError("authorization failed to claim auth ticket:"
                                " {url} \n {code} \n {text}".format(url=auth_ticket_url,
@@ -162,7 +444,182 @@ class ClientGarmin():
 
         # appears like we need to touch base with the old API to initiate
         # some form of legacy session. otherwise certain downloads will fail.
-        self.session.get(self.URL_LEGACY_SESSION)
+        session.get(self.URL_LEGACY_SESSION)
+
+    def _ask_credentials(self):
+        """
+        open the login window unless the credentials were entered already
+        """
+
+        if self.password is None:
+            self.loginname, self.password, self.username = get_login_credentials(site='GarminConnect',
+                                                                                 extended_info=True)
+
+    def _reauthenticate(self, generation):
+        """
+        log in again after an authentication failure. `generation` is the
+        authentication the failed request was made with, when several
+        threads hit the failure only the first one logs in.
+
+        The login runs on its own cookie jar that then replaces the
+        session's, requests of other threads still in flight keep the jar
+        they were sent with. A client without its password (a saved session
+        was reused) only asks for it on the main thread, from a worker thread
+        the rejected saved session is dropped and an error is raised
+        """
+
+        with self._auth_lock:
+            if generation != self._auth_generation:
+                return
+            if self.password is None and threading.current_thread() is not threading.main_thread():
+                if self.session_file is not None and os.path.exists(self.session_file):
+                    os.remove(self.session_file)
+                raise RuntimeError("the Garmin Connect session expired and the client has no password "
+                                   "to log in again. Call connect() to log in, or pass `credentials`")
+            self._ask_credentials()
+            login_session = _GarminSession(self)
+            try:
+                self._authenticate(login_session)
+            finally:
+                login_session.close()
+            self.session.cookies = login_session.cookies
+            self._auth_generation += 1
+            self._save_session()
+
+    def _endpoint(self, url):
+        """
+        return the (URL template, phase) a request URL belongs to
+        """
+
+        if self._endpoint_patterns is None:
+            # built from the instance so overridden URLs (e.g. a local
+            # FakeGarminServer) are matched too
+            self._endpoint_patterns = []
+            for name, phase in self.endpoint_phases.items():
+                template = getattr(self, name)
+                # the escaped `{activity_id}` style fields match one path segment
+                pattern = re.sub(r'\\\{\w+\\\}', '[^/]+', re.escape(template))
+                self._endpoint_patterns.append((re.compile(pattern), template, phase))
+        base_url = url.split('?', 1)[0]
+        for pattern, template, phase in self._endpoint_patterns:
+            if pattern.fullmatch(base_url):
+                return template, phase
+        return base_url, 'other'
+
+    def _record_request(self, method, url, response, error, timings, stream):
+        """
+        report a request to the metrics hook
+        """
+
+        endpoint, phase = self._endpoint(url)
+        bytes_sent = 0
+        bytes_received = None
+        if response is not None:
+            body = response.request.body if response.request is not None else None
+            bytes_sent = len(body) if body is not None else 0
+            if stream:
+                content_length = response.headers.get('Content-Length')
+                bytes_received = int(content_length) if content_length is not None else None
+            else:
+                bytes_received = len(response.content)
+        self.metrics.record(RequestRecord(endpoint=endpoint,
+                                          phase=phase,
+                                          method=method.upper(),
+                                          status=response.status_code if response is not None else None,
+                                          latency=timings['latency'],
+                                          queue_wait=timings['queue_wait'],
+                                          backoff=timings['backoff'],
+                                          bytes_sent=bytes_sent,
+                                          bytes_received=bytes_received,
+                                          retries=getattr(response, 'retries', 0),
+                                          cache=getattr(self._metrics_local, 'cache', None),
+                                          error=error,
+                                          timestamp=time.time()))
+
+    def _record_cache_hit(self, endpoint, latency, nbytes):
+        """
+        report an activity payload served from the cache to the metrics hook
+        """
+
+        self.metrics.record(RequestRecord(endpoint=endpoint,
+                                          phase='download',
+                                          method='CACHE',
+                                          status=None,
+                                          latency=latency,
+                                          queue_wait=0.0,
+                                          backoff=0.0,
+                                          bytes_sent=0,
+                                          bytes_received=nbytes,
+                                          retries=0,
+                                          cache='hit',
+                                          error=None,
+                                          timestamp=time.time()))
+
+    def _is_auth_failure(self, response):
+        """
+        True if Garmin Connect rejected the request's session, either with
+        a 401 or by redirecting it to the SSO login. A 403 is a permission
+        error on that resource, logging in again wouldn't change it
+        """
+
+        if response.status_code == 401:
+            return True
+        return bool(response.history) and response.url.startswith(self.URL_SSO_LOGIN)
+
+    def _load_session(self):
+        """
+        return the saved session or None if there is no session file, the
+        saved session is too old or it belongs to another loginname than the
+        client's
+        """
+
+        if self.session_file is None:
+            return None
+        try:
+            with open(self.session_file) as file:
+                saved_session = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if self.loginname is not None and saved_session.get('loginname') != self.loginname:
+            LOG.info(f'saved session is of another user, logging in as {self.loginname}')
+            return None
+        age = time.time() - saved_session.get('saved_at', 0)
+        if age > self.session_max_age:
+            LOG.info(f'saved session is {age / 3600:.1f} hours old, logging in again')
+            return None
+        now = time.time()
+        saved_session['cookies'] = [cookie for cookie in saved_session['cookies']
+                                    if cookie['expires'] is None or cookie['expires'] > now]
+        if not saved_session['cookies']:
+            return None
+        return saved_session
+
+    def _save_session(self):
+        """
+        save the session cookies to `session_file`, created readable and
+        writable by the user only. The password is never saved
+        """
+
+        if self.session_file is None:
+            return
+        cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+                    'path': cookie.path, 'expires': cookie.expires, 'secure': cookie.secure}
+                   for cookie in self.session.cookies]
+        saved_session = {'loginname': self.loginname,
+                         'username': self.username,
+                         'saved_at': time.time(),
+                         'cookies': cookies}
+        session_dir = os.path.dirname(os.path.abspath(self.session_file))
+        os.makedirs(session_dir, mode=0o700, exist_ok=True)
+        # mkstemp creates the file with 0600 permissions
+        file_descriptor, tmp_name = tempfile.mkstemp(dir=session_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(file_descriptor, 'w') as file:
+                json.dump(saved_session, file)
+            os.replace(tmp_name, self.session_file)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
 
     def _extract_auth_ticket_url(self, auth_response):
         """
@@ -178,7 +635,7 @@ class ClientGarmin():
         .. codeauther:: petergardfjall
         """
 
-        match = re.search(r'response_url\s*=\s*"(https:[^"]+)"', auth_response)
+        match = re.search(r'response_url\s*=\s*"(https?:[^"]+)"', auth_response)
         if not match:
             raise RuntimeError("auth failure: unable to extract auth ticket URL. "
                                "did you provide a correct username/password?")
@@ -233,6 +690,18 @@ class ClientGarmin():
         .. _`petergardfjall`: https://github.com/90oak
         """
 
+        entries = self._parse_activity_entries(self._fetch_activity_page(start_index, max_limit))
+        n_activities = len(entries)
+        LOG.debug(f"retrieved {n_activities} activities.")
+
+        return entries
+
+    def _fetch_activity_page(self, start_index=0, max_limit=100):
+        """
+        return a page of the activity list response, the json entries of
+        the activities as Garmin Connect sends them
+        """
+
         end_index = start_index + max_limit - 1
         LOG.debug(f"fetching activities {start_index} through {end_index} ...")
         response = self.session.get(self.URL_ACTIVITY_LIST, params={"start": start_index, "limit": max_limit})
@@ -241,28 +710,29 @@ class ClientGarmin():
             text = response.text
             raise Exception(f"failed to fetch activities {start_index} to" +
                             f" {end_index} types: {scode}\n{text}")
+        return json.loads(response.text) or []
 
-        activities = json.loads(response.text)
-        if not activities:
-            # index out of bounds or empty account
-            return []
+    @staticmethod
+    def _parse_activity_entries(activities):
+        """
+        convert a page of the activity list response into (activity_id,
+        start timestamp) tuples, an empty page gives an empty list
+        """
 
         entries = []
-        for activity in activities:
+        for activity in activities or []:
             activity_id = int(activity["activityId"])
             timestamp_utc = dateutil.parser.parse(activity["startTimeGMT"])
             # make sure UTC timezone gets set
             timestamp_utc = timestamp_utc.replace(tzinfo=dateutil.tz.tzutc())
             entries.append((activity_id, timestamp_utc))
-        n_activities = len(entries)
-        LOG.debug(f"retrieved {n_activities} activities.")
-
         return entries
 
-    @require_session
+    @require_session_or_offline
     def _get_activity(self, activity_id, act_type='summary'):
         """
-        given an activity id, return the file type
+        given an activity id, return the file type. Cacheable types are
+        served from the activity cache when the client has one
 
         Parameters:
             activity_id (int): garmin activity id
@@ -270,35 +740,101 @@ class ClientGarmin():
 
         Returns:
             'summary' or 'Details': json.loads(response.text)
-            'orginal_file': response
-            'tcx', 'gpx', or 'fit': response.text
+            'orginal_file' or 'fit': zip archive bytes
+            'tcx' or 'gpx': response.text
+        """
+
+        content = self._get_activity_content(activity_id, act_type)
+        if content is None:
+            return []
+        if act_type.lower() in ('summary', 'details'):
+            return json.loads(content)
+        if act_type.lower() in ('original_file', 'fit'):
+            return content
+        return content.decode('utf-8')
+
+    def _get_activity_content(self, activity_id, act_type):
+        """
+        return the raw bytes of an activity payload from the cache or Garmin
+        Connect, None if there is no file for the activity (or it isn't
+        cached in offline mode)
         """
 
+        # `fit` and `original_file` are the same download
+        cache_type = 'original_file' if act_type == 'fit' else act_type
+        use_cache = self.cache is not None and cache_type in self.cached_activity_types
         session_url = self.activity_urls[act_type]
-        response = self.session.get(session_url.format(activity_id=activity_id))
-        if self._check_response_code(response, act_type=act_type, activity_id=activity_id):
-            if act_type.lower() in ('summary', 'details'):
-                return json.loads(response.text)
-            if act_type.lower() == 'original_file':
-                return response
-            return response.text
-        return []
+        if use_cache:
+            start = time.monotonic()
+            content = self.cache.get(activity_id, cache_type)
+            if content is not None:
+                if self.metrics is not None:
+                    self._record_cache_hit(session_url, time.monotonic() - start, len(content))
+                return content
+        if self.offline:
+            LOG.warning(f"{act_type} for activity {activity_id} is not cached, offline mode")
+            return None
+
+        self._metrics_local.cache = 'miss' if use_cache else None
+        try:
+            response = self.session.get(session_url.format(activity_id=activity_id))
+        finally:
+            self._metrics_local.cache = None
+        if not self._check_response_code(response, act_type=act_type, activity_id=activity_id):
+            return None
+        if use_cache:
+            self.cache.put(activity_id, cache_type, response.content)
+        return response.content
 
     @require_session
-    def list_activities(self, batch_size=100, force_reload=False):
+    def list_activities(self, batch_size=100, force_reload=False, sync='full', known=None, workers=4):
         """Return all activity ids stored by the logged in user, along
         with their starting timestamps.
 
+        Parameters:
+            batch_size (int): number of activities fetched per request
+            force_reload (bool): sync again even if the activities were
+                already listed (an `incremental` sync always syncs)
+            sync (str): how the list is fetched from Garmin Connect
+
+                * `full`: page through the whole history one request at a time
+                * `incremental`: only fetch the activities newer than the
+                  newest known one, stopping at the first page that reaches a
+                  known activity. A daily sync usually takes one request
+                * `parallel`: probe for the end of the history with single
+                  entry requests, then fetch all the pages concurrently
+
+            known (list of (int, datetime)): activities already stored locally
+                (newest first) for the `incremental` sync. Defaults to the
+                activities listed before by this client
+            workers (int): number of pages in flight for the `parallel` sync
+
         Returns:
         ids (tuple of (int, datetime)): The full list of activity identifiers
             (along with their starting timestamps).
 
+        Examples:
+
+        >>> activities = client.list_activities(sync='parallel', workers=8)
+        >>> # the next day
+        >>> activities = client.list_activities(sync='incremental', known=activities)
+
         taken from petergardfjall_
 
         .. _`petergardfjall`: https://github.com/90oak
         """
 
-        if not self.activity_list or force_reload:
+        if known is not None:
+            self.activity_list = list(known)
+        elif self.activity_list and not force_reload and sync != 'incremental':
+            # an incremental sync always asks for the new activities
+            return self.activity_list
+
+        if sync == 'incremental' and self.activity_list:
+            self.activity_list = self._sync_new_activities(batch_size) + self.activity_list
+        elif sync == 'parallel':
+            self.activity_list = self._list_activities_parallel(batch_size, workers)
+        elif sync in ('full', 'incremental'):
             ids = []
             # fetch in batches since the API doesn't allow more than a certain
             # number of activities to be retrieved on every invocation
@@ -308,45 +844,209 @@ class ClientGarmin():
                     break
                 ids.extend(next_batch)
             self.activity_list = ids
+        else:
+            raise ValueError(f"unknown sync mode {sync}, use `full`, `incremental` or `parallel`")
 
         return self.activity_list
 
+    def _sync_new_activities(self, batch_size):
+        """
+        return the activities newer than the known ones (newest first),
+        paging only until a page holds a known activity id
+        """
+
+        known_ids = {activity_id for activity_id, _ in self.activity_list}
+        new_activities = []
+        for start_index in range(0, sys.maxsize, batch_size):
+            next_batch = self._fetch_activity_ids_and_ts(start_index, batch_size)
+            for entry in next_batch:
+                if entry[0] in known_ids:
+                    LOG.debug(f"found {len(new_activities)} new activities")
+                    return new_activities
+                new_activities.append(entry)
+            if len(next_batch) < batch_size:
+                return new_activities
+        return new_activities
+
+    def _list_activities_parallel(self, batch_size, workers):
+        """
+        find the number of pages of the activity list with single entry
+        probes (exponential then binary search, down to page resolution)
+        and fetch all the pages concurrently
+        """
+
+        def has_activity(index):
+            return bool(self._fetch_activity_ids_and_ts(index, 1))
+
+        if not has_activity(0):
+            return []
+        # activity `lower` exists and activity `upper` doesn't
+        lower, upper = 0, batch_size
+        while has_activity(upper):
+            lower, upper = upper, upper * 2
+        while upper - lower > batch_size:
+            middle = (lower + upper) // 2
+            if has_activity(middle):
+                lower = middle
+            else:
+                upper = middle
+
+        start_indices = range(0, upper, batch_size)
+        LOG.debug(f"fetching {len(start_indices)} pages of activities with {workers} workers")
+        self._size_connection_pool(workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pages = list(executor.map(lambda start_index: self._fetch_activity_ids_and_ts(start_index,
+                                                                                           batch_size),
+                                      start_indices))
+
+        # activities recorded during the scan shift the pages, drop the
+        # entries that were listed twice
+        ids = []
+        seen = set()
+        for entry in itertools.chain.from_iterable(pages):
+            if entry[0] not in seen:
+                seen.add(entry[0])
+                ids.append(entry)
+        return ids
+
+    @require_session
+    def update_activity_index(self, index, batch_size=100, full=False, summaries=False, workers=4):
+        """Add the activities of the account to a local `ActivityIndex`
+        (id, start time, sport, duration, distance), so date range and sport
+        queries don't need the network afterwards.
+
+        The activity list is paged newest first until a page reaches an
+        activity already indexed, a daily update usually takes one request.
+
+        Parameters:
+            index (ActivityIndex): the index updated
+            batch_size (int): number of activities fetched per request
+            full (bool): page through the whole history, e.g. to pick up
+                activities edited on Garmin Connect since they were indexed
+            summaries (bool): fetch the summaries of the indexed activities
+                that weren't fetched before, to fill in a sport, duration or
+                distance missing from the list (cached when the client has
+                an activity cache)
+            workers (int): number of summaries fetched concurrently
+
+        Returns:
+            n_added (int): number of activities that weren't indexed before
+
+        Examples:
+
+        >>> index = ActivityIndex('garmin_activities.sqlite')
+        >>> client.update_activity_index(index)
+        >>> runs_2018 = index.query(start='2018-01-01', end='2019-01-01', sport='running')
+        """
+
+        n_added = 0
+        for start_index in range(0, sys.maxsize, batch_size):
+            page = self._fetch_activity_page(start_index, batch_size)
+            new_entries = [entry for entry in page if int(entry["activityId"]) not in index]
+            n_added += len(new_entries)
+            index.add_list_entries(page if full else new_entries)
+            if len(page) < batch_size or (not full and len(new_entries) < len(page)):
+                break
+        LOG.debug(f"indexed {n_added} new activities")
+
+        if summaries:
+            missing = index.missing_details()
+            if missing:
+                self._size_connection_pool(workers)
+                fetched = []
+                empty = []
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(self.get_activity_summary, activity_id): activity_id
+                               for activity_id in missing}
+                    for future in as_completed(futures):
+                        activity_id = futures[future]
+                        try:
+                            summary = future.result()
+                        except Exception as error:
+                            # tried again on the next update
+                            LOG.error(f"failed to fetch the summary of activity {activity_id}: {error}")
+                            continue
+                        if summary:
+                            fetched.append(summary)
+                        else:
+                            empty.append(activity_id)
+                index.add_summaries(fetched)
+                # no summary (404 / 204), don't ask for it again
+                index.mark_details_fetched(empty)
+
+        self.activity_list = index.activity_list()
+        return n_added
+
     @require_session
-    def get_wellness_summary_datespan(self, from_date='2018-07-01', until_date='2018-09-01', force_reload=False):
+    def get_wellness_summary_datespan(self, from_date='2018-07-01', until_date='2018-09-01', force_reload=False,
+                                      chunk_days=31, workers=4):
         """Return summary of wellness data stored by the logged in user
 
+        The daily metrics are kept in a per day cache covering every range
+        fetched so far. Only the days of the range that aren't cached yet
+        are fetched, split in `chunk_days` long requests that run
+        concurrently. The result is built from the cache, so overlapping or
+        adjacent ranges don't download the same days again.
+
         Parameters:
             from_date (str): yyyy-mm-dd
             until_date (str): yyyy-mm-dd
+            force_reload (bool): fetch the whole range again (e.g. when
+                today's metrics are still being updated)
+            chunk_days (int): number of days fetched per request
+            workers (int): maximum number of requests in flight
 
         Returns:
-        json dictionary load of response
-        """
-
-        fetch_data = False
-        if force_reload:
-            fetch_data = True
-        if from_date != self.wellness_summary_from or until_date != self.wellness_summary_until:
-            fetch_data = True
-
-        if fetch_data:
-            response = self.session.get(self.URL_WELLNESS.format(username=self.username),
-                                      params={"fromDate": from_date, "untilDate": until_date})
-
-            if self._check_response_code(response, act_type="wellness summary",
-                                         activity_id=f"{from_date} to {until_date}"):
-                self.wellness_summary_from = from_date
-                self.wellness_summary_until = until_date
-                wellness_response = json.loads(response.text)
-                if wellness_response['groupedMetrics']:
-                    self.wellness_grouped_summary = wellness_response['groupedMetrics']
-                else:
-                    wellness_grouped_summary = []
+        json dictionary load of response: metric name -> list of the daily
+            entries in the range sorted by `calendarDate`
+        """
 
-                self.wellness_summary = wellness_response['allMetrics']['metricsMap']
+        start = datetime.date.fromisoformat(from_date)
+        end = datetime.date.fromisoformat(until_date)
+        missing = [(start, end)] if force_reload else _missing_intervals(self._wellness_intervals, start, end)
+        chunks = [(chunk_start, min(chunk_start + datetime.timedelta(days=chunk_days - 1), gap_end))
+                  for gap_start, gap_end in missing
+                  for chunk_start in _date_range(gap_start, gap_end, chunk_days)]
+
+        if chunks:
+            LOG.debug(f"fetching wellness summary for {len(chunks)} date ranges")
+            if len(chunks) > 1:
+                self._size_connection_pool(workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                metric_maps = list(executor.map(lambda chunk: self._fetch_wellness_chunk(*chunk), chunks))
+            fetched = []
+            for chunk, metric_map in zip(chunks, metric_maps):
+                if metric_map is None:
+                    continue
+                for metric, entries in metric_map.items():
+                    days = self._wellness_days.setdefault(metric, {})
+                    for entry in entries:
+                        days[entry['calendarDate']] = entry
+                fetched.append(chunk)
+            self._wellness_intervals = _merge_intervals(self._wellness_intervals + fetched)
+
+        self.wellness_summary_from = from_date
+        self.wellness_summary_until = until_date
+        self.wellness_summary = {metric: [days[day] for day in sorted(days) if from_date <= day <= until_date]
+                                 for metric, days in self._wellness_days.items()}
         return self.wellness_summary
 
-    @require_session
+    def _fetch_wellness_chunk(self, start, end):
+        """
+        fetch the wellness metric map of one date range, None if there is
+        no data for it
+        """
+
+        from_date = start.isoformat()
+        until_date = end.isoformat()
+        response = self.session.get(self.URL_WELLNESS.format(username=self.username),
+                                    params={"fromDate": from_date, "untilDate": until_date})
+        if self._check_response_code(response, act_type="wellness summary",
+                                     activity_id=f"{from_date} to {until_date}"):
+            return json.loads(response.text)['allMetrics']['metricsMap']
+        return None
+
+    @require_session_or_offline
     def get_activity_summary(self, activity_id):
         """Return a summary about a given activity. The
         summary contains several statistics, such as duration, GPS starting
@@ -363,7 +1063,7 @@ class ClientGarmin():
         response_json = self._get_activity(activity_id, act_type='summary')
         return response_json
 
-    @require_session
+    @require_session_or_offline
     def get_activity_details(self, activity_id):
         """Return a JSON representation of a given activity including
         available measurements such as location (longitude, latitude),
@@ -379,7 +1079,7 @@ class ClientGarmin():
         response_json = self._get_activity(activity_id, act_type='details')
         return response_json
 
-    @require_session
+    @require_session_or_offline
     def get_activity_gpx(self, activity_id):
         """Return a GPX (GPS Exchange Format) representation of a
         given activity. If the activity cannot be exported to GPX
@@ -402,7 +1102,7 @@ class ClientGarmin():
         response_text = self._get_activity(activity_id, act_type='gpx')
         return response_text
 
-    @require_session
+    @require_session_or_offline
     def get_activity_tcx(self, activity_id):
         """Return a TCX (Training Center XML) representation of a
         given activity. If the activity doesn't have a TCX source (for
@@ -422,34 +1122,100 @@ class ClientGarmin():
         response_text = self._get_activity(activity_id, act_type='tcx')
         return response_text
 
-    def get_original_activity(self, activity_id):
+    @require_session_or_offline
+    def get_original_activity(self, activity_id, dest=None, as_memoryview=False,
+                              chunk_size=2**16, spool_bytes=2**22):
         """Return the original file that was uploaded for an activity.
         If the activity doesn't have any file source (for example,
         if it was entered manually rather than imported from a Garmin
         device) then :obj:`(None,None)` is returned.
 
+        The zip archive is streamed in `chunk_size` chunks into a spooled
+        temporary file (kept in memory up to `spool_bytes`, on disk above)
+        and the activity file is extracted from there, so large files are
+        never held in memory several times.
+
         Parameters:
             activity_id (int): activity identifier
+            dest (str, path, or open binary file): extract the file to this
+                path or file object instead of returning its contents
+            as_memoryview (bool): return the contents as a memoryview of the
+                buffer the file is decompressed into, instead of bytes
+            chunk_size (int): bytes read from the network / archive at a time
+            spool_bytes (int): archive size above which it's spooled to disk
 
         Returns:
             (fltype, content): A tuple of the file type (e.g. 'fit', 'tcx', 'gpx') and
-                its contents, or `(None,None)` if no file is found.
+                its contents (`dest` if given), or `(None,None)` if no file is found.
 
+        Examples:
+
+        >>> fltype, path = client.get_original_activity(activity_id, dest='activity.fit')
         """
 
-        response = self._get_activity(activity_id, act_type='original_file')
+        return self._extract_original_activity(activity_id, dest, as_memoryview, chunk_size, spool_bytes)
 
-        # return the first entry from the zip archive where the filename is
-        # activity_id (should be the only entry!)
-        zip_file = zipfile.ZipFile(StringIO(response.content), mode="r")
-        for path in zip_file.namelist():
-            filename, ext = os.path.splitext(path)
-            if filename == str(activity_id):
-                return ext[1:], zip_file.open(path).read()
-        return (None, None)
+    def _extract_original_activity(self, activity_id, dest=None, as_memoryview=False,
+                                   chunk_size=2**16, spool_bytes=2**22, fltype=None):
+        """
+        extract the activity file from the original file zip archive (see
+        `get_original_activity`). If `fltype` is given, a file of another
+        type is not extracted and `(its type, None)` is returned
+        """
 
+        archive = self._open_original_archive(activity_id, chunk_size, spool_bytes)
+        if archive is None:
+            return (None, None)
+
+        with archive, zipfile.ZipFile(archive, mode="r") as zip_file:
+            # return the first entry from the zip archive where the filename is
+            # activity_id (should be the only entry!)
+            for info in zip_file.infolist():
+                filename, ext = os.path.splitext(info.filename)
+                if filename == str(activity_id):
+                    break
+            else:
+                return (None, None)
+            if fltype is not None and ext[1:] != fltype:
+                return ext[1:], None
+
+            with zip_file.open(info) as member:
+                if dest is None:
+                    if as_memoryview:
+                        return ext[1:], _read_into_buffer(member, info.file_size, chunk_size)
+                    return ext[1:], member.read()
+                if isinstance(dest, (str, os.PathLike)):
+                    with open(dest, 'wb') as dest_file:
+                        shutil.copyfileobj(member, dest_file, chunk_size)
+                else:
+                    shutil.copyfileobj(member, dest, chunk_size)
+                return ext[1:], dest
+
+    def _open_original_archive(self, activity_id, chunk_size, spool_bytes):
+        """
+        return the original file zip archive as a binary file object, or
+        None if the activity has no original file. With an activity cache
+        the archive goes through the cache, otherwise it's streamed into a
+        spooled temporary file
+        """
 
-    def get_activity_fit(self, activity_id):
+        if self.cache is not None or self.offline:
+            content = self._get_activity_content(activity_id, 'original_file')
+            return BytesIO(content) if content is not None else None
+
+        session_url = self.activity_urls['original_file']
+        archive = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        with self.session.get(session_url.format(activity_id=activity_id), stream=True) as response:
+            if not self._check_response_code(response, act_type='original_file', activity_id=activity_id):
+                archive.close()
+                return None
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                archive.write(chunk)
+        archive.seek(0)
+        return archive
+
+    @require_session_or_offline
+    def get_activity_fit(self, activity_id, dest=None, as_memoryview=False):
         """Return a FIT representation for a given activity. If the activity
         doesn't have a FIT source (for example, if it was entered manually
         rather than imported from a Garmin device) a :obj:`None` value is
@@ -457,23 +1223,125 @@ class ClientGarmin():
 
         Parameters:
             activity_id (int): activity identifier
+            dest (str, path, or open binary file): extract the FIT file to
+                this path or file object (see `get_original_activity`)
+            as_memoryview (bool): return a memoryview instead of bytes
 
         Returns:
-            (str): A string with a FIT file for the activity or :obj:`None`
+            (bytes): The FIT file for the activity (or `dest`) or :obj:`None`
                 if no FIT source exists for this activity (e.g., entered manually).
 
         taken from petergardfjall_
 
         .. _`petergardfjall`: https://github.com/90oak
         """
-        fmt, orig_file = self.get_original_activity(activity_id)
         # if the file extension of the original activity file isn't 'fit',
         # this activity was uploaded in a different format (e.g. gpx/tcx)
         # and cannot be exported to fit
+        fmt, orig_file = self._extract_original_activity(activity_id, dest, as_memoryview, fltype='fit')
         if fmt == 'fit':
             return orig_file
         return None
 
+    @require_session_or_offline
+    def download_activities(self, activity_ids, formats=('summary',), workers=4, dest='.'):
+        """Download several activities in several formats concurrently and
+        save them to disk as they complete. Requests run on a bounded
+        thread pool sharing the session's connection pool (sized to
+        `workers`). A failure only affects its own activity and format, the
+        error is collected in the report instead of aborting the batch.
+        Cacheable formats are served from (and added to) the activity cache
+        when the client has one.
+
+        Parameters:
+            activity_ids (list of int): activity identifiers
+            formats (tuple of str): activity types to download, any of
+                `summary`, `details`, `original_file`, `fit`, `tcx`, `gpx`
+            workers (int): maximum number of requests in flight
+            dest (str or path): directory the files are written to as
+                `{activity_id}_{format}.{ext}`. `original_file` and `fit` are
+                saved as the zip archive Garmin Connect returns
+
+        Returns:
+            report (namedtuple 'DownloadReport'):
+                downloaded (dict): (activity_id, format) -> saved file path
+                missing (list): (activity_id, format) with no file available
+                    (404 or 204, e.g. manually entered activities)
+                errors (dict): (activity_id, format) -> exception raised
+
+        Examples:
+
+        >>> ids = [activity_id for activity_id, _ in client.list_activities()]
+        >>> report = client.download_activities(ids, formats=('summary', 'gpx'),
+        >>>                                     workers=8, dest='garmin_backup')
+        >>> report.errors
+        """
+
+        unknown = set(formats) - set(self.activity_urls)
+        if unknown:
+            raise ValueError(f"unknown activity formats: {sorted(unknown)}")
+        os.makedirs(dest, exist_ok=True)
+        if self.session:
+            self._size_connection_pool(workers)
+
+        downloaded = {}
+        missing = []
+        errors = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._download_activity, activity_id, act_type, dest):
+                       (activity_id, act_type)
+                       for activity_id in activity_ids for act_type in formats}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    file_path = future.result()
+                except Exception as error:
+                    LOG.error(f"failed to download {key[1]} for activity {key[0]}: {error}")
+                    errors[key] = error
+                    continue
+                if file_path is None:
+                    missing.append(key)
+                else:
+                    downloaded[key] = file_path
+        n_downloaded = len(downloaded)
+        LOG.info(f"downloaded {n_downloaded} files, {len(missing)} missing, {len(errors)} errors")
+        return DownloadReport(downloaded=downloaded, missing=missing, errors=errors)
+
+    def _download_activity(self, activity_id, act_type, dest, chunk_size=2**16):
+        """
+        stream one activity file to `dest`, returns the file path or None if
+        there is no file for the activity
+        """
+
+        file_path = os.path.join(dest, f"{activity_id}_{act_type}.{self.activity_extensions[act_type]}")
+        part_path = file_path + '.part'
+        if (self.cache is not None and act_type in self.cached_activity_types) or self.offline:
+            content = self._get_activity_content(activity_id, act_type)
+            if content is None:
+                return None
+            with open(part_path, 'wb') as file:
+                file.write(content)
+            os.replace(part_path, file_path)
+            return file_path
+
+        session_url = self.activity_urls[act_type]
+        with self.session.get(session_url.format(activity_id=activity_id), stream=True) as response:
+            if not self._check_response_code(response, act_type=act_type, activity_id=activity_id):
+                return None
+            with open(part_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+        os.replace(part_path, file_path)
+        return file_path
+
+    def _size_connection_pool(self, workers):
+        """
+        make sure the session can keep a connection open for every worker
+        thread, the requests default pool only keeps 10
+        """
+
+        self.session.size_connection_pool(max(workers, 10))
+
     @require_session
     def upload_activity(self, file, format=None, name=None, description=None, activity_type=None, private=None):
         """Upload a GPX, TCX, or FIT file for an activity.
@@ -495,12 +1363,137 @@ class ClientGarmin():
         .. _`petergardfjall`: https://github.com/90oak
         """
 
-        if isinstance(file, basestring):
-            file = open(file, "rb")
+        response = self._post_activity_file(file, format)
+
+        # check response and get activity ID
+        activity_id = self._parse_upload_response(response.status_code, response.text, format)
+
+        # add optional fields
+        data = self._activity_metadata(name, description, activity_type, private)
+        if data:
+            self._set_activity_metadata(activity_id, data)
+
+        return activity_id
+
+    @require_session
+    def upload_activities(self, paths, workers=4, ledger_file=None, metadata=None):
+        """Upload many GPX, TCX, or FIT files concurrently, skipping the
+        files that were uploaded before.
+
+        Every file is hashed and looked up in a local ledger of the content
+        hashes already uploaded, files with the same content are only
+        uploaded once. The uploads run on a bounded thread pool, then the
+        metadata of the uploaded files is set (Garmin Connect has no bulk
+        metadata update, so the updates are sent together, concurrently,
+        once the uploads are done). A failure only affects its own file.
+
+        Parameters:
+            paths (list of str or path): activity files to upload, the format
+                is guessed from the extension
+            workers (int): maximum number of requests in flight
+            ledger_file (str or path): json lines ledger of the uploaded
+                files (see `UploadLedger`). If None, files are only
+                deduplicated within this batch
+            metadata (dict): path -> dict with any of the optional
+                `upload_activity` fields (`name`, `description`,
+                `activity_type`, `private`)
+
+        Returns:
+            report (namedtuple 'UploadReport'):
+                uploaded (dict): path -> activity_id of the new activity
+                skipped (dict): path -> activity_id of the activity that
+                    already holds the file (from the ledger, an identical
+                    file of the batch or a duplicate found by Garmin Connect)
+                errors (dict): path -> exception raised. A file whose upload
+                    succeeded but whose metadata update failed is in both
+                    `uploaded` and `errors`
+
+        Examples:
+
+        >>> paths = glob.glob('export/*.fit')
+        >>> report = client.upload_activities(paths, workers=8,
+        >>>                                   ledger_file='~/.pyhealth/garmin_uploads.jsonl')
+        >>> report.errors
+        """
+
+        ledger = UploadLedger(ledger_file)
+        metadata = metadata or {}
+        self._size_connection_pool(workers)
+        uploaded = {}
+        skipped = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hash_futures = [executor.submit(file_digest, path) for path in paths]
+            # content hash -> paths with that content, in the order given
+            by_digest = {}
+            for path, future in zip(paths, hash_futures):
+                try:
+                    by_digest.setdefault(future.result(), []).append(path)
+                except Exception as error:
+                    errors[path] = error
+
+            upload_futures = {}
+            for digest, digest_paths in by_digest.items():
+                activity_id = ledger.get(digest)
+                if activity_id is None:
+                    upload_futures[executor.submit(self._upload_new_activity, digest_paths[0])] = digest
+                else:
+                    skipped.update(dict.fromkeys(digest_paths, activity_id))
+
+            for future in as_completed(upload_futures):
+                digest = upload_futures[future]
+                path, *same_content = by_digest[digest]
+                try:
+                    activity_id, created = future.result()
+                except Exception as error:
+                    LOG.error(f"failed to upload {path}: {error}")
+                    errors.update(dict.fromkeys([path] + same_content, error))
+                    continue
+                ledger.add(digest, activity_id, path)
+                if created:
+                    uploaded[path] = activity_id
+                else:
+                    skipped[path] = activity_id
+                skipped.update(dict.fromkeys(same_content, activity_id))
+
+            metadata_futures = {}
+            for path, activity_id in uploaded.items():
+                data = self._activity_metadata(**metadata.get(path, {}))
+                if data:
+                    metadata_futures[executor.submit(self._set_activity_metadata, activity_id, data)] = path
+            for future in as_completed(metadata_futures):
+                try:
+                    future.result()
+                except Exception as error:
+                    errors[metadata_futures[future]] = error
+
+        LOG.info(f"uploaded {len(uploaded)} files, {len(skipped)} skipped, {len(errors)} errors")
+        return UploadReport(uploaded=uploaded, skipped=skipped, errors=errors)
+
+    def _upload_new_activity(self, path):
+        """
+        upload one file, returns (activity_id, created). `created` is False
+        if Garmin Connect already had the activity
+        """
+
+        response = self._post_activity_file(path)
+        activity_id = self._duplicate_activity_id(response.status_code, response.text)
+        if activity_id is not None:
+            return activity_id, False
+        return self._parse_upload_response(response.status_code, response.text, os.path.basename(path)), True
+
+    def _post_activity_file(self, file, format=None):
+        """
+        post an activity file to the upload service and return the response
+        """
+
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as open_file:
+                return self._post_activity_file(open_file, format)
 
         # guess file type if unspecified
         filename = os.path.basename(file.name)
-        _, ext = os.path.splitext(fn)
+        _, ext = os.path.splitext(filename)
         if format is None:
             if ext.lower() in ('.gpx', '.tcx', '.fit'):
                 format = ext.lower()[1:]
@@ -509,45 +1502,80 @@ class ClientGarmin():
 
         # upload it
         files = dict(data=(filename, file))
-        response = self.session.post(self.URL_UPLOAD.format(flformat=format),
-                                     files=files, headers={"nk": "NT"})
+        return self.session.post(self.URL_UPLOAD.format(flformat=format),
+                                 files=files, headers={"nk": "NT"})
 
-        # check response and get activity ID
+    def _set_activity_metadata(self, activity_id, data):
+        """
+        set the optional fields (see `_activity_metadata`) of an activity
+        """
+
+        data = dict(data, activityId=activity_id)
+        encoding_headers = {"Content-Type": "application/json; charset=UTF-8"} # see Tapiriik
+        response = self.session.put(self.URL_ACTVITY_PUT.format(activity_id=activity_id),
+                                    data=json.dumps(data), headers=encoding_headers)
+        if response.status_code != 204:
+            raise Exception(u"failed to set metadata for activity {}: {}\n{}".format(
+                activity_id, response.status_code, response.text))
+
+    @staticmethod
+    def _duplicate_activity_id(status_code, text):
+        """
+        return the id of the existing activity if an upload was rejected as
+        a duplicate (409 with failure message code 202), otherwise None
+        """
+
+        if status_code != 409:
+            return None
         try:
-            j = response.json()["detailedImportResult"]
+            failures = json.loads(text)["detailedImportResult"]["failures"]
+        except (ValueError, KeyError, TypeError):
+            return None
+        for failure in failures:
+            if failure.get("internalId") and \
+                    any(message.get("code") == 202 for message in failure.get("messages", [])):
+                return failure["internalId"]
+        return None
+
+    @staticmethod
+    def _parse_upload_response(status_code, text, format):
+        """
+        return the activity id of an upload response, raises if the upload
+        failed or created more than one activity
+        """
+
+        try:
+            j = json.loads(text)["detailedImportResult"]
         except (json.JSONDecodeError, KeyError):
             raise Exception(u"failed to upload {} for activity: {}\n{}".format(
-                format, response.status_code, response.text))
+                format, status_code, text))
 
         if len(j["failures"]) or len(j["successes"]) < 1:
             raise Exception(u"failed to upload {} for activity: {}\n{}".format(
-                format, response.status_code, j["failures"]))
+                format, status_code, j["failures"]))
 
         if len(j["successes"]) > 1:
             raise Exception(u"uploading {} resulted in multiple activities ({})".format(
                 format, len(j["successes"])))
 
-        activity_id = j["successes"][0]["internalId"]
+        return j["successes"][0]["internalId"]
+
+    @staticmethod
+    def _activity_metadata(name=None, description=None, activity_type=None, private=None):
+        """
+        optional activity fields to set after an upload, empty if none given
+        """
 
-        # add optional fields
         data = {}
         if name is not None:
             data['activityName'] = name
         if description is not None:
-            data['description'] = name
+            data['description'] = description
         if activity_type is not None:
             data['activityTypeDTO'] = {"typeKey": activity_type}
         if private:
             data['privacy'] = {"typeKey": "private"}
-        if data:
-            data['activityId'] = activity_id
-            encoding_headers = {"Content-Type": "application/json; charset=UTF-8"} # see Tapiriik
-            response = self.session.put(self.URL_ACTVITY_PUT.format(activity_id), data=json.dumps(data), headers=encoding_headers)
-            if response.status_code != 204:
-                raise Exception(u"failed to set metadata for activity {}: {}\n{}".format(
-                    activity_id, response.status_code, response.text))
-
-        return activity_id
+        return data
 
     def Get_RestingHR_Trend(self, from_date, until_date):
         """
@@ -0,0 +1,252 @@
+"""
+A persistent local index of the Garmin Connect activities in SQLite. It keeps
+the id, start time, sport, duration and distance of every activity from the
+activity list and summary endpoints, indexed on start time and sport, so
+date range and sport queries run locally instead of crawling the account.
+"""
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+import dateutil.parser
+import dateutil.tz
+
+IndexedActivity = namedtuple('IndexedActivity', ['activity_id', 'start_time', 'sport', 'duration',
+                                                 'distance', 'name'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    activity_id INTEGER PRIMARY KEY,
+    start_time INTEGER NOT NULL,
+    sport TEXT,
+    duration REAL,
+    distance REAL,
+    name TEXT,
+    updated_at REAL NOT NULL,
+    details_fetched REAL
+);
+CREATE INDEX IF NOT EXISTS activities_start_time ON activities (start_time);
+CREATE INDEX IF NOT EXISTS activities_sport_start_time ON activities (sport, start_time);
+"""
+
+# keep the values already indexed when an update doesn't have them (e.g. a
+# list entry without duration after the summary filled it in).
+# `details_fetched` is the time the summary was indexed, NULL until then
+UPSERT = """
+INSERT INTO activities (activity_id, start_time, sport, duration, distance, name, updated_at,
+                        details_fetched)
+VALUES (:activity_id, :start_time, :sport, :duration, :distance, :name, :updated_at,
+        :details_fetched)
+ON CONFLICT (activity_id) DO UPDATE SET
+    start_time = excluded.start_time,
+    sport = COALESCE(excluded.sport, sport),
+    duration = COALESCE(excluded.duration, duration),
+    distance = COALESCE(excluded.distance, distance),
+    name = COALESCE(excluded.name, name),
+    updated_at = excluded.updated_at,
+    details_fetched = COALESCE(excluded.details_fetched, details_fetched)
+"""
+
+
+class ActivityIndex():
+    """SQLite index of activities. Start times are stored as UTC epoch
+    seconds, returned as timezone aware UTC datetimes.
+
+    Parameters:
+        db_file (str or path): SQLite database file, created if missing.
+            ':memory:' keeps the index in memory
+
+    Examples:
+
+    All the runs of 2018, without touching the network
+
+    >>> index = ActivityIndex('~/.pyhealth/garmin_activities.sqlite')
+    >>> client.update_activity_index(index)
+    >>> runs = index.query(start='2018-01-01', end='2019-01-01', sport='running')
+    """
+
+    def __init__(self, db_file):
+        """Initialize ActivityIndex class"""
+
+        self.db_file = db_file if db_file == ':memory:' else os.path.expanduser(db_file)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_file, check_same_thread=False)
+        if self.db_file != ':memory:':
+            self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(SCHEMA)
+        self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM activities').fetchone()[0]
+
+    def __contains__(self, activity_id):
+        with self._lock:
+            return self._connection.execute('SELECT 1 FROM activities WHERE activity_id = ?',
+                                            (activity_id,)).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def add_list_entries(self, activities):
+        """
+        index the entries of activity list responses
+
+        Parameters:
+            activities (list of dict): activity list json entries
+                (`activityId`, `startTimeGMT`, `activityType`, `duration`,
+                `distance`, `activityName`)
+
+        Returns:
+            n_added (int): number of entries indexed
+        """
+        rows = [{'activity_id': int(activity['activityId']),
+                 'start_time': _epoch(activity['startTimeGMT']),
+                 'sport': (activity.get('activityType') or {}).get('typeKey'),
+                 'duration': activity.get('duration'),
+                 'distance': activity.get('distance'),
+                 'name': activity.get('activityName'),
+                 'details_fetched': None}
+                for activity in activities]
+        return self._upsert(rows)
+
+    def add_summaries(self, summaries):
+        """
+        index activity summaries (see `ClientGarmin.get_activity_summary`),
+        the activities are no longer returned by `missing_details`
+
+        Parameters:
+            summaries (list of dict): activity summary json
+
+        Returns:
+            n_added (int): number of summaries indexed
+        """
+        rows = []
+        without_start = []
+        fetched = time.time()
+        for summary in summaries:
+            summary_dto = summary.get('summaryDTO') or {}
+            start_time = summary_dto.get('startTimeGMT') or summary.get('startTimeGMT')
+            if start_time is None:
+                without_start.append(summary['activityId'])
+                continue
+            rows.append({'activity_id': int(summary['activityId']),
+                         'start_time': _epoch(start_time),
+                         'sport': (summary.get('activityTypeDTO') or summary.get('activityType') or {}).get('typeKey'),
+                         'duration': summary_dto.get('duration'),
+                         'distance': summary_dto.get('distance'),
+                         'name': summary.get('activityName'),
+                         'details_fetched': fetched})
+        self.mark_details_fetched(without_start)
+        return self._upsert(rows)
+
+    def mark_details_fetched(self, activity_ids):
+        """
+        record that the summaries of indexed activities were fetched when
+        there was nothing to index from them (e.g. a 404), so
+        `missing_details` stops returning them
+
+        Parameters:
+            activity_ids (list of int): garmin activity ids
+        """
+        fetched = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany('UPDATE activities SET details_fetched = ? WHERE activity_id = ?',
+                                         [(fetched, int(activity_id)) for activity_id in activity_ids])
+
+    def _upsert(self, rows):
+        updated_at = time.time()
+        for row in rows:
+            row['updated_at'] = updated_at
+        with self._lock, self._connection:
+            self._connection.executemany(UPSERT, rows)
+        return len(rows)
+
+    def query(self, start=None, end=None, sport=None, limit=None):
+        """
+        return the indexed activities starting in [start, end), newest
+        first
+
+        Parameters:
+            start (str, date, or datetime): earliest start time (UTC if naive)
+            end (str, date, or datetime): start times before this
+            sport (str or list of str): activity type keys, e.g. `running`
+            limit (int): maximum number of activities returned
+
+        Returns:
+            activities (list of namedtuple 'IndexedActivity'): activity_id,
+                start_time (UTC datetime), sport, duration (s), distance (m),
+                name
+        """
+        conditions = []
+        parameters = []
+        if start is not None:
+            conditions.append('start_time >= ?')
+            parameters.append(_epoch(start))
+        if end is not None:
+            conditions.append('start_time < ?')
+            parameters.append(_epoch(end))
+        if sport is not None:
+            sports = [sport] if isinstance(sport, str) else list(sport)
+            conditions.append(f"sport IN ({', '.join('?' * len(sports))})")
+            parameters.extend(sports)
+        sql = 'SELECT activity_id, start_time, sport, duration, distance, name FROM activities'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY start_time DESC, activity_id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parameters.append(int(limit))
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        return [IndexedActivity(activity_id, _from_epoch(start_time), sport, duration, distance, name)
+                for activity_id, start_time, sport, duration, distance, name in rows]
+
+    def activity_list(self):
+        """
+        return all the indexed activities as (activity_id, start timestamp)
+        tuples, newest first, like `ClientGarmin.list_activities`
+        """
+        with self._lock:
+            rows = self._connection.execute('SELECT activity_id, start_time FROM activities '
+                                            'ORDER BY start_time DESC, activity_id DESC').fetchall()
+        return [(activity_id, _from_epoch(start_time)) for activity_id, start_time in rows]
+
+    def missing_details(self):
+        """
+        return the ids of the activities whose summary hasn't been indexed
+        (e.g. to fill in a sport, duration or distance missing from the
+        activity list). An activity that has no distance even in its
+        summary isn't returned again once the summary is added
+        """
+        with self._lock:
+            rows = self._connection.execute('SELECT activity_id FROM activities '
+                                            'WHERE details_fetched IS NULL').fetchall()
+        return [activity_id for activity_id, in rows]
+
+    def sports(self):
+        """
+        return {sport: number of activities}
+        """
+        with self._lock:
+            return dict(self._connection.execute('SELECT sport, COUNT(*) FROM activities GROUP BY sport'))
+
+
+def _epoch(timestamp):
+    """
+    UTC epoch seconds of an ISO string, date or datetime (naive ones are UTC)
+    """
+    if isinstance(timestamp, str):
+        timestamp = dateutil.parser.parse(timestamp)
+    elif not isinstance(timestamp, datetime.datetime):
+        timestamp = datetime.datetime(timestamp.year, timestamp.month, timestamp.day)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=dateutil.tz.tzutc())
+    return int(timestamp.timestamp())
+
+
+def _from_epoch(seconds):
+    return datetime.datetime.fromtimestamp(seconds, tz=dateutil.tz.tzutc())
@@ -0,0 +1,89 @@
+"""
+A local ledger of the activity files uploaded to Garmin Connect, keyed by the
+hash of the file contents, so a batch upload can skip the files that were
+uploaded before (under any name or path).
+"""
+import json
+import os
+import threading
+import time
+
+
+class UploadLedger():
+    """Content hash -> activity id map of uploaded files. Every upload is
+    appended to the ledger file as one json line, so the ledger stays valid
+    if a long batch is interrupted and appending never rewrites the file.
+
+    Parameters:
+        ledger_file (str or path): json lines file the ledger is kept in,
+            if None the ledger only lives in memory
+
+    Examples:
+
+    >>> from pyhealth.utils_files import file_digest
+    >>> ledger = UploadLedger('~/.pyhealth/garmin_uploads.jsonl')
+    >>> digest = file_digest('morning_run.fit')
+    >>> if ledger.get(digest) is None:
+    >>>     activity_id = client.upload_activity('morning_run.fit')
+    >>>     ledger.add(digest, activity_id, 'morning_run.fit')
+    """
+
+    def __init__(self, ledger_file=None):
+        """Initialize UploadLedger class"""
+
+        self.ledger_file = os.path.expanduser(ledger_file) if ledger_file is not None else None
+        self._lock = threading.Lock()
+        self._activity_ids = {}
+        if self.ledger_file is not None and os.path.exists(self.ledger_file):
+            with open(self.ledger_file, 'rb') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        self._activity_ids[entry['digest']] = entry['activity_id']
+                    except (ValueError, KeyError, TypeError):
+                        # a line cut short by an interrupted write, or not
+                        # valid utf-8 / json
+                        continue
+
+    def __len__(self):
+        return len(self._activity_ids)
+
+    def __contains__(self, digest):
+        return digest in self._activity_ids
+
+    def get(self, digest):
+        """
+        return the activity id the file with this content hash was uploaded
+        as, or None
+        """
+        return self._activity_ids.get(digest)
+
+    def add(self, digest, activity_id, file_name=None):
+        """
+        record an uploaded file
+
+        Parameters:
+            digest (str): content hash of the file (see
+                `pyhealth.utils_files.file_digest`)
+            activity_id (int): garmin activity id of the upload
+            file_name (str or path): uploaded file, only kept for reference
+        """
+        with self._lock:
+            self._activity_ids[digest] = activity_id
+            if self.ledger_file is None:
+                return
+            entry = {'digest': digest,
+                     'activity_id': activity_id,
+                     'file': os.fspath(file_name) if file_name is not None else None,
+                     'uploaded_at': time.time()}
+            ledger_dir = os.path.dirname(os.path.abspath(self.ledger_file))
+            os.makedirs(ledger_dir, exist_ok=True)
+            line = json.dumps(entry) + '\n'
+            with open(self.ledger_file, 'a+b') as file:
+                # an interrupted write can leave the last line without its
+                # newline, start a new line rather than append to it
+                if file.seek(0, os.SEEK_END):
+                    file.seek(-1, os.SEEK_END)
+                    if file.read(1) != b'\n':
+                        line = '\n' + line
+                file.write(line.encode('utf-8'))
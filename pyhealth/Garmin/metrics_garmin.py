@@ -0,0 +1,219 @@
+"""
+Request metrics for the Garmin Connect client. The client reports every
+request (and every activity served from its cache) as a `RequestRecord` to
+a metrics hook, any object with a `record(request_record)` method.
+`ClientMetrics` is the in-process implementation: it keeps per endpoint
+counters and latency histograms, prints a summary and exports it to a file.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+RequestRecord = namedtuple('RequestRecord', ['endpoint', 'phase', 'method', 'status', 'latency',
+                                             'queue_wait', 'backoff', 'bytes_sent', 'bytes_received', 'retries', 'cache',
+                                             'error', 'timestamp'])
+RequestRecord.__doc__ = """one request of the client
+
+    endpoint (str): URL template of the request, e.g.
+        `.../download-service/export/gpx/activity/{activity_id}`
+    phase (str): `auth`, `listing`, `download`, `wellness` or `upload`
+    method (str): HTTP method, `CACHE` for a payload served from the cache
+    status (int): final HTTP status, None if the request raised
+    latency (float): seconds spent sending the request and receiving its
+        response, summed over the retries
+    queue_wait (float): seconds the request waited for the scheduler's
+        rate and concurrency limits, summed over the retries
+    backoff (float): seconds slept between the retries
+    bytes_sent (int): request body size
+    bytes_received (int): response body size, None if it's streamed
+        without a Content-Length
+    retries (int): number of retries the request took
+    cache (str): `hit`, `miss` or None if the payload isn't cacheable
+    error (str): exception class name if the request raised, else None
+    timestamp (float): unix time the request finished
+"""
+
+# latency histogram bucket upper bounds: 1 ms doubling up to ~2 minutes
+LATENCY_BOUNDS = tuple(0.001 * 2 ** exponent for exponent in range(18))
+
+
+class LatencyHistogram():
+    """Latency histogram with fixed log spaced buckets, percentiles are
+    estimated as the upper bound of the bucket holding them.
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        """Initialize LatencyHistogram class"""
+
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def add(self, latency):
+        self.counts[bisect.bisect_left(self.bounds, latency)] += 1
+        self.total += latency
+        self.maximum = max(self.maximum, latency)
+
+    def percentile(self, percent):
+        """
+        estimated latency below which `percent` of the requests fall
+        """
+        count = len(self)
+        if not count:
+            return None
+        rank = percent / 100.0 * count
+        cumulative = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank and bucket_count:
+                return min(self.maximum, self.bounds[bucket]) if bucket < len(self.bounds) else self.maximum
+        return self.maximum
+
+    def mean(self):
+        count = len(self)
+        return self.total / count if count else None
+
+
+class ClientMetrics():
+    """Thread safe in-process metrics hook for `ClientGarmin`: per endpoint
+    request counts, errors, retries, bytes, cache hits / misses and latency
+    histograms, aggregated per phase (auth, listing, download, wellness,
+    upload) as well.
+
+    Parameters:
+        keep_records (bool): also keep every `RequestRecord` so `export`
+            writes them out. Off by default to keep memory flat on long runs
+
+    Examples:
+
+    >>> metrics = ClientMetrics()
+    >>> client = ClientGarmin(metrics=metrics)
+    >>> client.connect()
+    >>> activities = client.list_activities()
+    >>> report = client.download_activities(ids, formats=('gpx',))
+    >>> print(metrics.format_summary())
+    >>> metrics.export('garmin_sync_metrics.json')
+    """
+
+    def __init__(self, keep_records=False):
+        """Initialize ClientMetrics class"""
+
+        self.keep_records = keep_records
+        self.records = []
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._phases = {}
+        self._started = time.time()
+
+    def record(self, request_record):
+        """
+        add one request (the metrics hook interface)
+        """
+        with self._lock:
+            if self.keep_records:
+                self.records.append(request_record)
+            for key, stats in ((request_record.endpoint, self._endpoints),
+                               (request_record.phase, self._phases)):
+                if key not in stats:
+                    stats[key] = _new_stats()
+                _add(stats[key], request_record)
+
+    def summary(self):
+        """
+        return the metrics as a json serializable dict: `endpoints` and
+        `phases` map to counts, errors, retries, bytes, cache hits / misses,
+        total / mean / p50 / p90 / p99 / max latency, total queue wait and
+        total backoff in seconds
+        """
+        with self._lock:
+            return {'started': self._started,
+                    'elapsed': time.time() - self._started,
+                    'endpoints': {key: _summarize(stats) for key, stats in self._endpoints.items()},
+                    'phases': {key: _summarize(stats) for key, stats in self._phases.items()}}
+
+    def format_summary(self):
+        """
+        return the summary as a text table, phases first then endpoints,
+        sorted by the time spent
+        """
+        summary = self.summary()
+        lines = [f"{'':<60}{'requests':>9}{'errors':>7}{'retries':>8}{'cache hit':>10}"
+                 f"{'MB in':>8}{'total s':>9}{'wait s':>8}{'backoff s':>10}{'p50 ms':>8}{'p99 ms':>8}"]
+        for title in ('phases', 'endpoints'):
+            lines.append(title)
+            rows = sorted(summary[title].items(), key=lambda item: -item[1]['total_latency'])
+            for key, stats in rows:
+                name = key if len(key) <= 58 else '...' + key[-55:]
+                lines.append(f"  {name:<58}{stats['requests']:>9}{stats['errors']:>7}{stats['retries']:>8}"
+                             f"{stats['cache_hits']:>10}{stats['bytes_received'] / 2**20:>8.2f}"
+                             f"{stats['total_latency']:>9.2f}{stats['queue_wait']:>8.2f}{stats['backoff']:>10.2f}"
+                             f"{_ms(stats['p50']):>8}{_ms(stats['p99']):>8}")
+        return '\n'.join(lines)
+
+    def export(self, file_name):
+        """
+        write the summary (and the records when `keep_records`) to a json
+        file
+        """
+        exported = self.summary()
+        if self.keep_records:
+            with self._lock:
+                exported['records'] = [record._asdict() for record in self.records]
+        tmp_name = f'{file_name}.tmp'
+        with open(tmp_name, 'w') as file:
+            json.dump(exported, file, indent=1)
+        os.replace(tmp_name, file_name)
+
+    def reset(self):
+        """
+        drop everything recorded so far
+        """
+        with self._lock:
+            self.records = []
+            self._endpoints = {}
+            self._phases = {}
+            self._started = time.time()
+
+
+def _new_stats():
+    return {'requests': 0, 'errors': 0, 'retries': 0, 'cache_hits': 0, 'cache_misses': 0,
+            'bytes_sent': 0, 'bytes_received': 0, 'queue_wait': 0.0, 'backoff': 0.0, 'statuses': {},
+            'latency': LatencyHistogram()}
+
+
+def _add(stats, request_record):
+    stats['requests'] += 1
+    if request_record.error is not None or (request_record.status or 0) >= 400:
+        stats['errors'] += 1
+    stats['retries'] += request_record.retries
+    if request_record.cache == 'hit':
+        stats['cache_hits'] += 1
+    elif request_record.cache == 'miss':
+        stats['cache_misses'] += 1
+    stats['bytes_sent'] += request_record.bytes_sent or 0
+    stats['bytes_received'] += request_record.bytes_received or 0
+    stats['queue_wait'] += request_record.queue_wait
+    stats['backoff'] += request_record.backoff
+    status = str(request_record.status if request_record.error is None else request_record.error)
+    stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+    stats['latency'].add(request_record.latency)
+
+
+def _summarize(stats):
+    latency = stats['latency']
+    summary = {key: value for key, value in stats.items() if key != 'latency'}
+    summary['statuses'] = dict(stats['statuses'])
+    summary.update(total_latency=latency.total, mean=latency.mean(), p50=latency.percentile(50),
+                   p90=latency.percentile(90), p99=latency.percentile(99), max=latency.maximum)
+    return summary
+
+
+def _ms(seconds):
+    return '-' if seconds is None else f'{seconds * 1000:.0f}'
@@ -0,0 +1,283 @@
+"""
+Request scheduling for the Garmin Connect client: throttled (429) or failed
+(5xx) requests are retried with jittered exponential backoff and, when they
+are set, a token bucket caps the request rate and an adaptive limit caps the
+requests in flight. Both limits follow AIMD (additive increase,
+multiplicative decrease) so the client settles at the highest throughput
+Garmin Connect sustains.
+"""
+import logging
+import random
+import threading
+import time
+import requests
+import urllib3
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+LOG = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# methods that can be sent twice without a second effect on the server, the
+# others (e.g. an upload POST) are only retried when the server can't have
+# acted on them: a 429 or a failure to connect
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class RequestScheduler():
+    """Schedules the requests of a client, thread safe so one scheduler
+    paces all the worker threads of a client (or several clients sharing
+    it).
+
+    Every success whose latency is under `target_latency` adds about
+    `increase` to the concurrency limit per window of requests in flight
+    and about `increase` requests per second to the rate per second of
+    successes. A slow success, a 5xx or a connection error multiplies the
+    concurrency limit by `decrease`, a 429 (throttled) multiplies both the
+    concurrency limit and the rate by `decrease`. Decreases happen at most
+    once per `cooldown` seconds, so a burst of failures of requests sent
+    together only counts once. Throttled and failed requests are retried,
+    non-idempotent ones (POST) only after a 429 or a failure to connect.
+
+    With the defaults there is no rate or concurrency limit, the scheduler
+    only retries and the callers' `workers` set the requests in flight.
+
+    Parameters:
+        rate (float): initial requests per second, None for no rate limit
+        burst (int): token bucket size, the number of requests that can be
+            sent at once after an idle period
+        max_rate (float): the rate never grows above this, None for no cap
+        min_rate (float): the rate never shrinks below this
+        concurrency (int): initial number of requests in flight, None for no
+            concurrency limit
+        max_concurrency (int): the concurrency limit never grows above this,
+            None for no cap
+        target_latency (float): seconds, slower successes are treated as a
+            sign of congestion
+        max_retries (int): retries of a throttled or failed request before
+            its last response is returned (or its error raised)
+        backoff_base (float): seconds, the backoff before retry `n` is drawn
+            uniformly from [0, backoff_base * 2**n] (full jitter) and is at
+            least the server's Retry-After
+        backoff_max (float): seconds, cap of the backoff
+        increase (float): additive increase step
+        decrease (float): multiplicative decrease factor, 0 - 1
+        cooldown (float): seconds between two multiplicative decreases
+
+    Examples:
+
+    >>> scheduler = RequestScheduler(rate=5, max_rate=20, concurrency=4, max_concurrency=8)
+    >>> client = ClientGarmin(scheduler=scheduler)
+    >>> report = client.download_activities(ids, formats=('gpx',), workers=16)
+    >>> scheduler.rate, scheduler.concurrency
+    """
+
+    def __init__(self, rate=None, burst=10, max_rate=None, min_rate=0.5,
+                 concurrency=None, max_concurrency=None, target_latency=5.0,
+                 max_retries=5, backoff_base=0.5, backoff_max=60.0,
+                 increase=1.0, decrease=0.5, cooldown=1.0):
+        """Initialize RequestScheduler class"""
+
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.concurrency = float(concurrency) if concurrency is not None else None
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._last_decrease = float('-inf')
+
+    def run(self, send, rewind=None, timings=None, method='GET'):
+        """
+        send a request under the rate and concurrency limits, retrying it
+        while it's throttled or fails with a 5xx / connection error
+
+        Parameters:
+            send (callable): sends the request and returns the response
+            rewind (callable): called before a retry, e.g. to seek uploaded
+                files back to their start
+            timings (dict): if given, the seconds spent waiting for a slot
+                and a token and sleeping between retries are added to its
+                `queue_wait` and `backoff` keys
+            method (str): HTTP method of the request, a method that isn't in
+                `IDEMPOTENT_METHODS` is only retried after a 429 or when
+                the connection couldn't be made
+
+        Returns:
+            response: the first response that isn't retried, its `retries`
+                attribute holds the number of retries it took
+        """
+        if timings is None:
+            timings = {}
+        timings.setdefault('queue_wait', 0.0)
+        timings.setdefault('backoff', 0.0)
+        for attempt in range(self.max_retries + 1):
+            queued = time.monotonic()
+            self._acquire()
+            start = time.monotonic()
+            timings['queue_wait'] += start - queued
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self._release()
+                delay = retry_delay(attempt, method, error=error, max_retries=self.max_retries,
+                                    backoff_base=self.backoff_base, backoff_max=self.backoff_max)
+                if delay is None:
+                    raise
+                LOG.warning(f"request failed ({error}), retry {attempt + 1} of {self.max_retries}")
+                self._on_congestion(throttled=False)
+                self._sleep(delay, timings)
+            else:
+                self._release()
+                latency = time.monotonic() - start
+                delay = retry_delay(attempt, method, response=response, max_retries=self.max_retries,
+                                    backoff_base=self.backoff_base, backoff_max=self.backoff_max)
+                if delay is None:
+                    if response.status_code in RETRY_STATUS_CODES:
+                        self._on_congestion(throttled=response.status_code == 429)
+                    else:
+                        self._on_success(latency)
+                    response.retries = attempt
+                    return response
+                LOG.warning(f"{response.status_code} response for {response.url}, "
+                            f"retry {attempt + 1} of {self.max_retries}")
+                self._on_congestion(throttled=response.status_code == 429)
+                response.close()
+                self._sleep(delay, timings)
+            if rewind is not None:
+                rewind()
+
+    def _sleep(self, seconds, timings):
+        time.sleep(seconds)
+        timings['backoff'] += seconds
+
+    def _acquire(self):
+        """
+        wait for a free slot under the concurrency limit and a token
+        """
+        with self._condition:
+            while self.concurrency is not None and self._in_flight >= int(self.concurrency):
+                self._condition.wait()
+            self._in_flight += 1
+            if self.rate is None:
+                return
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                self._condition.wait((1 - self._tokens) / self.rate)
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _on_success(self, latency):
+        with self._condition:
+            if latency > self.target_latency:
+                self._on_congestion_locked(throttled=False)
+                return
+            if self.concurrency is not None:
+                self.concurrency = _capped(self.concurrency + self.increase / self.concurrency,
+                                           self.max_concurrency)
+            if self.rate is not None:
+                self.rate = _capped(self.rate + self.increase / self.rate, self.max_rate)
+            self._condition.notify_all()
+
+    def _on_congestion(self, throttled):
+        with self._condition:
+            self._on_congestion_locked(throttled)
+
+    def _on_congestion_locked(self, throttled):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        if self.concurrency is not None:
+            self.concurrency = max(1.0, self.concurrency * self.decrease)
+        if throttled and self.rate is not None:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+        LOG.info(f"backing off: concurrency {self.concurrency}, rate {self.rate} requests/s")
+
+
+def retry_delay(attempt, method, response=None, error=None, max_retries=5, backoff_base=0.5,
+                backoff_max=60.0):
+    """
+    the retry rules of the Garmin Connect clients (blocking and asyncio):
+    throttled (429) and failed (5xx) responses and connection errors are
+    retried, the ones of a method that isn't in `IDEMPOTENT_METHODS` only
+    after a 429 or when the connection couldn't be made. The backoff is
+    drawn uniformly from [0, backoff_base * 2**attempt] (full jitter), capped
+    at `backoff_max` and at least the server's Retry-After
+
+    Parameters:
+        attempt (int): number of retries so far, 0 after the first try
+        method (str): HTTP method of the request
+        response: the response, with `status_code` and `headers`
+        error (Exception): the requests or aiohttp exception raised instead
+        max_retries (int): retries before giving up
+        backoff_base (float): seconds
+        backoff_max (float): seconds
+
+    Returns:
+        delay (float): seconds to wait before the retry, None if the request
+            isn't retried
+    """
+    if attempt >= max_retries:
+        return None
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    backoff = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+    if error is not None:
+        return backoff if idempotent or _not_connected(error) else None
+    status = response.status_code
+    if status not in RETRY_STATUS_CODES or not (idempotent or status == 429):
+        return None
+    return max(backoff, _retry_after(response))
+
+
+def _retry_after(response):
+    """
+    seconds of a numeric Retry-After header, 0 if there is none
+    """
+    try:
+        return max(0.0, float(response.headers.get('Retry-After', 0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _capped(value, cap):
+    return value if cap is None else min(cap, value)
+
+
+def _not_connected(error):
+    """
+    True if a request failed before its connection was made (connect
+    timeout, refused connection, unresolved host name), so the server never
+    received it
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if aiohttp is not None and isinstance(error, (aiohttp.ClientConnectorError,
+                                                  aiohttp.ConnectionTimeoutError)):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    # NameResolutionError is a NewConnectionError
+    return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
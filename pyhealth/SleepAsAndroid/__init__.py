@@ -6,3 +6,6 @@ push or pull with.
 """
 
 from .utils_sleepasandroid import *
+from .dataset_sleepasandroid import *
+from .cache_sleepasandroid import *
+from .analysis_sleepasandroid import *
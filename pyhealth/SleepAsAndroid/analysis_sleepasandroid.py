@@ -0,0 +1,228 @@
+"""
+Vectorized statistics over all the nights of a `SleepDataset`. Every function
+works on the flat event / actigraphy arrays and their per night offsets, so
+no python objects are built per night or per sample.
+"""
+import itertools
+from collections import namedtuple
+import numpy as np
+from .utils_sleepasandroid import iter_sleepasandroid_records, EVENT_CODES
+from .dataset_sleepasandroid import SleepDataset
+
+RestingHeartRate = namedtuple('SasA_RestingHeartRate', ['night_id', 'date',
+                                                        'percentiles', 'values',
+                                                        'nsamples'])
+
+MovementDensity = namedtuple('SasA_MovementDensity', ['night_id', 'date', 'mean',
+                                                      'restless_fraction',
+                                                      'nsamples'])
+
+# one row per restless period, `start_minute` / `end_minute` are the times of
+# the first and last actigraphy value of the period after the night's start
+RESTLESS_DTYPE = np.dtype([('night', np.int64), ('night_id', np.int64),
+                           ('start_minute', np.int16), ('end_minute', np.int16),
+                           ('nintervals', np.int32), ('peak', np.float32)])
+
+
+def resting_heart_rate(dataset, percentiles=(0, 5), method='exact',
+                       bin_width=0.5, hr_range=(20, 250)):
+    """
+    per night resting heart rate statistics computed in one pass over the
+    heart rate samples of all nights. The minimum (0th percentile) and the 5th
+    percentile are the usual resting heart rate estimates, the 5th percentile
+    being less noisy.
+
+    Parameters:
+        dataset (SleepDataset): parsed SleepAsAndroid backup
+        percentiles (tuple of float): percentiles to compute, 0 - 100
+        method (str): `exact` uses a segmented sort of all the samples and
+            interpolates like `np.percentile`. `histogram` counts the samples
+            into fixed bins per night and returns the center of the bin
+            holding the percentile's sample (no interpolation). It is
+            approximate but only needs memory per night and not per sample
+        bin_width (float): bin width in bpm for the `histogram` method
+        hr_range (tuple): (min, max) bpm covered by the `histogram` bins,
+            samples outside are clipped into the first / last bin
+
+    Returns:
+        resting_hr (namedtuple 'RestingHeartRate'): for the nights with heart
+            rate samples
+            night_id (np.ndarray): record Id of the night
+            date (np.ndarray): datetime64[D] start date of the night
+            percentiles (tuple): the percentiles computed
+            values (np.ndarray): float array (nights x percentiles)
+            nsamples (np.ndarray): number of heart rate samples of the night
+    """
+    is_hr = (dataset.events['event'] == EVENT_CODES['HR']) & ~np.isnan(dataset.events['value'])
+    hr_values = dataset.events['value'][is_hr].astype(np.float64)
+    night_idx = dataset.event_night_index()[is_hr]
+    nsamples = np.bincount(night_idx, minlength=len(dataset))
+    has_hr = nsamples > 0
+    fractions = np.asarray(percentiles, dtype=np.float64) / 100.0
+
+    if method == 'exact':
+        values = _segmented_percentiles(hr_values, night_idx, nsamples[has_hr], fractions)
+    elif method == 'histogram':
+        values = _histogram_percentiles(hr_values, night_idx, len(dataset), fractions,
+                                        bin_width, hr_range)[has_hr]
+    else:
+        raise ValueError(f'unknown method {method}, use `exact` or `histogram`')
+
+    nights = dataset.nights[has_hr]
+    return RestingHeartRate(night_id=nights['id'],
+                            date=nights['start'].astype('datetime64[D]'),
+                            percentiles=tuple(percentiles),
+                            values=values,
+                            nsamples=nsamples[has_hr])
+
+
+def iter_resting_heart_rate(saa_file, percentiles=(0, 5), chunk_nights=256,
+                            bin_width=0.5, hr_range=(20, 250)):
+    """
+    stream resting heart rate statistics for an unbounded history. The backup
+    is read `chunk_nights` records at a time and each chunk is reduced with
+    the approximate `histogram` method, so memory stays flat no matter how
+    many nights the backup holds.
+
+    Parameters:
+        saa_file (str, path, or text stream): SleepAsAndroid backup
+        percentiles (tuple of float): percentiles to compute, 0 - 100
+        chunk_nights (int): number of records parsed at a time
+        bin_width (float): histogram bin width in bpm
+        hr_range (tuple): (min, max) bpm covered by the histogram bins
+
+    Yields:
+        resting_hr (namedtuple 'RestingHeartRate'): statistics for the nights
+            of one chunk (in the order of the chunk's start times)
+    """
+    records = iter_sleepasandroid_records(saa_file)
+    while True:
+        chunk = list(itertools.islice(records, chunk_nights))
+        if not chunk:
+            return
+        yield resting_heart_rate(SleepDataset.from_records(chunk), percentiles,
+                                 method='histogram', bin_width=bin_width,
+                                 hr_range=hr_range)
+
+
+def movement_density(dataset, threshold):
+    """
+    per night movement statistics from the 5 minute actigraphy values of all
+    nights, computed with segmented reductions over the flat actigraphy array
+
+    Parameters:
+        dataset (SleepDataset): parsed SleepAsAndroid backup
+        threshold (float): actigraphy value above which an interval counts as
+            restless
+
+    Returns:
+        density (namedtuple 'MovementDensity'): for the nights with
+            actigraphy values
+            night_id (np.ndarray): record Id of the night
+            date (np.ndarray): datetime64[D] start date of the night
+            mean (np.ndarray): mean actigraphy value of the night
+            restless_fraction (np.ndarray): fraction of the intervals above
+                `threshold`
+            nsamples (np.ndarray): number of (non empty) actigraphy values
+    """
+    actigraphy = dataset.actigraphy
+    valid = ~np.isnan(actigraphy)
+    starts = dataset.actigraphy_offsets[:-1]
+    has_values = np.diff(dataset.actigraphy_offsets) > 0
+    starts = starts[has_values]
+
+    nsamples = np.add.reduceat(valid.astype(np.int64), starts) if len(starts) else np.zeros(0, np.int64)
+    totals = np.add.reduceat(np.where(valid, actigraphy, 0).astype(np.float64), starts) \
+        if len(starts) else np.zeros(0)
+    restless = np.add.reduceat((actigraphy > threshold).astype(np.int64), starts) \
+        if len(starts) else np.zeros(0, np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = totals / nsamples
+        restless_fraction = restless / nsamples
+
+    nights = dataset.nights[has_values]
+    return MovementDensity(night_id=nights['id'],
+                           date=nights['start'].astype('datetime64[D]'),
+                           mean=mean,
+                           restless_fraction=restless_fraction,
+                           nsamples=nsamples)
+
+
+def restless_periods(dataset, threshold, min_intervals=2):
+    """
+    find the restless periods (runs of consecutive actigraphy values above
+    `threshold`) of all nights in one vectorized pass. Runs never span two
+    nights.
+
+    Parameters:
+        dataset (SleepDataset): parsed SleepAsAndroid backup
+        threshold (float): actigraphy value above which an interval counts as
+            restless
+        min_intervals (int): minimum number of consecutive restless intervals
+            (5 minutes each) for a period
+
+    Returns:
+        periods (np.ndarray of `RESTLESS_DTYPE`): one row per period with the
+            night index into `dataset.nights`, the night's record Id, the
+            start / end minute after the night's start, the number of
+            intervals and the peak actigraphy value
+    """
+    actigraphy = dataset.actigraphy
+    night_idx = dataset.actigraphy_night_index()
+    restless = actigraphy > threshold
+    # linked[i]: values i and i + 1 are both restless and in the same night
+    linked = restless[:-1] & restless[1:] & (night_idx[:-1] == night_idx[1:])
+    starts = np.flatnonzero(restless & ~np.concatenate(([False], linked)))
+    ends = np.flatnonzero(restless & ~np.concatenate((linked, [False])))
+    nintervals = ends - starts + 1
+    keep = nintervals >= min_intervals
+    starts = starts[keep]
+    ends = ends[keep]
+
+    periods = np.empty(len(starts), dtype=RESTLESS_DTYPE)
+    periods['night'] = night_idx[starts]
+    periods['night_id'] = dataset.nights['id'][periods['night']]
+    periods['start_minute'] = dataset.actigraphy_minutes[starts]
+    periods['end_minute'] = dataset.actigraphy_minutes[ends]
+    periods['nintervals'] = nintervals[keep]
+    if len(starts):
+        # reduce over [start, end] pairs, the odd entries span the gaps
+        bounds = np.column_stack((starts, ends + 1)).ravel()
+        periods['peak'] = np.maximum.reduceat(np.append(actigraphy, 0), bounds)[::2]
+    return periods
+
+
+def _segmented_percentiles(values, segment_idx, counts, fractions):
+    """
+    percentiles (linear interpolation) of every segment of `values`, segments
+    are sorted once with a single lexsort on (segment, value)
+    """
+    order = np.lexsort((values, segment_idx))
+    sorted_values = values[order]
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    positions = starts[:, None] + fractions[None, :] * (counts[:, None] - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    weight = positions - lower
+    return sorted_values[lower] * (1.0 - weight) + sorted_values[upper] * weight
+
+
+def _histogram_percentiles(values, segment_idx, nsegments, fractions, bin_width,
+                           hr_range):
+    """
+    approximate percentiles of every segment from fixed width histograms,
+    returns the center of the bin holding the percentile
+    """
+    nbins = int(np.ceil((hr_range[1] - hr_range[0]) / bin_width))
+    bins = np.clip(((values - hr_range[0]) / bin_width).astype(np.int64), 0, nbins - 1)
+    counts = np.bincount(segment_idx * nbins + bins,
+                         minlength=nsegments * nbins).reshape(nsegments, nbins)
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1:]
+    # rank of the percentile sample (0 based) like np.percentile's lower index
+    ranks = np.floor(fractions[None, :] * np.maximum(totals - 1, 0))
+    result = np.empty((nsegments, len(fractions)))
+    for idx in range(len(fractions)):
+        result[:, idx] = (cumulative <= ranks[:, idx:idx + 1]).sum(axis=1)
+    return hr_range[0] + (result + 0.5) * bin_width
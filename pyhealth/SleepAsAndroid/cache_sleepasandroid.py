@@ -0,0 +1,165 @@
+"""
+On disk cache for parsed SleepAsAndroid backups. Every cached file is stored
+as a directory of `.npy` arrays plus a small json manifest, so repeat loads
+memory map the arrays instead of parsing the csv again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from ..utils_files import file_digest
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class ParseCache():
+    """A size bounded, least recently used, on disk cache of parsed files.
+
+    Entries are keyed by the absolute file path and validated against the
+    file size, modification time and content hash. When the size or mtime
+    changed the content hash is checked, so a touched but otherwise unchanged
+    file is still served from the cache. Entries written by a different
+    parser version are discarded.
+
+    Parameters:
+        cache_dir (str or path): directory to store the cache in
+        max_bytes (int): size cap of the cache, the least recently used
+            entries are evicted once it's exceeded
+        version (int or str): parser version, entries with another version
+            are invalid
+
+    Examples:
+
+    >>> cache = ParseCache('~/.cache/pyhealth', version=1)
+    >>> arrays = cache.get('SleepAsAndroid_data.csv')
+    >>> if arrays is None:
+    >>>     arrays = parse('SleepAsAndroid_data.csv')
+    >>>     cache.put('SleepAsAndroid_data.csv', arrays)
+    """
+
+    def __init__(self, cache_dir, max_bytes=2**30, version=None):
+        """Initialize ParseCache class"""
+
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_bytes = max_bytes
+        self.version = version
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, source_file, validate=True):
+        """
+        return the cached arrays for `source_file` as read only memory maps or
+        None if there is no valid entry
+
+        Parameters:
+            source_file (str or path): the file that was parsed
+            validate (bool): if False, also return the arrays when the file
+                changed since they were cached (e.g. to update them
+                incrementally). Entries of another parser version are never
+                returned
+
+        Returns:
+            arrays (dict): array name -> np.memmap, or None
+        """
+        entry_dir = self._entry_dir(source_file)
+        manifest = _read_manifest(entry_dir)
+        if manifest is None:
+            return None
+        if manifest['version'] != self.version:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        stat = os.stat(source_file)
+        changed = (stat.st_size, stat.st_mtime_ns) != (manifest['size'], manifest['mtime_ns'])
+        if validate and changed:
+            if stat.st_size != manifest['size'] or file_digest(source_file) != manifest['digest']:
+                return None
+            manifest['mtime_ns'] = stat.st_mtime_ns
+
+        arrays = {name: np.load(os.path.join(entry_dir, f'{name}.npy'), mmap_mode='r')
+                  for name in manifest['arrays']}
+        manifest['last_access'] = time.time()
+        _write_manifest(entry_dir, manifest)
+        return arrays
+
+    def put(self, source_file, arrays):
+        """
+        store the parsed arrays of `source_file` and evict old entries if the
+        cache grew past `max_bytes`
+
+        Parameters:
+            source_file (str or path): the file that was parsed
+            arrays (dict): array name -> np.ndarray (no object dtypes)
+        """
+        stat = os.stat(source_file)
+        manifest = {'version': self.version,
+                    'path': os.path.abspath(source_file),
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'digest': file_digest(source_file),
+                    'arrays': list(arrays),
+                    'nbytes': int(sum(array.nbytes for array in arrays.values())),
+                    'last_access': time.time()}
+
+        # the arrays and manifest go into a scratch directory that is renamed
+        # into place, readers only ever see a complete entry
+        entry_dir = self._entry_dir(source_file)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f'{name}.npy'), array, allow_pickle=False)
+            _write_manifest(tmp_dir, manifest)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self._evict(keep=entry_dir)
+
+    def clear(self):
+        """
+        remove all the entries from the cache
+        """
+        for name in os.listdir(self.cache_dir):
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+
+    def _entry_dir(self, source_file):
+        key = hashlib.sha1(os.path.abspath(source_file).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def _evict(self, keep=None):
+        """
+        delete the least recently used entries until the cache fits in
+        `max_bytes`, the entry `keep` is never evicted
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            manifest = _read_manifest(entry_dir)
+            if manifest is not None:
+                entries.append((manifest['last_access'], manifest['nbytes'], entry_dir))
+        total = sum(nbytes for _, nbytes, _ in entries)
+        for _, nbytes, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry_dir == keep:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= nbytes
+
+
+def _read_manifest(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(entry_dir, manifest):
+    tmp_name = os.path.join(entry_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp_name, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(tmp_name, os.path.join(entry_dir, MANIFEST_NAME))
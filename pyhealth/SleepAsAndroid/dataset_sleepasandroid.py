@@ -0,0 +1,537 @@
+"""
+Columnar storage for a complete SleepAsAndroid backup. Every night is one
+row of the `nights` structured array, the events and actigraphy values of all
+nights are stored as flat concatenated arrays with per night offset arrays
+(like a CSR matrix), so selecting data for a range of nights is an array slice.
+"""
+import hashlib
+import io
+import itertools
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .cache_sleepasandroid import ParseCache
+from .utils_sleepasandroid import (iter_sleepasandroid_records,
+                                   sleepasandroid_header_schema,
+                                   decode_sleepasandroid_events,
+                                   parse_sleepasandroid_actigraphy,
+                                   EVENT_CODES, EVENT_DTYPE)
+
+# bump whenever the parsed output changes, invalidates cached datasets
+PARSER_VERSION = 2
+
+# one row per night, `start` and `end` are local (wall clock) times
+NIGHT_DTYPE = np.dtype([('id', np.int64), ('tz', 'U40'),
+                        ('start', 'datetime64[m]'), ('end', 'datetime64[m]'),
+                        ('hours', np.float32), ('cycles', np.int16),
+                        ('deep_sleep', np.float32), ('noise', np.float32),
+                        ('snore', np.int32)])
+
+# how much of the source file a dataset covers: the byte offset parsed up to
+# and a digest of the bytes just before it, used by `update_sleep_dataset`
+SOURCE_DTYPE = np.dtype([('offset', np.int64), ('tail_digest', 'S32')])
+
+
+class SleepDataset():
+    """Columnar representation of all the nights in a SleepAsAndroid backup.
+
+    Nights are sorted by their start time. The events for night `idx` are
+    `events[event_offsets[idx]:event_offsets[idx + 1]]` and the same layout is
+    used for the actigraphy values, so a contiguous range of nights maps to
+    one contiguous slice of the flat arrays.
+
+    Parameters:
+        nights (np.ndarray): structured array of `NIGHT_DTYPE`
+        events (np.ndarray): structured array of `EVENT_DTYPE` for all nights
+        event_offsets (np.ndarray): int64 array of len(nights) + 1 offsets
+            into `events`
+        actigraphy (np.ndarray): float32 actigraphy values for all nights
+        actigraphy_offsets (np.ndarray): int64 array of len(nights) + 1
+            offsets into `actigraphy`
+        actigraphy_minutes (np.ndarray): int16 time of every actigraphy value
+            in minutes after the start of its night (same offsets)
+        source (np.ndarray): optional one element array of `SOURCE_DTYPE`
+            describing how much of the backup file has been parsed
+
+    Examples:
+
+    All the heart rate samples from nights in March 2018
+
+    >>> dataset = load_sleep_dataset('SleepAsAndroid_data.csv')
+    >>> hr = dataset.events_between('2018-03-01', '2018-04-01', event='HR')
+    >>> hr['value']
+    """
+
+    def __init__(self, nights, events, event_offsets, actigraphy,
+                 actigraphy_offsets, actigraphy_minutes, source=None):
+        """Initialize SleepDataset class"""
+
+        self.nights = nights
+        self.events = events
+        self.event_offsets = event_offsets
+        self.actigraphy = actigraphy
+        self.actigraphy_offsets = actigraphy_offsets
+        self.actigraphy_minutes = actigraphy_minutes
+        self.source = source
+
+    def __len__(self):
+        return len(self.nights)
+
+    def __repr__(self):
+        return (f'SleepDataset(nights={len(self.nights)}, '
+                f'events={len(self.events)}, '
+                f'actigraphy={len(self.actigraphy)})')
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        build a dataset from (header_row, value_row) record pairs, e.g. from
+        `iter_sleepasandroid_records`. Manually added records have no sleep
+        data and are skipped.
+
+        Parameters:
+            records (iterable): (header_row, value_row) pairs
+
+        Returns:
+            SleepDataset
+        """
+        nights = []
+        events = []
+        actigraphy = []
+        actigraphy_minutes = []
+        nmanual = 0
+        for header, values in records:
+            schema = sleepasandroid_header_schema(header)
+            columns = schema.columns
+            if 'manually added' in _cell(values, columns, 'comment').lower():
+                nmanual += 1
+                continue
+            nights.append((int(float(values[columns['id']])),
+                           values[columns['tz']],
+                           _parse_datetime(values[columns['from']]),
+                           _parse_datetime(values[columns['to']]),
+                           _to_float(_cell(values, columns, 'hours')),
+                           _to_int(_cell(values, columns, 'cycles')),
+                           _to_float(_cell(values, columns, 'deepsleep')),
+                           _to_float(_cell(values, columns, 'noise')),
+                           _to_int(_cell(values, columns, 'snore'))))
+            events.append(decode_sleepasandroid_events(values[schema.event_columns]))
+            values_minutes = parse_sleepasandroid_actigraphy(header, values, schema)
+            actigraphy.append(values_minutes[0])
+            actigraphy_minutes.append(values_minutes[1])
+        if nmanual:
+            warnings.warn(f'skipped {nmanual} manually added records without '
+                          'sleep data')
+
+        dataset = cls(np.array(nights, dtype=NIGHT_DTYPE),
+                      _concatenate(events, EVENT_DTYPE), _offsets(events),
+                      _concatenate(actigraphy, np.float32), _offsets(actigraphy),
+                      _concatenate(actigraphy_minutes, np.int16))
+        return dataset.take(np.argsort(dataset.nights['start'], kind='stable'))
+
+    @classmethod
+    def concatenate(cls, datasets):
+        """
+        merge several datasets into one. Nights are de-duplicated by their
+        record Id (the first dataset containing an Id wins) and sorted by
+        start time.
+
+        Parameters:
+            datasets (list of SleepDataset): datasets to merge
+
+        Returns:
+            SleepDataset
+        """
+        datasets = list(datasets)
+        if not datasets:
+            return cls.from_records([])
+        merged = cls(np.concatenate([dataset.nights for dataset in datasets]),
+                     np.concatenate([dataset.events for dataset in datasets]),
+                     _concatenate_offsets([dataset.event_offsets for dataset in datasets]),
+                     np.concatenate([dataset.actigraphy for dataset in datasets]),
+                     _concatenate_offsets([dataset.actigraphy_offsets for dataset in datasets]),
+                     np.concatenate([dataset.actigraphy_minutes for dataset in datasets]))
+        _, first = np.unique(merged.nights['id'], return_index=True)
+        keep = np.sort(first)
+        return merged.take(keep[np.argsort(merged.nights['start'][keep], kind='stable')])
+
+    def take(self, indices):
+        """
+        return a new dataset with the nights at `indices` (in that order)
+
+        Parameters:
+            indices (np.ndarray): int array of night indexes
+
+        Returns:
+            SleepDataset
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        event_idx, event_offsets = _segment_index(self.event_offsets, indices)
+        events = self.events[event_idx]
+        actigraphy_idx, actigraphy_offsets = _segment_index(self.actigraphy_offsets, indices)
+        return type(self)(self.nights[indices], events, event_offsets,
+                          self.actigraphy[actigraphy_idx], actigraphy_offsets,
+                          self.actigraphy_minutes[actigraphy_idx])
+
+    def arrays(self):
+        """
+        return the dataset arrays by name, `SleepDataset(**arrays)` rebuilds
+        the dataset
+        """
+        arrays = {'nights': self.nights,
+                  'events': self.events,
+                  'event_offsets': self.event_offsets,
+                  'actigraphy': self.actigraphy,
+                  'actigraphy_offsets': self.actigraphy_offsets,
+                  'actigraphy_minutes': self.actigraphy_minutes}
+        if self.source is not None:
+            arrays['source'] = self.source
+        return arrays
+
+    def night_events(self, idx):
+        """
+        return the events of night `idx` (a view into `events`)
+        """
+        return self.events[self.event_offsets[idx]:self.event_offsets[idx + 1]]
+
+    def night_actigraphy(self, idx):
+        """
+        return the actigraphy values of night `idx` (a view into `actigraphy`)
+        """
+        return self.actigraphy[self.actigraphy_offsets[idx]:self.actigraphy_offsets[idx + 1]]
+
+    def night_actigraphy_minutes(self, idx):
+        """
+        return the actigraphy times (minutes after the night's start) of night
+        `idx` (a view into `actigraphy_minutes`)
+        """
+        return self.actigraphy_minutes[self.actigraphy_offsets[idx]:self.actigraphy_offsets[idx + 1]]
+
+    def actigraphy_night_index(self):
+        """
+        return the index of the night each entry of `actigraphy` belongs to
+        """
+        return np.repeat(np.arange(len(self.nights)), np.diff(self.actigraphy_offsets))
+
+    def night_range(self, from_date=None, until_date=None):
+        """
+        return the slice of nights that start in [from_date, until_date)
+
+        Parameters:
+            from_date (str or datetime64): yyyy-mm-dd, or None for the first night
+            until_date (str or datetime64): yyyy-mm-dd, or None for the last night
+
+        Returns:
+            slice
+        """
+        starts = self.nights['start']
+        first = 0
+        last = len(starts)
+        if from_date is not None:
+            first = np.searchsorted(starts, np.datetime64(from_date, 'm'), side='left')
+        if until_date is not None:
+            last = np.searchsorted(starts, np.datetime64(until_date, 'm'), side='left')
+        return slice(int(first), int(max(first, last)))
+
+    def events_between(self, from_date=None, until_date=None, event=None):
+        """
+        return the events of the nights that start in [from_date, until_date)
+
+        Parameters:
+            from_date (str or datetime64): yyyy-mm-dd, or None for the first night
+            until_date (str or datetime64): yyyy-mm-dd, or None for the last night
+            event (str): optional event name (e.g. `HR`) to select
+
+        Returns:
+            events (np.ndarray of `EVENT_DTYPE`): a view into `events` if no
+                event name is given
+        """
+        nights = self.night_range(from_date, until_date)
+        events = self.events[self.event_offsets[nights.start]:self.event_offsets[nights.stop]]
+        if event is not None:
+            events = events[events['event'] == EVENT_CODES[event]]
+        return events
+
+    def event_night_index(self):
+        """
+        return the index of the night each entry of `events` belongs to
+        """
+        return np.repeat(np.arange(len(self.nights)), np.diff(self.event_offsets))
+
+
+def load_sleep_dataset(saa_file, cache_dir=None, max_cache_bytes=2**30,
+                       incremental=True):
+    """
+    parse a complete SleepAsAndroid backup into a columnar `SleepDataset`
+
+    Parameters:
+        saa_file (str, path, or text stream): path to the backup file or an
+            already open text stream
+        cache_dir (str or path): optional directory of a `ParseCache`. When
+            given, the parsed arrays of `saa_file` are stored there and later
+            loads memory map them instead of parsing the file again
+        max_cache_bytes (int): size cap of the cache directory
+        incremental (bool): when the backup changed since it was cached, only
+            parse the new nights (see `update_sleep_dataset`) instead of the
+            whole file
+
+    Returns:
+        SleepDataset
+    """
+    if not isinstance(saa_file, (str, bytes, os.PathLike)):
+        return SleepDataset.from_records(iter_sleepasandroid_records(saa_file))
+    if cache_dir is None:
+        return _load_file(saa_file)
+
+    cache = ParseCache(cache_dir, max_bytes=max_cache_bytes, version=PARSER_VERSION)
+    arrays = cache.get(saa_file)
+    if arrays is not None:
+        return SleepDataset(**arrays)
+    arrays = cache.get(saa_file, validate=False) if incremental else None
+    if arrays is not None and 'source' in arrays:
+        dataset = update_sleep_dataset(SleepDataset(**arrays), saa_file)
+    else:
+        dataset = _load_file(saa_file)
+    cache.put(saa_file, dataset.arrays())
+    return dataset
+
+
+def update_sleep_dataset(dataset, saa_file):
+    """
+    parse only the nights that were added to a backup file since `dataset`
+    was loaded from it and append them to the dataset. Nights are matched by
+    their record Id, nights that are already in the dataset are not parsed
+    again.
+
+    If the file still starts with the bytes the dataset was parsed from, the
+    parser seeks to the old end of the file and reads only the appended
+    records. Otherwise the nights were added at the top of the file (the order
+    SleepAsAndroid writes its backups in, newest first) and records are read
+    from the start until the first night that is already known.
+
+    Parameters:
+        dataset (SleepDataset): dataset previously loaded from `saa_file`
+            with `load_sleep_dataset`
+        saa_file (str or path): the grown backup file
+
+    Returns:
+        SleepDataset: a new dataset with the old and the new nights
+    """
+    file_size = os.path.getsize(saa_file)
+    known_ids = set(dataset.nights['id'].tolist())
+    appended = False
+    if dataset.source is not None:
+        offset = int(dataset.source['offset'][0])
+        appended = (offset <= file_size
+                    and _tail_digest(saa_file, offset) == dataset.source['tail_digest'][0])
+
+    if appended:
+        with open(saa_file, 'rb') as file:
+            file.seek(offset)
+            text = file.read(file_size - offset).decode('utf-8')
+        new_nights = SleepDataset.from_records(
+            iter_sleepasandroid_records(io.StringIO(text, newline='')))
+    else:
+        with open(saa_file, newline='') as file:
+            records = itertools.takewhile(lambda record: _record_id(record) not in known_ids,
+                                          iter_sleepasandroid_records(file))
+            new_nights = SleepDataset.from_records(records)
+
+    is_new = ~np.isin(new_nights.nights['id'], dataset.nights['id'])
+    updated = SleepDataset.concatenate([dataset, new_nights.take(np.flatnonzero(is_new))])
+    updated.source = _source_state(saa_file, file_size)
+    return updated
+
+
+def parse_sleepasandroid_files(saa_files, workers=None, chunk_size=16 * 2**20):
+    """
+    parse several SleepAsAndroid backups (e.g. from different phones or years)
+    in parallel into one `SleepDataset`. Every file is split into byte range
+    chunks aligned on the record header lines (`Id,...`) and the chunks are
+    parsed with a process pool. Workers send their results back as the compact
+    `SleepDataset` arrays, which are merged and de-duplicated by record Id.
+
+    Parameters:
+        saa_files (list of str or path): SleepAsAndroid backup files, when a
+            night is in several files the first file listed wins
+        workers (int): number of worker processes, defaults to the number of
+            CPUs. `workers=1` parses in the calling process
+        chunk_size (int): approximate number of bytes parsed per task
+
+    Returns:
+        SleepDataset
+    """
+    tasks = []
+    for saa_file in saa_files:
+        bounds = _record_chunk_bounds(saa_file, chunk_size)
+        tasks.extend((saa_file, start, end) for start, end in zip(bounds[:-1], bounds[1:]))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+
+    if workers <= 1:
+        datasets = [_parse_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            datasets = list(executor.map(_parse_chunk, *zip(*tasks)))
+    return SleepDataset.concatenate(datasets)
+
+
+def _record_chunk_bounds(saa_file, chunk_size):
+    """
+    byte offsets that split a backup file into chunks of about `chunk_size`
+    bytes, every chunk (except possibly the first) starts on a record header
+    """
+    file_size = os.path.getsize(saa_file)
+    bounds = [0]
+    with open(saa_file, 'rb') as file:
+        target = chunk_size
+        while target < file_size:
+            start = _next_record_start(file, target)
+            if start >= file_size:
+                break
+            bounds.append(start)
+            target = start + chunk_size
+    bounds.append(file_size)
+    return bounds
+
+
+def _next_record_start(file, offset, block_size=2**16):
+    """
+    offset of the first record header line starting after `offset`
+    """
+    file.seek(offset)
+    carry = b''
+    position = offset
+    while True:
+        block = file.read(block_size)
+        if not block:
+            return position + len(carry)
+        data = carry + block
+        idx = data.find(b'\nId,')
+        if idx >= 0:
+            return position + idx + 1
+        # keep the tail in case the marker spans two blocks
+        carry = data[-3:]
+        position += len(data) - len(carry)
+
+
+def _parse_chunk(saa_file, start, end):
+    """
+    parse the records in the byte range [start, end) of a backup file
+    """
+    with open(saa_file, 'rb') as file:
+        file.seek(start)
+        text = file.read(end - start).decode('utf-8')
+    return load_sleep_dataset(io.StringIO(text, newline=''))
+
+
+def _load_file(saa_file):
+    """
+    parse a backup file and remember how much of it was parsed
+    """
+    file_size = os.path.getsize(saa_file)
+    dataset = SleepDataset.from_records(iter_sleepasandroid_records(saa_file))
+    dataset.source = _source_state(saa_file, file_size)
+    return dataset
+
+
+def _source_state(saa_file, offset):
+    return np.array([(offset, _tail_digest(saa_file, offset))], dtype=SOURCE_DTYPE)
+
+
+def _tail_digest(saa_file, offset, tail_size=4096):
+    """
+    digest of the `tail_size` bytes of a file that end at `offset`
+    """
+    with open(saa_file, 'rb') as file:
+        file.seek(max(0, offset - tail_size))
+        tail = file.read(min(offset, tail_size))
+    return hashlib.blake2b(tail, digest_size=16).hexdigest().encode('ascii')
+
+
+def _record_id(record):
+    header, values = record
+    return int(float(values[sleepasandroid_header_schema(header).columns['id']]))
+
+
+def _cell(values, columns, name):
+    """
+    value of a named column or '' if the record doesn't have the column
+    """
+    idx = columns.get(name)
+    if idx is None or idx >= len(values):
+        return ''
+    return values[idx]
+
+
+def _to_float(cell):
+    try:
+        return float(cell)
+    except ValueError:
+        return np.nan
+
+
+def _to_int(cell):
+    try:
+        return int(float(cell))
+    except ValueError:
+        return -1
+
+
+def _parse_datetime(text):
+    """
+    convert a SleepAsAndroid `DD. MM. YYYY HH:mm` date into an ISO 8601 string
+    """
+    day, month, year_time = text.split('. ')
+    year, hour_minute = year_time.split(' ')
+    hour, minute = hour_minute.split(':')
+    return f'{year}-{int(month):02d}-{int(day):02d}T{int(hour):02d}:{minute}'
+
+
+def _concatenate(arrays, dtype):
+    if not arrays:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(arrays)
+
+
+def _offsets(arrays):
+    """
+    CSR style offsets (len(arrays) + 1) for a list of arrays
+    """
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(array) for array in arrays], out=offsets[1:])
+    return offsets
+
+
+def _concatenate_offsets(offsets_list):
+    """
+    join the CSR offsets of several flat arrays that are concatenated
+    """
+    shifted = [np.zeros(1, dtype=np.int64)]
+    base = 0
+    for offsets in offsets_list:
+        shifted.append(offsets[1:] + base)
+        base += offsets[-1]
+    return np.concatenate(shifted)
+
+
+def _segment_index(offsets, order):
+    """
+    index array that reorders the segments of a CSR style flat array
+
+    Parameters:
+        offsets (np.ndarray): segment offsets into the flat array
+        order (np.ndarray): new order of the segments
+
+    Returns:
+        index, offsets: the flat array index (`values[index]` is the reordered
+            flat array) and the new offsets
+    """
+    lengths = np.diff(offsets)[order]
+    new_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    index = (np.repeat(offsets[:-1][order] - new_offsets[:-1], lengths)
+             + np.arange(new_offsets[-1]))
+    return index, new_offsets
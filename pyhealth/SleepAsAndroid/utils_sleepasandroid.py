@@ -1,4 +1,7 @@
 import csv
+import functools
+import itertools
+import os
 import warnings
 from collections import namedtuple
 import pendulum # Used for parsing date time
@@ -12,12 +15,208 @@ def read_sleepasandroid_file(saa_filename):
         file_as_list = list(csv.reader(file, delimiter=','))
     return file_as_list
 
+
+def iter_sleepasandroid_records(saa_file):
+    """
+    lazily read a SleepAsAndroid backup file one record (night) at a time.
+    Unlike `read_sleepasandroid_file` only the current record is held in
+    memory, so large multi-year backups can be processed with constant memory.
+
+    Each record in the backup starts with a header row (first cell `Id`)
+    followed by the value row. Some records have extra rows after the values
+    (e.g. noise levels), those are skipped.
+
+    Parameters:
+        saa_file (str, path, or text stream): path to the backup file or an
+            already open text stream (e.g. an open file handle or `sys.stdin`)
+
+    Yields:
+        (header_row, value_row) (tuple of lists): the header and value rows
+            for one record. The pair can be passed directly to
+            `split_sleepasandroid_record(record, 0)`
+
+    Examples:
+
+    >>> for record in iter_sleepasandroid_records('SleepAsAndroid_data.csv'):
+    >>>     split_record = split_sleepasandroid_record(record, 0)
+    """
+    if isinstance(saa_file, (str, bytes, os.PathLike)):
+        with open(saa_file, newline='') as file:
+            yield from _iter_csv_records(file)
+    else:
+        yield from _iter_csv_records(saa_file)
+
+
+def _iter_csv_records(file):
+    """
+    pair up the header and value rows of a SleepAsAndroid backup stream
+    """
+    header = None
+    for row in csv.reader(file, delimiter=','):
+        if row and row[0] == 'Id':
+            header = row
+        elif header is not None:
+            yield header, row
+            header = None
+
+# Event vocabulary, an event's code is its index in EVENT_NAMES
+EVENT_NAMES = ('UNKNOWN',
+               'LIGHT_START', 'LIGHT_END', 'DEEP_START', 'DEEP_END',
+               'REM_START', 'REM_END', 'AWAKE_START', 'AWAKE_END',
+               'HR', 'HR_HIGH_START', 'HR_HIGH_END', 'HR_LOW_START',
+               'HR_LOW_END', 'TALK', 'SNORING', 'ALARM_STARTED',
+               'ALARM_SNOOZE', 'ALARM_DISMISS', 'ALARM_EARLIEST',
+               'ALARM_LATEST', 'TRACKING_PAUSED', 'TRACKING_RESUMED',
+               'TRACKING_STOPPED_BY_USER', 'BROKEN_START', 'BROKEN_END',
+               'LOW_BATTERY')
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_NAMES)}
+
+# decoded events: event code, java timestamp (ms) and value (HR only, else nan)
+EVENT_DTYPE = np.dtype([('event', np.uint8), ('timestamp_ms', np.int64),
+                        ('value', np.float32)])
+
+# `SplitRecord` event fields in the order of the event groups
+_EVENT_GROUP_FIELDS = ('light_sleep', 'deep_sleep', 'rem_sleep', 'awake',
+                       'heart_rate', 'hr_zone', 'noise_events', 'alarms')
+
+
+def _event_group(name):
+    """
+    index into `_EVENT_GROUP_FIELDS` for an event name, events that aren't
+    part of any group (tracking, battery, ...) get the index past the end
+    """
+    if 'LIGHT' in name:
+        return 0
+    if 'DEEP' in name:
+        return 1
+    if 'REM' in name:
+        return 2
+    if 'AWAKE' in name:
+        return 3
+    if name == 'HR':
+        return 4
+    if 'HR_' in name:
+        return 5
+    if 'TALK' in name or 'SNORING' in name:
+        return 6
+    if 'ALARM' in name:
+        return 7
+    return len(_EVENT_GROUP_FIELDS)
+
+
+_EVENT_GROUPS = np.array([_event_group(name) for name in EVENT_NAMES],
+                         dtype=np.uint8)
+
+
+def decode_sleepasandroid_events(event_cells):
+    """
+    decode the `Event` cells of a record (e.g. `LIGHT_START-1534567890123` or
+    `HR-1534567890123-61.5`) into a structured array in a single pass
+
+    Parameters:
+        event_cells (list of str): the `Event` cells of a record value row
+
+    Returns:
+        events (np.ndarray of `EVENT_DTYPE`): with fields `event` (code into
+            `EVENT_NAMES`), `timestamp_ms` (int64 java timestamp) and `value`
+            (float32, only set for `HR` events otherwise nan). Events are
+            kept in the order they appear in the record.
+    """
+    parts = [cell.split('-', 2) for cell in event_cells if cell]
+    events = np.empty(len(parts), dtype=EVENT_DTYPE)
+    if not parts:
+        return events
+    names = [part[0] for part in parts]
+    events['event'] = np.fromiter(map(EVENT_CODES.get, names,
+                                      itertools.repeat(0)),
+                                  dtype=np.uint8, count=len(names))
+    events['timestamp_ms'] = np.array([part[1] for part in parts],
+                                      dtype=np.int64)
+    events['value'] = np.nan
+    value_idx = [idx for idx, part in enumerate(parts) if len(part) == 3]
+    if value_idx:
+        events['value'][value_idx] = np.array([parts[idx][2] for idx in value_idx],
+                                              dtype=np.float32)
+    if not events['event'].all():
+        unknown = {names[idx] for idx in np.flatnonzero(events['event'] == 0)}
+        warnings.warn("unrecognized events: {0}".format(sorted(unknown)))
+    return events
+
+
+def _group_events(events):
+    """
+    split decoded events into the `SplitRecord` event groups. The events are
+    stable sorted by group once, so every group is a view into the same array
+    (still in record order within the group) or None if the group is empty
+    """
+    groups = _EVENT_GROUPS[events['event']]
+    order = np.argsort(groups, kind='stable')
+    grouped = events[order]
+    bounds = np.searchsorted(groups[order],
+                             np.arange(len(_EVENT_GROUP_FIELDS) + 1))
+    return [grouped[bounds[idx]:bounds[idx + 1]] if bounds[idx + 1] > bounds[idx]
+            else None for idx in range(len(_EVENT_GROUP_FIELDS))]
+
+
+HeaderSchema = namedtuple('SasA_HeaderSchema', ['columns', 'event_columns',
+                                                  'actigraphy_columns'])
+
+
+def sleepasandroid_header_schema(header_row):
+    """
+    return the column layout for a SleepAsAndroid record header. The column
+    map is built once for every distinct header layout and cached, since most
+    records in a backup share only a handful of layouts.
+
+    A record header is laid out as the named summary columns (`Id`, `Tz`,
+    `From`, ...), followed by the actigraphy columns (labelled with the time
+    of day e.g. `2:04`) and finally the `Event` columns. The actigraphy labels
+    change every night and the number of events differs between records, so
+    the cache is keyed by the named columns only and the actigraphy and event
+    slices are located from the cached layout.
+
+    Parameters:
+        header_row (list): header row of a record (first cell is `Id`)
+
+    Returns:
+        schema (namedtuple 'HeaderSchema'):
+            columns (dict): lower case column name -> column index for the
+                named summary columns (`id`, `tz`, `from`, `to`, `hours`, ...)
+            event_columns (slice): the `Event` columns of the value row
+            actigraphy_columns (slice): the 5 minute actigraphy columns
+    """
+    n_named = 0
+    for col in header_row:
+        if col == 'Event' or ':' in col:
+            break
+        n_named += 1
+    try:
+        event_start = header_row.index('Event', n_named)
+    except ValueError:
+        event_start = len(header_row)
+    return HeaderSchema(columns=_named_column_map(tuple(header_row[:n_named])),
+                        event_columns=slice(event_start, len(header_row)),
+                        actigraphy_columns=slice(n_named, event_start))
+
+
+@functools.lru_cache(maxsize=128)
+def _named_column_map(named_columns):
+    """
+    cached lower case column name -> index map for the named header columns
+    """
+    columns = {}
+    for idx, col in enumerate(named_columns):
+        columns.setdefault(col.lower(), idx)
+    return columns
+
+
 SplitRecord = namedtuple('SasA_SplitRecord', ['start_datetime', 'end_datetime',
                                               'record_start_ms', 'record_end_ms',
                                               'light_sleep', 'deep_sleep',
                                               'rem_sleep', 'awake', 'heart_rate',
                                               'hr_zone', 'noise_events',
-                                              'alarms', 'timezone'])
+                                              'alarms', 'timezone',
+                                              'actigraphy', 'actigraphy_minutes'])
 
 
 def split_sleepasandroid_record(file_as_list, header_idx):
@@ -31,115 +230,48 @@ def split_sleepasandroid_record(file_as_list, header_idx):
         header_idx (int): The index for the header of the record to parse
 
     Returns:
-        split_record (namedtuple 'SplitRecord')
+        split_record (namedtuple 'SplitRecord'): the event fields
+            (`light_sleep`, `heart_rate`, ...) are views into one array of
+            decoded events (see `decode_sleepasandroid_events`) or None if the
+            record has no events of that type. `actigraphy` holds the 5 minute
+            movement values (float32) and `actigraphy_minutes` their time in
+            minutes after the record start (see
+            `parse_sleepasandroid_actigraphy`)
     """
     # NOTES: ID will = first event timestamp
     # Id	Tz	From	To	Sched	Hours	Rating	Comment	Framerate	Snore	Noise	Cycles	DeepSleep	LenAdjust	Geo
 
-    value_idx = header_idx + 1
-    movment_data = []
+    header = file_as_list[header_idx]
+    values = file_as_list[header_idx + 1]
+    schema = sleepasandroid_header_schema(header)
+    columns = schema.columns
+
     # check for manual entries
-    for idx, col in enumerate(file_as_list[header_idx][:]):
-        if 'id' in col.lower():
-            record_id = int(float(file_as_list[value_idx][idx]))
-        elif 'tz' in col.lower():
-            timezone = file_as_list[value_idx][idx]
-        elif 'to' in col.lower():
-            start_date_str = file_as_list[value_idx][idx]
-        elif 'from' in col.lower():
-            end_date_str = file_as_list[value_idx][idx]
-        elif 'hours' in col.lower():
-            sleep_duration = float(file_as_list[value_idx][idx])
-        elif 'snore' in col.lower():
-            snore = int(file_as_list[value_idx][idx])
-        elif 'noise' in col.lower():
-            noise = float(file_as_list[value_idx][idx])
-        elif 'cycles' in col.lower():
-            sleep_cycles = int(file_as_list[value_idx][idx])
-        elif 'deepsleep' in col.lower():
-            pct_deep_sleep = float(file_as_list[value_idx][idx])
-        elif 'len' in col.lower():
-            length_adjust = int(file_as_list[value_idx][idx])
-        elif 'geo' in col.lower():
-            geo_code = file_as_list[value_idx][idx]
-        elif 'comment' in col.lower():
-            if 'manually added' in file_as_list[value_idx][idx].lower():
-                warnings.warn('manual entry found, unable to parse '
-                              'sleep data')
-                return
-            else:
-                comment = file_as_list[value_idx][idx].split(' ')
-        elif col.isnumeric():
-            movment_data.append(col)
+    if 'comment' in columns:
+        if 'manually added' in values[columns['comment']].lower():
+            warnings.warn('manual entry found, unable to parse '
+                          'sleep data')
+            return
+    timezone = values[columns['tz']]
+    start_date_str = values[columns['from']]
+    end_date_str = values[columns['to']]
 
     start_date = pendulum.from_format(start_date_str, 'DD. MM. YYYY HH:mm',
                                       formatter='alternative', tz=timezone)
     end_date = pendulum.from_format(end_date_str, 'DD. MM. YYYY HH:mm',
                                     formatter='alternative', tz=timezone)
+    actigraphy, actigraphy_minutes = parse_sleepasandroid_actigraphy(header, values,
+                                                                     schema)
+
     # Parse Events
-    light_sleep = []
-    deep_sleep = []
-    rem_sleep = []
-    noise = []
-    alarm = []
-    hr_zone = []
-    hr = []
-    awake = []
+    events = decode_sleepasandroid_events(values[schema.event_columns])
     record_start_ms = 0
     record_end_ms = 0
-    found_record_start = False
-    for idx in range(len(file_as_list[header_idx][:])):
-        event_idx = header_idx + 1
-        if 'event' in file_as_list[header_idx][idx].lower():
-            event = file_as_list[event_idx][idx].split('-')
-            event_time = int(event[1])
-            event_name = event[0]
-            if not found_record_start:
-                record_time_ms = event_time
-                found_record_start = True
-
-            if event_time > record_end_ms:
-                record_end_ms = event_time
-
-            if 'LIGHT' in event_name:
-                light_sleep.append(event)
-            elif 'AWAKE' in event_name:
-                awake.append(event)
-            elif 'DEEP' in event_name:
-                deep_sleep.append(event)
-            elif 'HR_' in event_name:
-                hr_zone.append(event)
-            elif 'HR' in event_name:
-                hr.append(event)
-            elif 'HR' in event_name:
-                hr.append(event)
-            elif 'REM' in event_name:
-                rem_sleep.append(event)
-            elif 'TALK' in event_name or 'SNORING' in event_name:
-                noise.append(event)
-            elif 'ALARM' in event_name:
-                alarm.append(event)
-            elif 'USER' in event_name or 'BROKEN' in event_name:
-                pass
-            else:
-                warnings.warn("unrecognized event: {0}".format(event))
-
-    if not light_sleep:
-        light_sleep = None
-    if not deep_sleep:
-        deep_sleep = None
-    if not rem_sleep:
-        rem_sleep = None
-    if not awake:
-        awake = None
-    if not hr_zone:
-        hr_zone = None
-    if not hr:
-        hr = None
-    if not noise:
-        noise = None
-    if not alarm:
-        alarm = None
+    if len(events):
+        record_start_ms = int(events['timestamp_ms'][0])
+        record_end_ms = int(events['timestamp_ms'].max())
+    (light_sleep, deep_sleep, rem_sleep, awake, hr, hr_zone, noise,
+     alarm) = _group_events(events)
 
     split_record = SplitRecord(start_datetime=start_date,
                                end_datetime=end_date,
@@ -149,9 +281,75 @@ def split_sleepasandroid_record(file_as_list, header_idx):
                                deep_sleep=deep_sleep, rem_sleep=rem_sleep,
                                alarms=alarm, noise_events=noise,
                                awake=awake, heart_rate=hr, hr_zone=hr_zone,
-                               timezone=timezone)
+                               timezone=timezone,
+                               actigraphy=actigraphy,
+                               actigraphy_minutes=actigraphy_minutes)
     return split_record
 
+
+def parse_sleepasandroid_actigraphy(header_row, value_row, schema=None):
+    """
+    parse the 5 minute actigraphy (movement) columns of a record. The header
+    labels are the time of day of every value (e.g. `2:04`), they are
+    converted into minutes after the start of the record (the `From` column),
+    counting past midnight.
+
+    Parameters:
+        header_row (list): header row of the record
+        value_row (list): value row of the record
+        schema (namedtuple 'HeaderSchema'): optional, the already looked up
+            schema of `header_row`
+
+    Returns:
+        actigraphy (np.ndarray): float32 movement values, nan where empty
+        actigraphy_minutes (np.ndarray): int16 minutes after the record start
+    """
+    if schema is None:
+        schema = sleepasandroid_header_schema(header_row)
+    labels = header_row[schema.actigraphy_columns]
+    actigraphy = _to_float_array(value_row[schema.actigraphy_columns])
+    if not labels:
+        return actigraphy, np.empty(0, dtype=np.int16)
+
+    hour_minute = np.array(':'.join(labels).split(':'), dtype=np.int32).reshape(-1, 2)
+    minutes = hour_minute[:, 0] * 60 + hour_minute[:, 1]
+    # labels are times of day, add a day every time they wrap past midnight
+    wrapped = np.concatenate(([0], np.cumsum(np.diff(minutes) < 0)))
+    minutes = minutes + wrapped * 1440
+
+    start = _minute_of_day(value_row[schema.columns['from']])
+    first = (minutes[0] - start) % 1440
+    if not 0 <= first < 60:
+        # the labels are in another timezone than From / To (e.g. the phone
+        # changed timezone), align the last label with the end of the record
+        end = _minute_of_day(value_row[schema.columns['to']])
+        first = (end - start) % 1440 - (minutes[-1] - minutes[0])
+    return actigraphy, (minutes - minutes[0] + first).astype(np.int16)
+
+
+def _minute_of_day(date_str):
+    """
+    minute of the day of a `DD. MM. YYYY H:mm` SleepAsAndroid date
+    """
+    hour, minute = date_str.split(' ')[-1].split(':')
+    return int(hour) * 60 + int(minute)
+
+
+def _to_float_array(cells):
+    """
+    convert csv cells to a float32 array, empty or bad cells become nan
+    """
+    try:
+        return np.array(cells, dtype=np.float32)
+    except ValueError:
+        values = np.full(len(cells), np.nan, dtype=np.float32)
+        for idx, cell in enumerate(cells):
+            try:
+                values[idx] = float(cell)
+            except ValueError:
+                pass
+        return values
+
 sleepRecord = namedtuple('Sleep_Record', ['ncycles', 'cycle_start',
                                           'cycle_end', 'duration_mins',
                                           'stage', 'stage_code',
@@ -178,40 +376,30 @@ def parse_sleep_records(split_record, ls_int_code=2, ds_int_code=1,
     awake_record = _parse_event(split_record, 'awake')
 
     # Parse Sleep Cycle Record
-    dtype = [('event', np.object_), ('cycle_start', 'datetime64[s]'), ('cycle_end', 'datetime64[s]'),
-         ('duration_mins', int), ('event_id', int)]
-    total_cycles = ls_record.ncycles + ds_record.ncycles + awake_record.ncycles
-    combined_values = np.empty((total_cycles), dtype=dtype)
-    val_idx = 0
-    for idx in range(ls_record.ncycles):
-        combined_values[val_idx][0] = 'LightSleep'
-        combined_values[val_idx][1] = ls_record.cycle_start_time[idx].to_datetime_string()
-        combined_values[val_idx][2] = ls_record.cycle_end_time[idx].to_datetime_string()
-        combined_values[val_idx][3] = ls_record.cycle_duration[idx].in_minutes()
-        combined_values[val_idx][4] = ls_int_code
-        val_idx += 1
-    for idx in range(ds_record.ncycles):
-        combined_values[val_idx][0] = 'DeepSleep'
-        combined_values[val_idx][1] = ds_record.cycle_start_time[idx].to_datetime_string()
-        combined_values[val_idx][2] = ds_record.cycle_end_time[idx].to_datetime_string()
-        combined_values[val_idx][3] = ds_record.cycle_duration[idx].in_minutes()
-        combined_values[val_idx][4] = ds_int_code
-        val_idx += 1
-    for idx in range(awake_record.ncycles):
-        combined_values[val_idx][0] = 'Awake'
-        combined_values[val_idx][1] = awake_record.cycle_start_time[idx].to_datetime_string()
-        combined_values[val_idx][2] = awake_record.cycle_end_time[idx].to_datetime_string()
-        combined_values[val_idx][3] = awake_record.cycle_duration[idx].in_minutes()
-        combined_values[val_idx][4] = awake_int_code
-        val_idx += 1
-    sorted_records = np.sort(combined_values, order='cycle_start')
-
-    sleep_record = sleepRecord(ncycles=len(sorted_records),
-                               cycle_start=sorted_records['cycle_start'],
-                               cycle_end=sorted_records['cycle_end'],
-                               duration_mins=sorted_records['duration_mins'],
-                               stage=sorted_records['event'],
-                               stage_code=sorted_records['event_id'],
+    # stages are combined in alphabetical order so the stable sort on the
+    # start time breaks ties by stage name
+    stage_records = ((awake_record, 'Awake', awake_int_code),
+                     (ds_record, 'DeepSleep', ds_int_code),
+                     (ls_record, 'LightSleep', ls_int_code))
+    ncycles = [record.ncycles for record, _, _ in stage_records]
+    cycle_start = np.concatenate([record.cycle_start_time
+                                  for record, _, _ in stage_records]).astype('datetime64[s]')
+    cycle_end = np.concatenate([record.cycle_end_time
+                                for record, _, _ in stage_records]).astype('datetime64[s]')
+    duration_mins = np.concatenate([record.cycle_duration
+                                    for record, _, _ in stage_records]) // np.timedelta64(1, 'm')
+    stage = np.repeat(np.array([name for _, name, _ in stage_records], dtype=np.object_),
+                      ncycles)
+    stage_code = np.repeat(np.array([code for _, _, code in stage_records], dtype=int),
+                           ncycles)
+    order = np.argsort(cycle_start, kind='stable')
+
+    sleep_record = sleepRecord(ncycles=len(order),
+                               cycle_start=cycle_start[order],
+                               cycle_end=cycle_end[order],
+                               duration_mins=duration_mins[order].astype(int),
+                               stage=stage[order],
+                               stage_code=stage_code[order],
                                timezone=split_record.timezone)
 
     return sleep_record, ls_record, ds_record, awake_record
@@ -227,38 +415,52 @@ sleepStageRecord = namedtuple('sleepStageRecord', ['sleep_stage',
 def _parse_event(split_record_namedtuple, event):
     """
     parse a list of the different sleep events for one record and return the
-    lightSleep_Record namedtuple
+    lightSleep_Record namedtuple. Start and end events are paired up by
+    position, cycle times are local (wall clock) `datetime64[ms]` arrays and
+    durations are `timedelta64[ms]` arrays
 
     Parameters:
         split_record_namedtuple: A `SasA_SplitRecord` namedtuple instance
         event (str): acceptable events are `light_sleep`, `deep_sleep`, `awake`, `rem_sleep`
     """
-    timezone = split_record_namedtuple.start_datetime.timezone
-    start_time = []
-    end_time = []
-    cycle_duration = []
-    event_as_list = getattr(split_record_namedtuple, event)
-    nrecords = len(event_as_list)
-    ncycles = int(nrecords/2)
-    # Loop through and parse light sleep event record times
-    for idx in range(0, nrecords, 2):
-        start_java_timestamp = int(event_as_list[idx][1])
-        seconds = start_java_timestamp / 1000
-        sub_seconds = (start_java_timestamp % 1000.0) / 1000.0
-        cycle_starttime = pendulum.from_timestamp(seconds + sub_seconds,
-                                                  tz=timezone)
-
-        end_java_timestamp = int(event_as_list[idx+1][1])
-        seconds = end_java_timestamp / 1000
-        sub_seconds  = (end_java_timestamp % 1000.0) / 1000.0
-        cycle_endtime = pendulum.from_timestamp(seconds + sub_seconds,
-                                                tz=timezone)
-        start_time.append(cycle_starttime)
-        end_time.append(cycle_endtime)
-        cycle_duration.append(cycle_starttime.diff(cycle_endtime))
+    events = getattr(split_record_namedtuple, event)
+    if events is None:
+        timestamps_ms = np.empty(0, dtype=np.int64)
+    else:
+        timestamps_ms = events['timestamp_ms']
+    ncycles = len(timestamps_ms) // 2
+    start_ms = timestamps_ms[0:2 * ncycles:2]
+    end_ms = timestamps_ms[1:2 * ncycles:2]
+    timezone = split_record_namedtuple.timezone
     record = sleepStageRecord(sleep_stage=event,
-                              cycle_start_time=start_time,
-                              cycle_end_time=end_time,
-                              cycle_duration=cycle_duration,
+                              cycle_start_time=_local_datetime64(start_ms, timezone),
+                              cycle_end_time=_local_datetime64(end_ms, timezone),
+                              cycle_duration=(end_ms - start_ms).astype('timedelta64[ms]'),
                               ncycles=ncycles)
     return record
+
+
+def _local_datetime64(timestamps_ms, timezone):
+    """
+    convert java timestamps (ms since epoch) into local wall clock
+    `datetime64[ms]` values for the given timezone. The UTC offset is only
+    looked up per timestamp when it changes during the record (DST)
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+    if not len(timestamps_ms):
+        return timestamps_ms.astype('datetime64[ms]')
+    first_offset = _utc_offset_ms(timestamps_ms.min(), timezone)
+    last_offset = _utc_offset_ms(timestamps_ms.max(), timezone)
+    if first_offset == last_offset:
+        offsets = first_offset
+    else:
+        offsets = np.array([_utc_offset_ms(timestamp, timezone)
+                            for timestamp in timestamps_ms], dtype=np.int64)
+    return (timestamps_ms + offsets).astype('datetime64[ms]')
+
+
+def _utc_offset_ms(timestamp_ms, timezone):
+    """
+    UTC offset in ms of `timezone` at the java timestamp `timestamp_ms`
+    """
+    return pendulum.from_timestamp(int(timestamp_ms) / 1000.0, tz=timezone).offset * 1000
@@ -18,3 +18,4 @@ __version__ = '0.1dev'
 from .gui_interfaces import get_login_credentials
 from .Garmin import *
 from .SleepAsAndroid import *
+from .formats import *
@@ -0,0 +1,10 @@
+"""
+the :mod: `pyhealth.formats` module includes streaming readers for activity
+files (GPX, TCX, FIT) that return the recorded data as numpy arrays. They
+read the files on disk as well as the content downloaded with `ClientGarmin`
+"""
+
+from .reader_gpx import *
+from .reader_tcx import *
+from .reader_fit import *
+from .profile_fit import FIT_SPORTS, FIT_MESSAGES, FIT_FIELDS
@@ -0,0 +1,201 @@
+"""
+The part of the FIT profile (Garmin FIT SDK `Profile.xlsx`) the FIT reader
+decodes: message names, and for the activity messages their field names,
+scale, offset and units. Messages and fields missing from here are still
+decoded, as `message_<number>` / `field_<number>` with their raw values.
+"""
+
+# seconds between the unix epoch and the FIT epoch (1989-12-31T00:00:00 UTC)
+FIT_EPOCH_S = 631065600
+
+# base type number: (numpy type code, invalid value). Strings are handled
+# separately, their invalid value is an empty string
+FIT_BASE_TYPES = {0x00: ('u1', 0xFF),                  # enum
+                  0x01: ('i1', 0x7F),                  # sint8
+                  0x02: ('u1', 0xFF),                  # uint8
+                  0x03: ('i2', 0x7FFF),                # sint16
+                  0x04: ('u2', 0xFFFF),                # uint16
+                  0x05: ('i4', 0x7FFFFFFF),            # sint32
+                  0x06: ('u4', 0xFFFFFFFF),            # uint32
+                  0x07: ('S', b''),                    # string
+                  0x08: ('f4', None),                  # float32, invalid is nan
+                  0x09: ('f8', None),                  # float64, invalid is nan
+                  0x0A: ('u1', 0x00),                  # uint8z
+                  0x0B: ('u2', 0x0000),                # uint16z
+                  0x0C: ('u4', 0x00000000),            # uint32z
+                  0x0D: ('u1', 0xFF),                  # byte
+                  0x0E: ('i8', 0x7FFFFFFFFFFFFFFF),    # sint64
+                  0x0F: ('u8', 0xFFFFFFFFFFFFFFFF),    # uint64
+                  0x10: ('u8', 0x0000000000000000)}    # uint64z
+
+# base types whose values are codes or raw bytes rather than quantities
+FIT_RAW_BASE_TYPES = (0x00, 0x07, 0x0D)
+
+# units of the fields converted to datetime64 and to degrees
+DATE_TIME = 'date_time'
+SEMICIRCLES = 'semicircles'
+
+FIT_MESSAGES = {0: 'file_id', 1: 'capabilities', 2: 'device_settings', 3: 'user_profile',
+                4: 'hrm_profile', 5: 'sdm_profile', 6: 'bike_profile', 7: 'zones_target',
+                8: 'hr_zone', 9: 'power_zone', 10: 'met_zone', 12: 'sport', 15: 'goal',
+                18: 'session', 19: 'lap', 20: 'record', 21: 'event', 23: 'device_info',
+                26: 'workout', 27: 'workout_step', 28: 'schedule', 30: 'weight_scale',
+                31: 'course', 32: 'course_point', 33: 'totals', 34: 'activity', 35: 'software',
+                37: 'file_capabilities', 38: 'mesg_capabilities', 39: 'field_capabilities',
+                49: 'file_creator', 51: 'blood_pressure', 53: 'speed_zone', 55: 'monitoring',
+                72: 'training_file', 78: 'hrv', 101: 'length', 103: 'monitoring_info',
+                105: 'pad', 106: 'slave_device', 127: 'connectivity', 128: 'weather_conditions',
+                129: 'weather_alert', 131: 'cadence_zone', 132: 'hr', 142: 'segment_lap',
+                145: 'memo_glob', 148: 'segment_id', 149: 'segment_leaderboard_entry',
+                150: 'segment_point', 151: 'segment_file', 158: 'workout_session',
+                160: 'gps_metadata', 161: 'camera_event', 162: 'timestamp_correlation',
+                164: 'gyroscope_data', 165: 'accelerometer_data', 167: 'three_d_sensor_calibration',
+                169: 'video_frame', 174: 'obdii_data', 177: 'nmea_sentence', 178: 'aviation_attitude',
+                184: 'video', 185: 'video_title', 186: 'video_description', 187: 'video_clip',
+                188: 'ohr_settings', 206: 'field_description', 207: 'developer_data_id',
+                208: 'magnetometer_data', 209: 'barometer_data', 210: 'one_d_sensor_calibration',
+                225: 'set', 227: 'stress_level', 258: 'dive_settings', 259: 'dive_gas',
+                262: 'dive_alarm', 264: 'exercise_title', 268: 'dive_summary', 285: 'jump'}
+
+# sport enum of the sport, session and lap messages
+FIT_SPORTS = ('generic', 'running', 'cycling', 'transition', 'fitness_equipment', 'swimming',
+              'basketball', 'soccer', 'tennis', 'american_football', 'training', 'walking',
+              'cross_country_skiing', 'alpine_skiing', 'snowboarding', 'rowing', 'mountaineering',
+              'hiking', 'multisport', 'paddling', 'flying', 'e_biking', 'motorcycling', 'boating',
+              'driving', 'golf', 'hang_gliding', 'horseback_riding', 'hunting', 'fishing',
+              'inline_skating', 'rock_climbing', 'sailing', 'ice_skating', 'sky_diving',
+              'snowshoeing', 'snowmobiling', 'stand_up_paddleboarding', 'surfing', 'wakeboarding',
+              'water_skiing', 'kayaking', 'rafting', 'windsurfing', 'kitesurfing', 'tactical',
+              'jumpmaster', 'boxing', 'floor_climbing')
+
+
+def _field(name, scale=1, offset=0, units=None):
+    return (name, scale, offset, units)
+
+
+# fields every message may have
+_COMMON_FIELDS = {253: _field('timestamp', units=DATE_TIME),
+                  254: _field('message_index'),
+                  250: _field('part_index')}
+
+# global message number: {field number: (name, scale, offset, units)}, the
+# decoded value is raw / scale - offset
+FIT_FIELDS = {
+    0: {0: _field('type'), 1: _field('manufacturer'), 2: _field('product'), 3: _field('serial_number'),
+        4: _field('time_created', units=DATE_TIME), 5: _field('number'), 8: _field('product_name')},
+    12: {0: _field('sport'), 1: _field('sub_sport'), 3: _field('name')},
+    18: {0: _field('event'), 1: _field('event_type'), 2: _field('start_time', units=DATE_TIME),
+         3: _field('start_position_lat', units=SEMICIRCLES),
+         4: _field('start_position_long', units=SEMICIRCLES),
+         5: _field('sport'), 6: _field('sub_sport'),
+         7: _field('total_elapsed_time', 1000, units='s'), 8: _field('total_timer_time', 1000, units='s'),
+         9: _field('total_distance', 100, units='m'), 10: _field('total_cycles', units='cycles'),
+         11: _field('total_calories', units='kcal'), 13: _field('total_fat_calories', units='kcal'),
+         14: _field('avg_speed', 1000, units='m/s'), 15: _field('max_speed', 1000, units='m/s'),
+         16: _field('avg_heart_rate', units='bpm'), 17: _field('max_heart_rate', units='bpm'),
+         18: _field('avg_cadence', units='rpm'), 19: _field('max_cadence', units='rpm'),
+         20: _field('avg_power', units='watts'), 21: _field('max_power', units='watts'),
+         22: _field('total_ascent', units='m'), 23: _field('total_descent', units='m'),
+         24: _field('total_training_effect', 10), 25: _field('first_lap_index'), 26: _field('num_laps'),
+         27: _field('event_group'), 28: _field('trigger'),
+         29: _field('nec_lat', units=SEMICIRCLES), 30: _field('nec_long', units=SEMICIRCLES),
+         31: _field('swc_lat', units=SEMICIRCLES), 32: _field('swc_long', units=SEMICIRCLES),
+         34: _field('normalized_power', units='watts'), 35: _field('training_stress_score', 10),
+         36: _field('intensity_factor', 1000), 37: _field('left_right_balance'),
+         41: _field('avg_stroke_count', 10), 42: _field('avg_stroke_distance', 100, units='m'),
+         43: _field('swim_stroke'), 44: _field('pool_length', 100, units='m'), 46: _field('pool_length_unit'),
+         47: _field('num_active_lengths'), 48: _field('total_work', units='J'),
+         49: _field('avg_altitude', 5, 500, units='m'), 50: _field('max_altitude', 5, 500, units='m'),
+         57: _field('avg_temperature', units='C'), 58: _field('max_temperature', units='C'),
+         64: _field('min_heart_rate', units='bpm'),
+         124: _field('enhanced_avg_speed', 1000, units='m/s'), 125: _field('enhanced_max_speed', 1000, units='m/s'),
+         126: _field('enhanced_avg_altitude', 5, 500, units='m'),
+         127: _field('enhanced_min_altitude', 5, 500, units='m'),
+         128: _field('enhanced_max_altitude', 5, 500, units='m')},
+    19: {0: _field('event'), 1: _field('event_type'), 2: _field('start_time', units=DATE_TIME),
+         3: _field('start_position_lat', units=SEMICIRCLES), 4: _field('start_position_long', units=SEMICIRCLES),
+         5: _field('end_position_lat', units=SEMICIRCLES), 6: _field('end_position_long', units=SEMICIRCLES),
+         7: _field('total_elapsed_time', 1000, units='s'), 8: _field('total_timer_time', 1000, units='s'),
+         9: _field('total_distance', 100, units='m'), 10: _field('total_cycles', units='cycles'),
+         11: _field('total_calories', units='kcal'), 12: _field('total_fat_calories', units='kcal'),
+         13: _field('avg_speed', 1000, units='m/s'), 14: _field('max_speed', 1000, units='m/s'),
+         15: _field('avg_heart_rate', units='bpm'), 16: _field('max_heart_rate', units='bpm'),
+         17: _field('avg_cadence', units='rpm'), 18: _field('max_cadence', units='rpm'),
+         19: _field('avg_power', units='watts'), 20: _field('max_power', units='watts'),
+         21: _field('total_ascent', units='m'), 22: _field('total_descent', units='m'),
+         23: _field('intensity'), 24: _field('lap_trigger'), 25: _field('sport'), 26: _field('event_group'),
+         32: _field('num_lengths'), 33: _field('normalized_power', units='watts'),
+         34: _field('left_right_balance'), 35: _field('first_length_index'),
+         37: _field('avg_stroke_distance', 100, units='m'), 38: _field('swim_stroke'), 39: _field('sub_sport'),
+         40: _field('num_active_lengths'), 41: _field('total_work', units='J'),
+         42: _field('avg_altitude', 5, 500, units='m'), 43: _field('max_altitude', 5, 500, units='m'),
+         110: _field('enhanced_avg_speed', 1000, units='m/s'), 111: _field('enhanced_max_speed', 1000, units='m/s'),
+         112: _field('enhanced_avg_altitude', 5, 500, units='m'),
+         113: _field('enhanced_min_altitude', 5, 500, units='m'),
+         114: _field('enhanced_max_altitude', 5, 500, units='m')},
+    20: {0: _field('position_lat', units=SEMICIRCLES), 1: _field('position_long', units=SEMICIRCLES),
+         2: _field('altitude', 5, 500, units='m'), 3: _field('heart_rate', units='bpm'),
+         4: _field('cadence', units='rpm'), 5: _field('distance', 100, units='m'),
+         6: _field('speed', 1000, units='m/s'), 7: _field('power', units='watts'),
+         8: _field('compressed_speed_distance'), 9: _field('grade', 100, units='%'),
+         10: _field('resistance'), 11: _field('time_from_course', 1000, units='s'),
+         12: _field('cycle_length', 100, units='m'), 13: _field('temperature', units='C'),
+         17: _field('speed_1s', 16, units='m/s'), 18: _field('cycles', units='cycles'),
+         19: _field('total_cycles', units='cycles'), 28: _field('compressed_accumulated_power', units='watts'),
+         29: _field('accumulated_power', units='watts'), 30: _field('left_right_balance'),
+         31: _field('gps_accuracy', units='m'), 32: _field('vertical_speed', 1000, units='m/s'),
+         33: _field('calories', units='kcal'), 39: _field('vertical_oscillation', 10, units='mm'),
+         40: _field('stance_time_percent', 100, units='%'), 41: _field('stance_time', 10, units='ms'),
+         42: _field('activity_type'), 43: _field('left_torque_effectiveness', 2, units='%'),
+         44: _field('right_torque_effectiveness', 2, units='%'),
+         45: _field('left_pedal_smoothness', 2, units='%'), 46: _field('right_pedal_smoothness', 2, units='%'),
+         47: _field('combined_pedal_smoothness', 2, units='%'), 48: _field('time128', 128, units='s'),
+         49: _field('stroke_type'), 50: _field('zone'), 51: _field('ball_speed', 100, units='m/s'),
+         52: _field('cadence256', 256, units='rpm'), 53: _field('fractional_cadence', 128, units='rpm'),
+         62: _field('device_index'), 73: _field('enhanced_speed', 1000, units='m/s'),
+         78: _field('enhanced_altitude', 5, 500, units='m'), 81: _field('battery_soc', 2, units='%'),
+         82: _field('motor_power', units='watts'), 83: _field('vertical_ratio', 100, units='%'),
+         84: _field('stance_time_balance', 100, units='%'), 85: _field('step_length', 10, units='mm')},
+    21: {0: _field('event'), 1: _field('event_type'), 2: _field('data16'), 3: _field('data'),
+         4: _field('event_group')},
+    23: {0: _field('device_index'), 1: _field('device_type'), 2: _field('manufacturer'),
+         3: _field('serial_number'), 4: _field('product'), 5: _field('software_version', 100),
+         6: _field('hardware_version'), 7: _field('cum_operating_time', units='s'),
+         10: _field('battery_voltage', 256, units='V'), 11: _field('battery_status'),
+         18: _field('sensor_position'), 19: _field('descriptor'), 25: _field('source_type'),
+         27: _field('product_name')},
+    34: {0: _field('total_timer_time', 1000, units='s'), 1: _field('num_sessions'), 2: _field('type'),
+         3: _field('event'), 4: _field('event_type'), 5: _field('local_timestamp', units=DATE_TIME),
+         6: _field('event_group')},
+    49: {0: _field('software_version'), 1: _field('hardware_version')},
+    78: {0: _field('time', 1000, units='s')},
+    101: {0: _field('event'), 1: _field('event_type'), 2: _field('start_time', units=DATE_TIME),
+          3: _field('total_elapsed_time', 1000, units='s'), 4: _field('total_timer_time', 1000, units='s'),
+          5: _field('total_strokes', units='strokes'), 6: _field('avg_speed', 1000, units='m/s'),
+          7: _field('swim_stroke'), 9: _field('avg_swimming_cadence', units='strokes/min'),
+          10: _field('event_group'), 11: _field('total_calories', units='kcal'), 12: _field('length_type')},
+    206: {0: _field('developer_data_index'), 1: _field('field_definition_number'),
+          2: _field('fit_base_type_id'), 3: _field('field_name'), 4: _field('array'),
+          5: _field('components'), 6: _field('scale'), 7: _field('offset'), 8: _field('units'),
+          9: _field('bits'), 10: _field('accumulate'), 13: _field('fit_base_unit_id'),
+          14: _field('native_mesg_num'), 15: _field('native_field_num')},
+    207: {0: _field('developer_id'), 1: _field('application_id'), 2: _field('manufacturer_id'),
+          3: _field('developer_data_index'), 4: _field('application_version')},
+}
+
+
+def fit_field(global_number, field_number):
+    """
+    (name, scale, offset, units) of a field, `field_<number>` with no
+    scaling for fields missing from the profile
+    """
+    fields = FIT_FIELDS.get(global_number, {})
+    if field_number in fields:
+        return fields[field_number]
+    if field_number in _COMMON_FIELDS:
+        return _COMMON_FIELDS[field_number]
+    return (f'field_{field_number}', 1, 0, None)
+
+
+def fit_message_name(global_number):
+    return FIT_MESSAGES.get(global_number, f'message_{global_number}')
@@ -0,0 +1,512 @@
+"""
+FIT (Garmin's binary activity format) decoder. The file is scanned once,
+record header by record header, to parse every definition message and note
+where the data messages of each definition are. The data messages are then
+decoded in bulk: a structured dtype is built per definition and applied with
+`numpy.frombuffer` over the file's memoryview or mmap (a zero-copy view when
+the messages of a definition are contiguous, one gather otherwise), so no
+Python object is made per field or per message.
+"""
+import mmap
+import os
+import struct
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .profile_fit import (FIT_EPOCH_S, FIT_BASE_TYPES, FIT_RAW_BASE_TYPES, DATE_TIME, SEMICIRCLES,
+                          fit_field, fit_message_name)
+
+FitFile = namedtuple('FitFile', ['messages', 'developer_fields', 'session_offsets'])
+FitFile.__doc__ = """a decoded FIT file
+
+    messages (dict): message name (e.g. `record`, `lap`, `session`,
+        `message_<number>` for messages missing from the profile) to a
+        structured array of all the messages of that type in file order
+    developer_fields (dict): (developer_data_index, field_number) to
+        namedtuple 'FitDeveloperField' for the developer fields described in
+        the file, their values are fields of the messages they were recorded
+        in, named `name`
+    session_offsets (np.ndarray): int64 array of len(sessions) + 1 offsets,
+        the records of session `idx` (e.g. the swim, bike and run of a
+        triathlon) are `records[session_offsets[idx]:session_offsets[idx + 1]]`.
+        None if the file has no sessions or records
+"""
+
+FitDeveloperField = namedtuple('FitDeveloperField', ['name', 'developer_data_index', 'field_number',
+                                                     'base_type', 'scale', 'offset', 'units',
+                                                     'native_message', 'native_field'])
+
+_FILE_HEADER = struct.Struct('<BBHI4s')
+
+
+def read_fit(fit_file, raw=False):
+    """
+    decode a FIT file, e.g. the `get_activity_fit` download of an activity
+
+    Parameters:
+        fit_file (str, path, bytes, or binary stream): path to the file
+            (mapped with mmap rather than read), its content or an open
+            binary stream
+        raw (bool): return the stored values: integers with the FIT invalid
+            values, times in seconds since 1989-12-31 and positions in
+            semicircles. The messages of a type sharing one definition are
+            then zero-copy views of the file. By default the fields with
+            units or a scale are converted to floats (invalid values become
+            nan, positions degrees) and times to UTC datetime64[s], codes
+            (sport, event, manufacturer...) and unknown fields stay raw
+
+    Returns:
+        fit (namedtuple 'FitFile'): messages, developer_fields and
+            session_offsets
+
+    Examples:
+
+    >>> fit = read_fit('sample_data/multi-sport-with-heartrate.fit')
+    >>> records, sessions = fit.messages['record'], fit.messages['session']
+    >>> for session, start, end in zip(sessions, fit.session_offsets[:-1], fit.session_offsets[1:]):
+    >>>     print(FIT_SPORTS[session['sport']], np.nanmean(records['heart_rate'][start:end]))
+    """
+    buffer = _fit_buffer(fit_file)
+    definitions = _scan_fit(buffer)
+    data = np.frombuffer(buffer, dtype=np.uint8)
+
+    # the developer fields are described by field_description messages,
+    # which have to be decoded before the messages holding developer fields
+    developer_fields = {}
+    for definition in definitions:
+        if definition.global_number == 206 and definition.offsets:
+            records, fields = _decode_records(definition, data, {})
+            developer_fields.update(_developer_fields(records))
+
+    groups = {}
+    anchors = []
+    for definition in definitions:
+        if not definition.offsets:
+            continue
+        records, fields = _decode_records(definition, data, developer_fields)
+        positions = np.array(definition.offsets, dtype=np.int64)
+        if 'timestamp' in records.dtype.names:
+            anchors.append((positions, records['timestamp']))
+        groups.setdefault(definition.global_number, []).append((definition, positions, records, fields))
+
+    compressed_times = _compressed_timestamps(definitions, anchors)
+
+    messages = {}
+    for global_number, message_groups in groups.items():
+        messages[fit_message_name(global_number)] = _merge_groups(message_groups, compressed_times, raw)
+
+    return FitFile(messages, developer_fields, _session_offsets(messages))
+
+
+def read_fit_files(fit_files, raw=False, workers=None):
+    """
+    decode several FIT files (e.g. a year of activities) with a process pool
+
+    Parameters:
+        fit_files (list of str or path): FIT files
+        raw (bool): see `read_fit`
+        workers (int): number of worker processes, defaults to the number of
+            CPUs. `workers=1` decodes in the calling process
+
+    Returns:
+        fits (list of namedtuple 'FitFile'): in the order of `fit_files`
+    """
+    fit_files = list(fit_files)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(fit_files))
+
+    if workers <= 1:
+        return [read_fit(fit_file, raw) for fit_file in fit_files]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_fit, fit_files, [raw] * len(fit_files),
+                                 chunksize=max(1, len(fit_files) // (4 * workers))))
+
+
+def _fit_buffer(fit_file):
+    """
+    a buffer over the FIT file: a read only mmap for paths, else the content
+    """
+    if isinstance(fit_file, (bytes, bytearray, memoryview)):
+        return fit_file
+    if isinstance(fit_file, (str, os.PathLike)):
+        with open(os.path.expanduser(fit_file), 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b''
+            # the map stays valid after the file is closed, the arrays
+            # viewing it keep it alive
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return fit_file.read()
+
+
+class _Definition():
+    """a definition message and the positions of its data messages"""
+
+    def __init__(self, global_number, big_endian, fields, developer_fields):
+        """Initialize _Definition class"""
+
+        self.global_number = global_number
+        self.big_endian = big_endian
+        self.fields = fields
+        self.developer_fields = developer_fields
+        self.length = 1 + sum(size for _, size, _ in fields) + sum(size for _, size, _ in developer_fields)
+        self.offsets = []
+        # (position, time offset) of the messages with a compressed
+        # timestamp header
+        self.compressed = []
+
+
+def _scan_fit(buffer):
+    """
+    walk the record headers of a FIT file (and of the FIT files chained
+    after it) and return the definitions with the positions of their data
+    messages. Repeated identical definitions share one `_Definition`
+    """
+    definitions = {}
+    size = len(buffer)
+    start = 0
+    while start + _FILE_HEADER.size <= size:
+        header_size, _, _, data_size, signature = _FILE_HEADER.unpack_from(buffer, start)
+        if signature != b'.FIT':
+            if start == 0:
+                raise ValueError("not a FIT file, the header has no .FIT signature")
+            warnings.warn(f"ignoring {size - start} bytes after the end of the FIT file")
+            break
+        end = start + header_size + data_size
+        if data_size == 0 or end > size:
+            # still being recorded or truncated, read what's there
+            end = size
+        _scan_messages(buffer, start + header_size, end, definitions)
+        # skip the 2 byte crc
+        start = end + 2
+    return list(definitions.values())
+
+
+def _scan_messages(buffer, pos, end, definitions):
+    # per local message type: the definition, its message length and the
+    # `append` of its positions, looked up once per data message
+    local = [None] * 16
+    lengths = [0] * 16
+    appends = [None] * 16
+    while pos < end:
+        header = buffer[pos]
+        if header < 0x40:
+            # normal data message, local type in bits 0-3
+            local_type = header & 0x0F
+            if appends[local_type] is None:
+                raise ValueError(f"FIT data message at byte {pos} has no definition")
+            appends[local_type](pos)
+            pos += lengths[local_type]
+        elif header & 0x80:
+            # compressed timestamp header: local type in bits 5-6, time
+            # offset in bits 0-4
+            local_type = (header >> 5) & 0x03
+            if local[local_type] is None:
+                raise ValueError(f"FIT data message at byte {pos} has no definition")
+            local[local_type].compressed.append((pos, header & 0x1F))
+            appends[local_type](pos)
+            pos += lengths[local_type]
+        else:
+            local_type = header & 0x0F
+            definition_end, definition = _read_definition(buffer, pos, header, definitions, end)
+            if definition is None:
+                # the file ends inside this definition, nothing was recorded
+                # for it
+                warnings.warn(f"truncated FIT file, ignoring the last {end - pos} bytes")
+                return
+            pos = definition_end
+            local[local_type] = definition
+            lengths[local_type] = definition.length
+            appends[local_type] = definition.offsets.append
+    if pos > end:
+        # the last data message is cut off (a cut definition returned above),
+        # `local_type` is still its type
+        warnings.warn(f"truncated FIT file, ignoring the last {end - (pos - lengths[local_type])} bytes")
+        truncated = local[local_type]
+        truncated.offsets.pop()
+        if truncated.compressed and truncated.compressed[-1][0] == pos - lengths[local_type]:
+            truncated.compressed.pop()
+
+
+def _read_definition(buffer, pos, header, definitions, end):
+    """
+    read the definition message at `pos`, returns the position after it and
+    its `_Definition`, or (end, None) if it runs past `end`
+    """
+    if pos + 6 > end:
+        return end, None
+    big_endian = buffer[pos + 2] == 1
+    global_number, = struct.unpack_from('>H' if big_endian else '<H', buffer, pos + 3)
+    n_fields = buffer[pos + 5]
+    field_bytes = bytes(buffer[pos + 6:pos + 6 + 3 * n_fields])
+    pos += 6 + 3 * n_fields
+    developer_bytes = b''
+    if header & 0x20:
+        if pos + 1 > end:
+            return end, None
+        n_developer_fields = buffer[pos]
+        developer_bytes = bytes(buffer[pos + 1:pos + 1 + 3 * n_developer_fields])
+        pos += 1 + 3 * n_developer_fields
+    if pos > end:
+        return end, None
+    key = (global_number, big_endian, field_bytes, developer_bytes)
+    if key not in definitions:
+        definitions[key] = _Definition(global_number, big_endian, _triplets(field_bytes),
+                                       _triplets(developer_bytes))
+    return pos, definitions[key]
+
+
+def _triplets(field_bytes):
+    return [tuple(field_bytes[idx:idx + 3]) for idx in range(0, len(field_bytes), 3)]
+
+
+def _decode_records(definition, data, developer_fields):
+    """
+    return the data messages of a definition as a structured array (a view
+    of the file when they are contiguous) and its fields' (name, base type,
+    scale, offset, units)
+    """
+    dtype, fields = _record_dtype(definition, developer_fields)
+    positions = definition.offsets
+    n_messages = len(positions)
+    if positions[-1] - positions[0] == (n_messages - 1) * definition.length:
+        return np.frombuffer(data, dtype=dtype, count=n_messages, offset=positions[0]), fields
+    windows = np.lib.stride_tricks.sliding_window_view(data, definition.length)
+    return windows[np.array(positions, dtype=np.int64)].reshape(-1).view(dtype), fields
+
+
+def _record_dtype(definition, developer_fields):
+    endian = '>' if definition.big_endian else '<'
+    names, formats, offsets, fields = [], [], [], []
+    position = 1
+    for field_number, size, base_type in definition.fields:
+        name, scale, offset, units = fit_field(definition.global_number, field_number)
+        field_format, base_type = _field_format(endian, base_type & 0x1F, size)
+        names.append(name)
+        formats.append(field_format)
+        offsets.append(position)
+        fields.append((name, base_type, scale, offset, units))
+        position += size
+    for field_number, size, developer_data_index in definition.developer_fields:
+        described = developer_fields.get((developer_data_index, field_number))
+        if described is None:
+            name, base_type, scale, offset, units = (f'developer_{developer_data_index}_{field_number}',
+                                                     0x0D, 1, 0, None)
+        else:
+            name, base_type, scale, offset, units = (described.name, described.base_type, described.scale,
+                                                     described.offset, described.units)
+        field_format, base_type = _field_format(endian, base_type, size)
+        names.append(name)
+        formats.append(field_format)
+        offsets.append(position)
+        fields.append((name, base_type, scale, offset, units))
+        position += size
+
+    # a field appearing twice in a definition (e.g. a developer field named
+    # like a native one) keeps both values
+    seen = {}
+    for idx, name in enumerate(names):
+        if name in seen:
+            seen[name] += 1
+            names[idx] = f'{name}_{seen[name]}'
+            fields[idx] = (names[idx],) + fields[idx][1:]
+        else:
+            seen[name] = 0
+    dtype = np.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                      'itemsize': definition.length})
+    return dtype, fields
+
+
+def _field_format(endian, base_type, size):
+    """
+    numpy format of a field: the base type, an array of it when the field
+    holds several values, raw bytes when its size doesn't fit the base type
+    """
+    code, _ = FIT_BASE_TYPES.get(base_type, ('u1', 0xFF))
+    if base_type not in FIT_BASE_TYPES:
+        base_type = 0x0D
+    if code == 'S':
+        return f'S{size}', base_type
+    item_size = int(code[1])
+    if size == item_size:
+        return endian + code, base_type
+    if size % item_size == 0:
+        return (endian + code, (size // item_size,)), base_type
+    return ('u1', (size,)), 0x0D
+
+
+def _developer_fields(records):
+    """
+    the developer fields described by field_description messages
+    """
+    def column(name, default):
+        return records[name] if name in records.dtype.names else [default] * len(records)
+
+    described = {}
+    for (developer_data_index, field_number, base_type, name, scale, offset, units, native_message,
+         native_field) in zip(column('developer_data_index', 0), column('field_definition_number', 0),
+                              column('fit_base_type_id', 0x0D), column('field_name', b''),
+                              column('scale', 0xFF), column('offset', 0x7F), column('units', b''),
+                              column('native_mesg_num', 0xFFFF), column('native_field_num', 0xFF)):
+        developer_data_index, field_number = int(developer_data_index), int(field_number)
+        name = _text(name) or f'developer_{developer_data_index}_{field_number}'
+        described[(developer_data_index, field_number)] = FitDeveloperField(
+            name, developer_data_index, field_number, int(base_type) & 0x1F,
+            1 if scale in (0, 0xFF) else int(scale), 0 if offset == 0x7F else int(offset),
+            _text(units) or None, None if native_message == 0xFFFF else fit_message_name(int(native_message)),
+            None if native_field == 0xFF else int(native_field))
+    return described
+
+
+def _text(value):
+    if isinstance(value, np.ndarray):
+        value = value.tobytes()
+    return bytes(value).split(b'\0', 1)[0].decode('utf-8', errors='replace').strip()
+
+
+def _compressed_timestamps(definitions, anchors):
+    """
+    resolve the compressed timestamp headers: each holds the 5 low bits of
+    its timestamp, relative to the last timestamp before it in the file
+
+    Returns:
+        times (dict): position of the message to its raw timestamp
+    """
+    compressed = [entry for definition in definitions for entry in definition.compressed]
+    if not compressed:
+        return {}
+    compressed.sort()
+    if anchors:
+        anchor_positions = np.concatenate([positions for positions, _ in anchors])
+        anchor_times = np.concatenate([times.astype(np.int64) for _, times in anchors])
+        order = np.argsort(anchor_positions, kind='stable')
+        anchor_positions, anchor_times = anchor_positions[order], anchor_times[order]
+    else:
+        anchor_positions = anchor_times = np.empty(0, dtype=np.int64)
+
+    times = {}
+    last_time = None
+    last_position = -1
+    for position, time_offset in compressed:
+        idx = np.searchsorted(anchor_positions, position) - 1
+        if idx >= 0 and anchor_positions[idx] > last_position:
+            last_time = int(anchor_times[idx])
+        if last_time is None:
+            continue
+        last_time += (time_offset - last_time) & 0x1F
+        last_position = position
+        times[position] = last_time
+    return times
+
+
+def _merge_groups(message_groups, compressed_times, raw):
+    """
+    one structured array of the messages of one type, in file order, from
+    the messages of each of its definitions
+    """
+    columns_list = []
+    for definition, positions, records, fields in message_groups:
+        columns = {}
+        for name, base_type, scale, offset, units in fields:
+            values = records[name]
+            columns[name] = values if raw else _convert(values, base_type, scale, offset, units)
+        if definition.compressed and 'timestamp' not in columns:
+            timestamps = np.array([compressed_times.get(position, 0xFFFFFFFF) for position in positions],
+                                  dtype=np.uint32)
+            columns['timestamp'] = timestamps if raw else _convert(timestamps, 0x06, 1, 0, DATE_TIME)
+        columns_list.append(columns)
+
+    if len(message_groups) == 1 and raw and not message_groups[0][0].compressed:
+        # the messages as they are in the file
+        return message_groups[0][2]
+
+    field_dtypes = {}
+    fills = {}
+    for (_, _, _, fields), columns in zip(message_groups, columns_list):
+        base_types = {name: base_type for name, base_type, _, _, _ in fields}
+        for name, values in columns.items():
+            field_dtype = np.dtype((values.dtype, values.shape[1:])) if values.ndim > 1 else values.dtype
+            if name not in field_dtypes:
+                field_dtypes[name] = field_dtype
+                fills[name] = _fill_value(values.dtype, base_types.get(name, 0x06))
+            elif field_dtypes[name] != field_dtype:
+                field_dtypes[name] = _promote(field_dtypes[name], field_dtype)
+
+    all_positions = np.concatenate([positions for _, positions, _, _ in message_groups])
+    if len(message_groups) == 1:
+        rows = np.arange(len(all_positions))
+    else:
+        order = np.argsort(all_positions, kind='stable')
+        rows = np.empty_like(order)
+        rows[order] = np.arange(len(order))
+    merged = np.empty(len(all_positions), dtype=[(name, field_dtype) for name, field_dtype in field_dtypes.items()])
+    for name in field_dtypes:
+        merged[name] = fills[name]
+    start = 0
+    for (_, group_positions, _, _), columns in zip(message_groups, columns_list):
+        group_rows = rows[start:start + len(group_positions)]
+        start += len(group_positions)
+        for name, values in columns.items():
+            if values.ndim < merged[name].ndim:
+                merged[name][group_rows, 0] = values
+            elif values.ndim > 1 and values.shape[1] < merged[name].shape[1]:
+                merged[name][group_rows, :values.shape[1]] = values
+            else:
+                merged[name][group_rows] = values
+    return merged
+
+
+def _convert(values, base_type, scale, offset, units):
+    """
+    the value of a field: times as datetime64[s], quantities (fields with
+    units or a scale) as floats with nan for invalid values, raw otherwise
+    """
+    code, invalid = FIT_BASE_TYPES[base_type]
+    if units == DATE_TIME and code == 'u4':
+        times = (values.astype(np.int64) + FIT_EPOCH_S).astype('datetime64[s]')
+        times[values == invalid] = np.datetime64('NaT')
+        return times
+    if base_type in FIT_RAW_BASE_TYPES or (units is None and scale == 1 and offset == 0):
+        return values
+    if units == SEMICIRCLES:
+        scale = 2 ** 31 / 180
+    converted = values.astype(np.float64 if values.dtype.itemsize >= 4 else np.float32)
+    if invalid is not None:
+        converted[values == invalid] = np.nan
+    if scale != 1:
+        converted /= scale
+    if offset:
+        converted -= offset
+    return converted
+
+
+def _fill_value(dtype, base_type):
+    """
+    value of the rows missing a field, messages of other definitions
+    """
+    if dtype.kind == 'f':
+        return np.nan
+    if dtype.kind == 'M':
+        return np.datetime64('NaT')
+    if dtype.kind == 'S':
+        return b''
+    invalid = FIT_BASE_TYPES.get(base_type, ('u1', 0xFF))[1]
+    return invalid if invalid is not None and np.can_cast(np.min_scalar_type(invalid), dtype) else 0
+
+
+def _promote(first, second):
+    base = np.promote_types(first.base, second.base)
+    shape = max(first.shape, second.shape)
+    return np.dtype((base, shape)) if shape else base
+
+
+def _session_offsets(messages):
+    records = messages.get('record')
+    sessions = messages.get('session')
+    if records is None or sessions is None:
+        return None
+    if 'timestamp' not in records.dtype.names or 'start_time' not in sessions.dtype.names:
+        return None
+    starts = np.searchsorted(records['timestamp'], sessions['start_time'])
+    return np.append(starts, len(records)).astype(np.int64)
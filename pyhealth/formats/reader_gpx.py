@@ -0,0 +1,149 @@
+"""
+Streaming GPX reader. The file is parsed with `iterparse` and every track
+point element is cleared as soon as its values are stored, so the xml tree
+never grows past one point and memory only holds the output columns. Each
+track comes out as one structured array of its points with a segment offset
+index, so a track segment is an array slice.
+"""
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+import numpy as np
+from .utils_formats import open_source, local_name, to_float, PointColumns
+
+# one row per track point, missing values are nan (NaT for the time)
+GPX_POINT_DTYPE = np.dtype([('lat', np.float64), ('lon', np.float64), ('ele', np.float32),
+                            ('time', 'datetime64[ms]'), ('hr', np.float32), ('cad', np.float32)])
+
+GpxTrack = namedtuple('GpxTrack', ['name', 'type', 'points', 'segment_offsets'])
+GpxTrack.__doc__ = """one `<trk>` of a GPX file
+
+    name (str): track name, None if it has none
+    type (str): track type (e.g. `running`), None if it has none
+    points (np.ndarray): structured array of `GPX_POINT_DTYPE`
+    segment_offsets (np.ndarray): int64 array of n segments + 1 offsets,
+        the points of segment `idx` are
+        `points[segment_offsets[idx]:segment_offsets[idx + 1]]`
+"""
+
+# extension elements holding the heart rate and cadence, Garmin's
+# TrackPointExtension v1 / v2 use `hr` and `cad`, other writers `cadence`
+_HR_TAGS = ('hr', 'heartrate')
+_CAD_TAGS = ('cad', 'cadence')
+
+
+def read_gpx(gpx_file):
+    """
+    read all the tracks of a GPX file
+
+    Parameters:
+        gpx_file (str, bytes, path, or binary stream): see `iter_gpx_tracks`
+
+    Returns:
+        tracks (list of namedtuple 'GpxTrack')
+
+    Examples:
+
+    >>> tracks = read_gpx('sample_data/multi-actId_wHR.gpx')
+    >>> points = tracks[0].points
+    >>> points['hr'].mean(), points['time'][-1] - points['time'][0]
+    """
+    return list(iter_gpx_tracks(gpx_file))
+
+
+def iter_gpx_tracks(gpx_file):
+    """
+    lazily read a GPX file one track at a time. Only the track being read
+    is held in memory, as flat columns rather than xml elements
+
+    Parameters:
+        gpx_file (str, bytes, path, or binary stream): path to the file, its
+            content (e.g. `ClientGarmin.get_activity_gpx`) or an open binary
+            stream
+
+    Yields:
+        track (namedtuple 'GpxTrack'): name, type, points (structured array
+            of lat, lon, ele, time as UTC datetime64[ms], hr, cad) and
+            segment_offsets
+
+    Examples:
+
+    >>> for track in iter_gpx_tracks(client.get_activity_gpx(activity_id)):
+    >>>     print(track.name, len(track.points))
+    """
+    stream, close = open_source(gpx_file)
+    try:
+        yield from _iter_tracks(stream)
+    finally:
+        if close:
+            stream.close()
+
+
+def _iter_tracks(stream):
+    root = None
+    depth = 0
+    track = None
+    segment = None
+    point = None
+    local_names = {}
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        tag = local_names.get(elem.tag)
+        if tag is None:
+            tag = local_names[elem.tag] = local_name(elem.tag)
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = elem
+            elif tag == 'trk':
+                track = _TrackColumns()
+            elif track is None:
+                continue
+            elif tag == 'trkseg':
+                segment = elem
+                track.segment_offsets.append(len(track.points))
+            elif tag == 'trkpt':
+                point = [float(elem.get('lat', 'nan')), float(elem.get('lon', 'nan')), np.nan, '', np.nan, np.nan]
+            continue
+
+        depth -= 1
+        if point is not None:
+            if tag == 'trkpt':
+                track.points.add(point)
+                point = None
+                # drop the point from its segment, the tree stays one point deep
+                if segment is not None:
+                    segment.clear()
+            elif tag == 'ele':
+                point[2] = to_float(elem.text)
+            elif tag == 'time':
+                point[3] = (elem.text or '').strip()
+            elif tag in _HR_TAGS:
+                point[4] = to_float(elem.text)
+            elif tag in _CAD_TAGS:
+                point[5] = to_float(elem.text)
+        elif track is not None:
+            if tag == 'trk':
+                yield track.to_track()
+                track = None
+            elif depth == 2 and tag in ('name', 'type'):
+                setattr(track, tag, (elem.text or '').strip() or None)
+        if depth == 1:
+            # a child of <gpx> (track, metadata, waypoint, route) is done
+            root.clear()
+
+
+class _TrackColumns():
+    """the track being read"""
+
+    def __init__(self):
+        """Initialize _TrackColumns class"""
+
+        self.name = None
+        self.type = None
+        self.points = PointColumns(GPX_POINT_DTYPE)
+        self.segment_offsets = []
+
+    def to_track(self):
+        points = self.points.to_array()
+        segment_offsets = np.array(self.segment_offsets + [len(points)], dtype=np.int64)
+        return GpxTrack(self.name, self.type, points, segment_offsets)
+
@@ -0,0 +1,198 @@
+"""
+Streaming TCX (Garmin Training Center) reader. Activities, laps and track
+points are read with `iterparse` and cleared once stored, the values of the
+`ActivityExtension/v2` TPX (track point) and LX (lap) extensions included.
+Each activity comes out as a structured array of laps and one of track points
+with a lap offset index, so the points of a lap are an array slice.
+"""
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+import numpy as np
+from .utils_formats import open_source, local_name, parse_utc_times, to_float, PointColumns
+
+# one row per track point, missing values are nan (NaT for the time).
+# `cad` is the Cadence of bike or the RunCadence (TPX) of run track points
+TCX_POINT_DTYPE = np.dtype([('time', 'datetime64[ms]'), ('lat', np.float64), ('lon', np.float64),
+                            ('alt', np.float32), ('distance', np.float64), ('hr', np.float32),
+                            ('cad', np.float32), ('speed', np.float32), ('watts', np.float32)])
+
+# one row per lap, `avg_speed` and the fields after it come from the LX
+# extension
+TCX_LAP_DTYPE = np.dtype([('start', 'datetime64[ms]'), ('total_time', np.float64),
+                          ('distance', np.float64), ('max_speed', np.float32), ('calories', np.float32),
+                          ('avg_hr', np.float32), ('max_hr', np.float32), ('cadence', np.float32),
+                          ('avg_speed', np.float32), ('avg_run_cadence', np.float32),
+                          ('max_run_cadence', np.float32), ('max_bike_cadence', np.float32),
+                          ('steps', np.float32), ('avg_watts', np.float32), ('max_watts', np.float32),
+                          ('intensity', 'U8'), ('trigger', 'U10')])
+
+TcxActivity = namedtuple('TcxActivity', ['sport', 'id', 'creator', 'laps', 'points', 'lap_offsets'])
+TcxActivity.__doc__ = """one `<Activity>` of a TCX file
+
+    sport (str): `Running`, `Biking` or `Other`
+    id (str): activity id, the start time for Garmin devices
+    creator (str): name of the recording device, None if unknown
+    laps (np.ndarray): structured array of `TCX_LAP_DTYPE`
+    points (np.ndarray): structured array of `TCX_POINT_DTYPE`
+    lap_offsets (np.ndarray): int64 array of len(laps) + 1 offsets, the
+        points of lap `idx` are `points[lap_offsets[idx]:lap_offsets[idx + 1]]`
+"""
+
+# track point value elements: index in TCX_POINT_DTYPE
+_POINT_FIELDS = {'LatitudeDegrees': 1, 'LongitudeDegrees': 2, 'AltitudeMeters': 3, 'DistanceMeters': 4,
+                 'Cadence': 6, 'RunCadence': 6, 'Speed': 7, 'Watts': 8}
+
+# lap value elements by parent element: index in TCX_LAP_DTYPE
+_LAP_FIELDS = {'Lap': {'TotalTimeSeconds': 1, 'DistanceMeters': 2, 'MaximumSpeed': 3, 'Calories': 4,
+                       'Cadence': 7, 'Intensity': 15, 'TriggerMethod': 16},
+               'AverageHeartRateBpm': {'Value': 5},
+               'MaximumHeartRateBpm': {'Value': 6},
+               'LX': {'AvgSpeed': 8, 'AvgRunCadence': 9, 'MaxRunCadence': 10, 'MaxBikeCadence': 11,
+                      'Steps': 12, 'AvgWatts': 13, 'MaxWatts': 14}}
+_LAP_TEXT_FIELDS = (15, 16)
+
+
+def read_tcx(tcx_file):
+    """
+    read all the activities of a TCX file
+
+    Parameters:
+        tcx_file (str, bytes, path, or binary stream): see
+            `iter_tcx_activities`
+
+    Returns:
+        activities (list of namedtuple 'TcxActivity')
+
+    Examples:
+
+    >>> activity = read_tcx('sample_data/sample_file.tcx')[0]
+    >>> for lap, start, end in zip(activity.laps, activity.lap_offsets[:-1], activity.lap_offsets[1:]):
+    >>>     print(lap['distance'], activity.points['speed'][start:end].mean())
+    """
+    return list(iter_tcx_activities(tcx_file))
+
+
+def iter_tcx_activities(tcx_file):
+    """
+    lazily read a TCX file one activity at a time. The sports of a
+    multi-sport session are separate activities (the transitions between
+    them are skipped)
+
+    Parameters:
+        tcx_file (str, bytes, path, or binary stream): path to the file, its
+            content (e.g. `ClientGarmin.get_activity_tcx`) or an open binary
+            stream
+
+    Yields:
+        activity (namedtuple 'TcxActivity'): sport, id, creator, laps, points
+            (time as UTC datetime64[ms], lat, lon, alt, distance, hr, cad,
+            speed, watts) and lap_offsets
+
+    Examples:
+
+    >>> tcx = client.get_activity_tcx(activity_id)
+    >>> for activity in iter_tcx_activities(tcx):
+    >>>     print(activity.sport, len(activity.laps), activity.points['hr'].max())
+    """
+    stream, close = open_source(tcx_file)
+    try:
+        yield from _iter_activities(stream)
+    finally:
+        if close:
+            stream.close()
+
+
+def _iter_activities(stream):
+    elements = []
+    tags = []
+    local_names = {}
+    activity = None
+    point = None
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        tag = local_names.get(elem.tag)
+        if tag is None:
+            tag = local_names[elem.tag] = local_name(elem.tag)
+        if event == 'start':
+            elements.append(elem)
+            tags.append(tag)
+            if tag == 'Activity':
+                activity = _ActivityColumns(elem.get('Sport'))
+            elif activity is None:
+                continue
+            elif tag == 'Lap':
+                activity.start_lap(elem.get('StartTime', ''))
+            elif tag == 'Trackpoint':
+                point = ['', np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan, np.nan]
+            continue
+
+        elements.pop()
+        tags.pop()
+        parent = tags[-1] if tags else None
+        if point is not None:
+            if tag == 'Trackpoint':
+                activity.points.add(point)
+                point = None
+                # drop the point from its track, the tree stays one point deep
+                del elements[-1][:]
+            elif tag == 'Time':
+                point[0] = (elem.text or '').strip()
+            elif tag == 'Value':
+                if parent == 'HeartRateBpm':
+                    point[5] = to_float(elem.text)
+            elif tag in _POINT_FIELDS:
+                point[_POINT_FIELDS[tag]] = to_float(elem.text)
+        elif activity is not None:
+            if tag == 'Activity':
+                yield activity.to_activity()
+                activity = None
+                del elements[-1][:]
+            elif tag == 'Lap':
+                del elements[-1][:]
+            elif parent in _LAP_FIELDS and activity.lap is not None:
+                index = _LAP_FIELDS[parent].get(tag)
+                if index in _LAP_TEXT_FIELDS:
+                    activity.lap[index] = (elem.text or '').strip()
+                elif index is not None:
+                    activity.lap[index] = to_float(elem.text)
+            elif tag == 'Id' and parent == 'Activity':
+                activity.id = (elem.text or '').strip()
+            elif tag == 'Name' and parent == 'Creator':
+                activity.creator = (elem.text or '').strip()
+        if 0 < len(elements) <= 2 or (tag == 'Trackpoint' and activity is None):
+            # a child of <TrainingCenterDatabase> or one level below (Courses
+            # and a Course, Folders, Author, Activities) or a course's track
+            # point is done, drop it so no part of the file stays attached to
+            # the root
+            del elements[-1][:]
+
+
+class _ActivityColumns():
+    """the activity being read"""
+
+    def __init__(self, sport):
+        """Initialize _ActivityColumns class"""
+
+        self.sport = sport
+        self.id = None
+        self.creator = None
+        self.laps = []
+        self.lap = None
+        self.lap_offsets = []
+        self.points = PointColumns(TCX_POINT_DTYPE)
+
+    def start_lap(self, start_time):
+        self.lap = [start_time] + [np.nan] * 14 + ['', '']
+        self.laps.append(self.lap)
+        self.lap_offsets.append(len(self.points))
+
+    def to_activity(self):
+        laps = np.empty(len(self.laps), dtype=TCX_LAP_DTYPE)
+        if self.laps:
+            columns = list(zip(*self.laps))
+            laps['start'] = parse_utc_times(columns[0])
+            for name, column in zip(TCX_LAP_DTYPE.names[1:], columns[1:]):
+                laps[name] = column
+        points = self.points.to_array()
+        lap_offsets = np.array(self.lap_offsets + [len(points)], dtype=np.int64)
+        return TcxActivity(self.sport, self.id, self.creator, laps, points, lap_offsets)
+
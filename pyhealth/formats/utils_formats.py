@@ -0,0 +1,125 @@
+"""
+Helpers shared by the activity file readers
+"""
+import array
+import datetime
+import io
+import os
+import numpy as np
+
+
+def open_source(source):
+    """
+    open an activity file given as a path, raw file content or an open
+    binary stream, so downloads can be parsed without writing them to disk
+
+    Parameters:
+        source (str, bytes, path, or binary stream): a file path, the file
+            content (`bytes`, or a `str` starting with `<` for xml formats)
+            or an already open binary stream
+
+    Returns:
+        (stream, close) (tuple): a binary stream and whether the caller
+            should close it
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source), True
+    if isinstance(source, str) and source.lstrip()[:1] == '<':
+        return io.BytesIO(source.encode('utf-8')), True
+    if isinstance(source, (str, os.PathLike)):
+        return open(os.path.expanduser(source), 'rb'), True
+    return source, False
+
+
+def local_name(tag):
+    """
+    the tag of an xml element without its namespace
+    """
+    return tag.rpartition('}')[2]
+
+
+def parse_utc_times(time_strings):
+    """
+    convert ISO 8601 timestamps to a UTC datetime64[ms] array, empty strings
+    become NaT. Timestamps in `Z` or without a timezone are converted in one
+    vectorized call, only the ones with a numeric offset are parsed one by
+    one
+    """
+    naive = []
+    for text in time_strings:
+        if text.endswith('Z'):
+            text = text[:-1]
+        elif text[-6:-5] in ('+', '-') and text[-3:-2] == ':':
+            text = datetime.datetime.fromisoformat(text).astimezone(datetime.timezone.utc)
+            text = text.replace(tzinfo=None).isoformat()
+        naive.append(text)
+    return np.array(naive, dtype='datetime64[ms]')
+
+
+
+def to_float(text):
+    """
+    float value of an element's text, nan if it's missing or not a number
+    """
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class PointColumns():
+    """Typed accumulators for a structured array of points, one value per
+    field in the dtype order. The columns are kept as `array('d')` (or
+    `array('q')` for `time`), and the `time` strings are converted to
+    datetime64[ms] in blocks rather than kept until the end, so memory is
+    bounded by the output arrays.
+
+    Parameters:
+        dtype (np.dtype): structured dtype of the points, numeric fields
+            plus an optional `time` datetime64[ms] field
+        time_block (int): number of time strings converted at once
+    """
+
+    def __init__(self, dtype, time_block=4096):
+        """Initialize PointColumns class"""
+
+        self.dtype = dtype
+        self.time_block = time_block
+        self._columns = [array.array('q' if name == 'time' else 'd') for name in dtype.names]
+        self._appends = [column.append for column in self._columns]
+        self._time_strings = []
+        self._time_index = dtype.names.index('time') if 'time' in dtype.names else None
+        if self._time_index is not None:
+            self._appends[self._time_index] = self._append_time
+        self.n_points = 0
+
+    def __len__(self):
+        return self.n_points
+
+    def add(self, values):
+        for append, value in zip(self._appends, values):
+            append(value)
+        self.n_points += 1
+
+    def _append_time(self, text):
+        self._time_strings.append(text)
+        if len(self._time_strings) >= self.time_block:
+            self._convert_times()
+
+    def _convert_times(self):
+        if self._time_strings:
+            times = parse_utc_times(self._time_strings)
+            self._columns[self._time_index].frombytes(times.view(np.int64).tobytes())
+            self._time_strings = []
+
+    def to_array(self):
+        """
+        the points as a structured array of `dtype`
+        """
+        if self._time_index is not None:
+            self._convert_times()
+        points = np.empty(self.n_points, dtype=self.dtype)
+        for name, column in zip(self.dtype.names, self._columns):
+            values = np.frombuffer(column, dtype=np.int64 if name == 'time' else np.float64)
+            points[name] = values.view('datetime64[ms]') if name == 'time' else values
+        return points
@@ -0,0 +1,23 @@
+"""
+File helpers shared by the data source modules
+"""
+import hashlib
+
+
+def file_digest(file_name, block_size=2**20):
+    """
+    blake2b hex digest of the contents of a file, read in blocks so large
+    files aren't loaded whole
+
+    Parameters:
+        file_name (str or path): the file to hash
+        block_size (int): bytes read at a time
+
+    Returns:
+        digest (str): hex digest
+    """
+    digest = hashlib.blake2b()
+    with open(file_name, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,25 @@
+"""
+Shared fixtures: a fake Garmin Connect server (benchmarks/fake_server_garmin.py)
+and a client logged in to it
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'benchmarks'))
+from fake_server_garmin import FakeGarminServer  # noqa: E402
+from pyhealth.Garmin import ClientGarmin  # noqa: E402
+
+
+@pytest.fixture
+def garmin_server():
+    with FakeGarminServer(n_activities=30, seed=0) as server:
+        yield server
+
+
+@pytest.fixture
+def garmin_client(garmin_server):
+    client = garmin_server.configure_client(ClientGarmin(credentials=('login', 'password', 'user')))
+    client.connect()
+    yield client
+    client.session.close()
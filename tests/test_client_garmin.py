@@ -0,0 +1,123 @@
+"""
+The Garmin client against the fake Garmin Connect server: incremental syncs
+fetch only the new activities, the activity index keeps the summaries fetched
+when one of them fails, and cached activity payloads and wellness days aren't
+downloaded again
+"""
+import os
+import pytest
+from pyhealth.Garmin import ActivityIndex, ClientGarmin
+
+
+def test_incremental_sync_fetches_new_activities(garmin_server, garmin_client):
+    activities = garmin_client.list_activities(batch_size=10)
+    assert [activity_id for activity_id, _ in activities] == garmin_server.activity_ids()
+
+    garmin_server.n_activities = 33
+    requests_before = garmin_server.stats['activity_list']
+    synced = garmin_client.list_activities(batch_size=10, sync='incremental')
+    # the first page already reaches the known activities
+    assert garmin_server.stats['activity_list'] == requests_before + 1
+    assert synced == garmin_client.list_activities(batch_size=10, force_reload=True)
+    assert [activity_id for activity_id, _ in synced] == garmin_server.activity_ids()
+
+
+def test_sync_new_activities_pages_until_known(garmin_server, garmin_client):
+    garmin_client.list_activities(batch_size=10)
+    assert garmin_client._sync_new_activities(10) == []
+
+    garmin_server.n_activities = 55
+    new_activities = garmin_client._sync_new_activities(10)
+    assert [activity_id for activity_id, _ in new_activities] == garmin_server.activity_ids()[:25]
+
+
+def test_incremental_sync_from_known_activities(garmin_server, garmin_client):
+    known = garmin_client.list_activities(batch_size=10)[5:]
+    synced = garmin_client.list_activities(batch_size=10, sync='incremental', known=known)
+    assert [activity_id for activity_id, _ in synced] == garmin_server.activity_ids()
+
+
+def test_update_activity_index(garmin_server, garmin_client):
+    index = ActivityIndex(':memory:')
+    assert garmin_client.update_activity_index(index, batch_size=10) == 30
+    assert [activity_id for activity_id, _ in index.activity_list()] == garmin_server.activity_ids()
+
+    garmin_server.n_activities = 32
+    requests_before = garmin_server.stats['activity_list']
+    assert garmin_client.update_activity_index(index, batch_size=10) == 2
+    assert garmin_server.stats['activity_list'] == requests_before + 1
+    assert garmin_client.activity_list == index.activity_list()
+
+
+def test_update_activity_index_summaries(garmin_server, garmin_client, monkeypatch):
+    index = ActivityIndex(':memory:')
+    garmin_client.update_activity_index(index, batch_size=10)
+    # an activity deleted on Garmin Connect, its summary is a 404
+    index.add_list_entries([{'activityId': 99, 'startTimeGMT': '2017-01-01 00:00:00'}])
+    failing_id = garmin_server.activity_ids()[3]
+    get_activity_summary = garmin_client.get_activity_summary
+
+    def flaky_summary(activity_id):
+        if activity_id == failing_id:
+            raise ConnectionError('connection reset')
+        return get_activity_summary(activity_id)
+    monkeypatch.setattr(garmin_client, 'get_activity_summary', flaky_summary)
+    with pytest.warns(UserWarning, match='activity 99'):
+        garmin_client.update_activity_index(index, batch_size=10, summaries=True)
+    # the failure doesn't lose the other summaries, the 404 isn't asked for
+    # again and only the failed summary is fetched again
+    assert index.missing_details() == [failing_id]
+    assert garmin_server.stats['summary'] == 30
+
+    monkeypatch.undo()
+    garmin_client.update_activity_index(index, batch_size=10, summaries=True)
+    assert index.missing_details() == []
+    assert garmin_server.stats['summary'] == 31
+
+
+def test_download_activities(tmp_path, garmin_server, garmin_client):
+    activity_ids = garmin_server.activity_ids()[:6] + [99]
+    with pytest.warns(UserWarning, match='activity 99'):
+        report = garmin_client.download_activities(activity_ids, formats=('summary', 'gpx'), workers=4,
+                                                   dest=tmp_path)
+    assert not report.errors
+    assert sorted(report.missing) == [(99, 'gpx'), (99, 'summary')]
+    assert len(report.downloaded) == 12
+    assert all(os.path.getsize(path) > 0 for path in report.downloaded.values())
+
+
+def test_activity_cache(tmp_path, garmin_server):
+    client = garmin_server.configure_client(ClientGarmin(cache_dir=tmp_path / 'cache',
+                                                         credentials=('login', 'password', 'user')))
+    client.connect()
+    activity_id = garmin_server.activity_ids()[0]
+    gpx = client.get_activity_gpx(activity_id)
+    assert client.get_activity_gpx(activity_id) == gpx
+    # the gpx export doesn't change once recorded, the summary can be edited
+    client.get_activity_summary(activity_id)
+    client.get_activity_summary(activity_id)
+    assert garmin_server.stats['export'] == 1
+    assert garmin_server.stats['summary'] == 2
+    client.session.close()
+
+    offline = ClientGarmin(cache_dir=tmp_path / 'cache', offline=True)
+    assert offline.get_activity_gpx(activity_id) == gpx
+    assert garmin_server.stats['export'] == 1
+
+
+def test_wellness_ranges_fetched_once(garmin_server, garmin_client):
+    july = garmin_client.get_wellness_summary_datespan('2018-07-01', '2018-07-31')
+    assert garmin_server.stats['wellness'] == 1
+    assert len(july['WELLNESS_TOTAL_STEPS']) == 31
+
+    # only the days of August are fetched
+    overlap = garmin_client.get_wellness_summary_datespan('2018-07-15', '2018-08-15')
+    assert garmin_server.stats['wellness'] == 2
+    steps = overlap['WELLNESS_TOTAL_STEPS']
+    assert [entry['calendarDate'] for entry in steps[:1] + steps[-1:]] == ['2018-07-15', '2018-08-15']
+    assert len(steps) == 32
+
+    both = garmin_client.get_wellness_summary_datespan('2018-07-01', '2018-08-15')
+    assert garmin_server.stats['wellness'] == 2
+    assert both == garmin_client.get_wellness_summary_datespan('2018-07-01', '2018-08-15', force_reload=True)
+    assert garmin_server.stats['wellness'] == 4
@@ -0,0 +1,113 @@
+"""
+Columnar SleepAsAndroid datasets: the flat event and actigraphy arrays hold
+the same nights as parsing the records one by one, and a backup that grew
+(nights appended at the end or added at the top) loaded incrementally gives
+the same dataset as parsing the whole file again
+"""
+import io
+import os
+import re
+import numpy as np
+import pytest
+from pyhealth.SleepAsAndroid import dataset_sleepasandroid, load_sleep_dataset, update_sleep_dataset
+
+SAMPLE_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data',
+                           'SleepAsAndroid_data.csv')
+
+# the sample backup has manually added records without sleep data
+pytestmark = pytest.mark.filterwarnings('ignore:skipped .* manually added records')
+
+
+def _sample_records():
+    with open(SAMPLE_FILE, 'rb') as file:
+        data = file.read()
+    starts = [0] + [match.start() + 1 for match in re.finditer(rb'\nId,', data)]
+    return [data[start:end] for start, end in zip(starts, starts[1:] + [len(data)])]
+
+
+def _assert_same_array(array, expected, name):
+    if expected.dtype.names:
+        for field in expected.dtype.names:
+            np.testing.assert_array_equal(array[field], expected[field], err_msg=f'{name}.{field}')
+    else:
+        np.testing.assert_array_equal(array, expected, err_msg=name)
+
+
+def _assert_same_dataset(dataset, expected):
+    assert len(dataset) == len(expected)
+    arrays = dataset.arrays()
+    for name, array in expected.arrays().items():
+        if name != 'source':
+            _assert_same_array(arrays[name], array, name)
+
+
+@pytest.fixture
+def records():
+    records = _sample_records()
+    assert len(records) >= 4
+    return records
+
+
+def _offsets_valid(offsets, values, n_nights):
+    return (len(offsets) == n_nights + 1 and offsets[0] == 0 and offsets[-1] == len(values)
+            and np.all(np.diff(offsets) >= 0))
+
+
+def test_columnar_layout(records):
+    dataset = load_sleep_dataset(SAMPLE_FILE)
+    assert np.all(np.diff(dataset.nights['start']) >= np.timedelta64(0, 'm'))
+    assert _offsets_valid(dataset.event_offsets, dataset.events, len(dataset))
+    assert _offsets_valid(dataset.actigraphy_offsets, dataset.actigraphy, len(dataset))
+
+    by_id = {night_id: idx for idx, night_id in enumerate(dataset.nights['id'].tolist())}
+    for record in records:
+        night = load_sleep_dataset(io.StringIO(record.decode('utf-8'), newline=''))
+        if not len(night):
+            # manually added record without sleep data
+            continue
+        idx = by_id[int(night.nights['id'][0])]
+        _assert_same_array(dataset.nights[idx:idx + 1], night.nights, 'nights')
+        _assert_same_array(dataset.night_events(idx), night.night_events(0), 'events')
+        np.testing.assert_array_equal(dataset.night_actigraphy(idx), night.night_actigraphy(0))
+        np.testing.assert_array_equal(dataset.night_actigraphy_minutes(idx), night.night_actigraphy_minutes(0))
+
+    # the events of a date range are the events of its nights
+    from_date = str(dataset.nights['start'][1])[:10]
+    nights = dataset.night_range(from_date)
+    _assert_same_array(dataset.events_between(from_date),
+                       np.concatenate([dataset.night_events(idx) for idx in range(nights.start, nights.stop)]),
+                       'events')
+
+
+@pytest.mark.parametrize('at_top', [False, True])
+def test_update_matches_full_parse(tmp_path, records, at_top):
+    saa_file = tmp_path / 'SleepAsAndroid_data.csv'
+    old, new = (records[2:], records[:2]) if at_top else (records[:-2], records[-2:])
+    saa_file.write_bytes(b''.join(old))
+    dataset = load_sleep_dataset(saa_file)
+
+    saa_file.write_bytes(b''.join(new + old if at_top else old + new))
+    updated = update_sleep_dataset(dataset, saa_file)
+    assert len(updated) > len(dataset)
+    _assert_same_dataset(updated, load_sleep_dataset(saa_file))
+    assert int(updated.source['offset'][0]) == os.path.getsize(saa_file)
+
+
+def _no_full_parse(saa_file):
+    raise AssertionError(f'{saa_file} was parsed again from the start')
+
+
+def test_cached_incremental_load(tmp_path, records, monkeypatch):
+    saa_file = tmp_path / 'SleepAsAndroid_data.csv'
+    cache_dir = tmp_path / 'cache'
+    saa_file.write_bytes(b''.join(records[:-1]))
+    old_nights = len(load_sleep_dataset(saa_file, cache_dir=cache_dir))
+
+    saa_file.write_bytes(b''.join(records))
+    with monkeypatch.context() as patch:
+        patch.setattr(dataset_sleepasandroid, '_load_file', _no_full_parse)
+        dataset = load_sleep_dataset(saa_file, cache_dir=cache_dir)
+    assert len(dataset) > old_nights
+    _assert_same_dataset(dataset, load_sleep_dataset(saa_file))
+    # the updated arrays were cached and are loaded as they are
+    _assert_same_dataset(load_sleep_dataset(saa_file, cache_dir=cache_dir), dataset)
@@ -0,0 +1,68 @@
+"""
+Upload ledger: files are deduplicated by content across batches, and a
+ledger file cut short by an interrupted write still loads
+"""
+import os
+import shutil
+from pyhealth.Garmin import UploadLedger
+from pyhealth.utils_files import file_digest
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'sample_data')
+SAMPLE_FILES = ('sample_file.tcx', 'Evening_run_noHR.gpx', 'sample_file_no_HR.gpx')
+
+
+def test_ledger_reload(tmp_path):
+    ledger_file = tmp_path / 'uploads.jsonl'
+    ledger = UploadLedger(ledger_file)
+    ledger.add('a' * 32, 1, 'first.fit')
+    ledger.add('b' * 32, 2, tmp_path / 'second.fit')
+
+    reloaded = UploadLedger(ledger_file)
+    assert len(reloaded) == 2
+    assert reloaded.get('a' * 32) == 1 and 'b' * 32 in reloaded
+    assert reloaded.get('c' * 32) is None
+
+
+def test_ledger_interrupted_write(tmp_path):
+    ledger_file = tmp_path / 'uploads.jsonl'
+    UploadLedger(ledger_file).add('a' * 32, 1)
+    with open(ledger_file, 'ab') as file:
+        file.write(b'{"digest": "' + b'b' * 10)
+
+    ledger = UploadLedger(ledger_file)
+    assert len(ledger) == 1
+    # the next entry starts on a new line instead of extending the cut one
+    ledger.add('c' * 32, 3)
+    with open(ledger_file, 'ab') as file:
+        file.write(b'\xff not json\n[]\n')
+    reloaded = UploadLedger(ledger_file)
+    assert len(reloaded) == 2 and reloaded.get('c' * 32) == 3
+
+
+def test_in_memory_ledger():
+    ledger = UploadLedger()
+    ledger.add('a' * 32, 1)
+    assert ledger.get('a' * 32) == 1 and len(ledger) == 1
+
+
+def test_upload_batches_deduplicated(tmp_path, garmin_server, garmin_client):
+    sample_dir = tmp_path / 'samples'
+    sample_dir.mkdir()
+    paths = []
+    for file_name in SAMPLE_FILES:
+        paths.append(shutil.copy(os.path.join(SAMPLE_DIR, file_name), sample_dir))
+    # the same content under another name is uploaded once
+    paths.append(shutil.copy(paths[0], sample_dir / 'copy.tcx'))
+    ledger_file = tmp_path / 'uploads.jsonl'
+
+    report = garmin_client.upload_activities(paths, ledger_file=ledger_file)
+    assert not report.errors
+    assert len(report.uploaded) == 3 and garmin_server.stats['upload'] == 3
+    assert report.skipped == {paths[-1]: report.uploaded[paths[0]]}
+
+    report = garmin_client.upload_activities(paths[::-1], ledger_file=ledger_file)
+    assert not report.uploaded and not report.errors
+    assert garmin_server.stats['upload'] == 3
+    ledger = UploadLedger(ledger_file)
+    assert len(ledger) == 3
+    assert all(report.skipped[path] == ledger.get(file_digest(path)) for path in paths)
@@ -0,0 +1,77 @@
+"""
+Truncated FIT files: a file cut anywhere, inside a data or a definition
+message, reads the complete messages before the cut with a warning
+"""
+import struct
+import warnings
+import pytest
+from pyhealth.formats import read_fit
+
+# 2018-09-13 in FIT seconds
+FIT_TIME = 905000000
+
+
+def _definition(local_type, global_number, fields, developer_fields=()):
+    header = 0x40 | local_type | (0x20 if developer_fields else 0)
+    message = bytes([header, 0, 0]) + struct.pack('<H', global_number) + bytes([len(fields)])
+    message += b''.join(bytes(field) for field in fields)
+    if developer_fields:
+        message += bytes([len(developer_fields)]) + b''.join(bytes(field) for field in developer_fields)
+    return message
+
+
+def _fit_file(body):
+    return struct.pack('<BBHI4sH', 14, 16, 2100, len(body), b'.FIT', 0) + body + b'\0\0'
+
+
+def _records(local_type, n_records, start=0):
+    return b''.join(bytes([local_type]) + struct.pack('<IB', FIT_TIME + start + idx, 100 + idx)
+                    for idx in range(n_records))
+
+
+RECORD_FIELDS = [(253, 4, 0x86), (3, 1, 2)]
+SESSION_FIELDS = [(253, 4, 0x86), (2, 4, 0x86), (5, 1, 0)]
+
+
+def _read_truncated(data):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        fit = read_fit(data)
+    assert any('truncated' in str(warning.message) for warning in caught)
+    return fit
+
+
+@pytest.mark.parametrize('developer_fields', [(), ((0, 2, 0),)])
+def test_truncated_inside_definition(developer_fields):
+    head = _definition(0, 20, RECORD_FIELDS) + _records(0, 3)
+    # the session definition is new, the redefinition of local type 0 reuses it
+    definition = _definition(0, 18, SESSION_FIELDS, developer_fields)
+    data = _fit_file(head + definition)[:-2]
+    for cut in range(1, len(definition)):
+        fit = _read_truncated(data[:len(data) - len(definition) + cut])
+        assert list(fit.messages['record']['heart_rate']) == [100, 101, 102]
+        assert 'session' not in fit.messages
+
+
+def test_truncated_inside_data_message_after_redefinition():
+    body = _definition(0, 20, RECORD_FIELDS) + _records(0, 2)
+    body += _definition(1, 18, SESSION_FIELDS) + _definition(0, 20, RECORD_FIELDS) + _records(0, 2, start=2)
+    data = _fit_file(body)[:-2]
+    fit = _read_truncated(data[:-3])
+    assert list(fit.messages['record']['heart_rate']) == [100, 101, 100]
+
+
+def test_truncated_anywhere():
+    body = _definition(0, 20, RECORD_FIELDS) + _records(0, 4)
+    body += _definition(1, 18, SESSION_FIELDS) + bytes([1]) + struct.pack('<IIB', FIT_TIME + 9, FIT_TIME, 1)
+    body += _definition(2, 20, RECORD_FIELDS, ((0, 2, 0),))
+    data = _fit_file(body)
+    complete = read_fit(data)
+    assert len(complete.messages['record']) == 4
+    for size in range(15, len(data) - 2):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            fit = read_fit(data[:size])
+        records = fit.messages.get('record')
+        n_records = 0 if records is None else len(records)
+        assert n_records == min(4, max(0, (size - 14 - 12) // 6))
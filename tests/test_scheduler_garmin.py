@@ -0,0 +1,104 @@
+"""
+Retry rules of the Garmin request scheduler: idempotent requests (GET) are
+retried after a 5xx, a 429 or a connection error, non-idempotent ones (POST)
+only after a 429 or when the connection couldn't be made
+"""
+import socket
+import pytest
+import requests
+from pyhealth.Garmin.scheduler_garmin import RequestScheduler, retry_delay
+
+
+class _Response():
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.url = 'https://connect.garmin.com/test'
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _sender(*outcomes):
+    """
+    a `send` callable that returns (or raises) `outcomes` in order, and the
+    list of the responses it returned
+    """
+    outcomes = iter(outcomes)
+    sent = []
+
+    def send():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            sent.append(outcome)
+            raise outcome
+        sent.append(_Response(outcome))
+        return sent[-1]
+    return send, sent
+
+
+@pytest.fixture
+def scheduler():
+    return RequestScheduler(max_retries=3, backoff_base=0.001)
+
+
+@pytest.mark.parametrize('method, status, attempts', [('GET', 503, 2),
+                                                      ('GET', 429, 2),
+                                                      ('POST', 503, 1),
+                                                      ('POST', 500, 1),
+                                                      ('POST', 429, 2),
+                                                      ('GET', 404, 1)])
+def test_retry_by_method_and_status(scheduler, method, status, attempts):
+    send, sent = _sender(status, 200)
+    response = scheduler.run(send, method=method)
+    assert len(sent) == attempts
+    assert response.retries == attempts - 1
+    assert response.status_code == (200 if attempts > 1 else status)
+    # retried responses are closed, the returned one is not
+    assert all(response.closed for response in sent[:-1])
+    assert not sent[-1].closed
+
+
+def test_last_response_returned_after_max_retries(scheduler):
+    send, sent = _sender(*[503] * 4)
+    response = scheduler.run(send, method='GET')
+    assert len(sent) == 4
+    assert response.status_code == 503 and response.retries == 3
+
+
+@pytest.mark.parametrize('method, attempts', [('GET', 2), ('POST', 1)])
+def test_read_timeout_retried_only_when_idempotent(scheduler, method, attempts):
+    send, sent = _sender(requests.ReadTimeout('read timed out'), 200)
+    if attempts == 1:
+        with pytest.raises(requests.ReadTimeout):
+            scheduler.run(send, method=method)
+    else:
+        assert scheduler.run(send, method=method).status_code == 200
+    assert len(sent) == attempts
+
+
+def _closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_refused_post_retried(scheduler):
+    url = f'http://127.0.0.1:{_closed_port()}/upload'
+    rewinds = []
+    attempts = []
+
+    def send():
+        attempts.append(url)
+        return requests.post(url, data=b'activity', timeout=5)
+    with pytest.raises(requests.ConnectionError):
+        scheduler.run(send, rewind=lambda: rewinds.append(1), method='POST')
+    assert len(attempts) == 4
+    assert len(rewinds) == 3
+
+
+def test_retry_after_is_a_lower_bound():
+    response = _Response(429, {'Retry-After': '2'})
+    assert retry_delay(0, 'POST', response=response) >= 2
+    assert retry_delay(5, 'POST', response=response, max_retries=5) is None